@@ -1,4 +1,3 @@
-
 from langchain_community.document_loaders import BSHTMLLoader
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.document_loaders import UnstructuredWordDocumentLoader
@@ -6,28 +5,123 @@ from langchain_community.document_loaders import UnstructuredPowerPointLoader
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import NoTranscriptFound
 import PyPDF2
+import pypdf
+import gc
+import os
+import re
+import shutil
+import time
+import requests
 from goose3 import Goose
 import tempfile
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+import tracing
+from ooxml import FAST_PATHS, OOXML_ERRORS, STREAMING_FAST_PATHS
+from text_normalize import normalize_pages
+
+YOUTUBE_VIDEO_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})")
+YOUTUBE_PLAYLIST_ID = re.compile(r"[?&]list=([\w-]+)")
+
+# Memory budget of the extraction (MB): larger uploads are streamed page by page (see AutoLoaderDocument.iter_text)
+EXTRACT_MEMORY_MB = int(os.getenv("FLASHCARD_EXTRACT_MEMORY_MB", "64"))
+# Bytes copied at a time to the temporary file of the LangChain loaders
+COPY_BUFFER_SIZE = 1024 * 1024
+# Share of EXTRACT_MEMORY_MB the objects cached by a pypdf reader may take before it is dropped
+PDF_READER_MEMORY_SHARE = 0.25
+
+
+def is_youtube_url(url):
+    return "youtube.com" in url or "youtu.be" in url
+
+
+def is_youtube_playlist(url):
+    return is_youtube_url(url) and ("/playlist" in url or (YOUTUBE_PLAYLIST_ID.search(url) and not YOUTUBE_VIDEO_ID.search(url)))
+
 
 class Website:
-    def __init__(self, search):
+    def __init__(self, search, cache=None):
+        """
+        Parameters
+        ----------
+        search : str
+            URL of the webpage
+        cache : url_cache.UrlCache
+            Optional cache of fetched pages. Without it goose3 downloads the page itself.
+        """
         self.search = search
+        self.cache = cache
     
     def extract_text(self):
         g = Goose()
-        article = g.extract(self.search)
+        try:
+            if self.cache is not None:
+                article = g.extract(raw_html=self.cache.fetch(self.search))
+            else:
+                article = g.extract(self.search)
+        finally:
+            g.close()
         self.text = article.cleaned_text
         return self.text
 
 class Youtube:
-    def __init__(self, search):
+    def __init__(self, search, cache=None, languages=('en',)):
+        """
+        Parameters
+        ----------
+        search : str
+            URL (watch, youtu.be, shorts or embed) or id of the video
+        cache : url_cache.UrlCache
+            Optional cache of transcripts
+        languages : tuple
+            Transcript languages, in order of preference
+        """
         self.search = search
-        
+        self.cache = cache
+        self.languages = list(languages)
+        match = YOUTUBE_VIDEO_ID.search(search)
+        self.video_id = match.group(1) if match else search.strip()
+
+    def get_segments(self):
+        """
+        Returns the transcript as a list of segments ({'text', 'start', 'duration'}).
+        """
+        def download():
+            return YouTubeTranscriptApi.get_transcript(self.video_id, languages=self.languages)
+
+        if self.cache is not None:
+            self.segments = self.cache.memoize(f"youtube-transcript:{self.video_id}:{','.join(self.languages)}", download)
+        else:
+            self.segments = download()
+        return self.segments
+
     def extract_text(self):
-        self.text = YouTubeTranscriptApi.get_transcript(self.video_id, languages=['en'])
+        self.text = " ".join(segment['text'] for segment in self.get_segments())
         return self.text
 
+class YoutubePlaylist:
+    def __init__(self, search, cache=None):
+        """
+        Parameters
+        ----------
+        search : str
+            URL of the playlist (containing list=...)
+        cache : url_cache.UrlCache
+            Optional cache of fetched pages
+        """
+        self.search = search
+        self.cache = cache
+        match = YOUTUBE_PLAYLIST_ID.search(search)
+        self.playlist_id = match.group(1) if match else search.strip()
+
+    def video_urls(self):
+        """
+        Returns the URLs of the videos of the playlist, in playlist order.
+        """
+        url = f"https://www.youtube.com/playlist?list={self.playlist_id}"
+        html = self.cache.fetch(url) if self.cache is not None else requests.get(url, timeout=30).text
+        video_ids = dict.fromkeys(re.findall(r'"videoId":"([\w-]{11})"', html))
+        return [f"https://www.youtube.com/watch?v={video_id}" for video_id in video_ids]
+
 class Pdf:
     def __init__(self, documents_input=None):
         self.documents_input = documents_input
@@ -41,6 +135,33 @@ class Pdf:
                 text += page.extract_text()
             return text
 
+def iter_pdf_pages(file):
+    """
+    Yields the text of every page of a PDF (binary file object), in page order.
+
+    The file is read in place. A PdfReader keeps every object it parses (fonts, images,
+    content streams) until it is dropped, so the pages are read by windows, with a new
+    reader for each window. The window holds about PDF_READER_MEMORY_SHARE of the memory
+    budget, estimated from the average size of a page in the file: memory does not grow
+    with the page count, and PDFs of light pages are read with a single reader.
+    """
+    size = file.seek(0, 2)
+    budget = EXTRACT_MEMORY_MB * 1024 * 1024 * PDF_READER_MEMORY_SHARE
+    start, window = 0, None
+    while True:
+        pages = pypdf.PdfReader(file).pages
+        if window is None:
+            window = max(1, int(budget * len(pages) / max(size, 1)))
+        for index in range(start, min(start + window, len(pages))):
+            yield pages[index].extract_text()
+        start += window
+        if start >= len(pages):
+            return
+        # The pages and their reader reference each other: free them before the next window
+        del pages
+        gc.collect()
+
+
 class AutoLoaderDocument:
     def __init__(self, search = '', document=None, huge_file=False):
         """
@@ -67,12 +188,125 @@ class AutoLoaderDocument:
             'pptx': UnstructuredPowerPointLoader
         }
     
+    def document_size(self):
+        """
+        Returns the size of the uploaded document in bytes.
+        """
+        position = self.document.tell()
+        size = self.document.seek(0, 2)
+        self.document.seek(position)
+        return size
+
+    def is_huge(self):
+        """
+        Checks if the document is bigger than the memory budget of the extraction (EXTRACT_MEMORY_MB),
+        in which case it should be read with iter_text instead of extract_text.
+        """
+        return self.document is not None and self.document_size() > EXTRACT_MEMORY_MB * 1024 * 1024
+
+    def _copy_to_tempfile(self):
+        """
+        Copies the document to a temporary file, COPY_BUFFER_SIZE bytes at a time.
+        Returns the path of the file and the size of the document in bytes.
+        """
+        with tracing.span('extract.tempfile_write') as write_span:
+            with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+                shutil.copyfileobj(self.document, tmp_file, COPY_BUFFER_SIZE)
+                size = tmp_file.tell()
+                self.document_name = tmp_file.name
+            write_span.set(bytes=size)
+        return tmp_file.name, size
+
+    def _load_with_langchain(self, loader_class):
+        """
+        Copies the document to a temporary file and loads it with loader_class.
+        Returns the texts of the loaded documents (the pages of a PDF) and the size of the document in bytes.
+        """
+        # Save uploaded file to a temporary file
+        tmp_file_path, content_length = self._copy_to_tempfile()
+        try:
+            with tracing.span('extract.load', loader=loader_class.__name__) as load_span:
+                doc = loader_class(tmp_file_path).load()
+                load_span.set(documents=len(doc))
+        finally:
+            os.remove(tmp_file_path)
+        if self.huge_file:
+            with tracing.span('extract.split') as split_span:
+                text_splitter = RecursiveCharacterTextSplitter(chunk_size=4000, chunk_overlap=400)
+                doc = text_splitter.split_documents(doc)
+                split_span.set(chunks=len(doc))
+        return [document.page_content for document in doc], content_length
+
+    def _iter_pieces(self, extension, loader_class):
+        """
+        Yields the raw text of the document piece by piece, with the streaming counterpart of
+        the loader used by extract_text.
+        """
+        if extension == 'pdf':
+            yield from iter_pdf_pages(self.document)
+            return
+
+        if extension in STREAMING_FAST_PATHS:
+            pieces = STREAMING_FAST_PATHS[extension](self.document)
+            try:
+                # Errors of a file that is not an OOXML package are raised before the first piece
+                first = next(pieces, None)
+            except OOXML_ERRORS:
+                self.document.seek(0)
+            else:
+                if first is not None:
+                    yield first
+                    yield from pieces
+                return
+
+        tmp_file_path, _ = self._copy_to_tempfile()
+        try:
+            for document in loader_class(tmp_file_path).lazy_load():
+                yield document.page_content
+        finally:
+            os.remove(tmp_file_path)
+
+    def iter_text(self):
+        """
+        Extracts the text of the document as a stream of pieces: the pages of a PDF, the
+        paragraphs of a docx, the slides of a pptx and the documents of the other loaders.
+
+        Unlike extract_text, the whole text is never held in memory: PDFs are read in place,
+        page by page, and the other formats go through their loader's lazy_load. Pieces are
+        normalized like the text of extract_text and meant for generation.iter_chunks.
+        If the document is None, raise ValueError.
+        If the document is of unsupported type, raise ValueError.
+        """
+        if self.document is None:
+            raise ValueError('No document file provided.')
+        extension = self.document.name.split('.')[-1]
+        if extension not in self.loaders:
+            raise ValueError('Unsupported file format.')
+
+        self.document.seek(0)
+        # Running headers and footers are only looked for across the pages of a PDF
+        pieces = normalize_pages(self._iter_pieces(extension, self.loaders[extension]), remove_headers=extension == 'pdf')
+        # The consumer runs between the pieces: the extraction is timed piece by piece instead of in a span
+        elapsed, chars = 0.0, 0
+        while True:
+            start = time.perf_counter()
+            text = next(pieces, None)
+            elapsed += time.perf_counter() - start
+            if text is None:
+                break
+            chars += len(text)
+            yield text
+        tracing.observe('extract_stream_seconds', elapsed)
+        tracing.increment('extract_bytes_read_total', self.document_size())
+        tracing.increment('extract_chars_total', chars)
+
     def extract_text(self):
         """
         Extract text from the document.
 
         If the document is uploaded, extract text from it directly.
         If the document is huge, split it into chunks of 4000 characters with an overlap of 400 characters.
+        The text is normalized (NFKC, hyphenation, whitespace, PDF headers and footers, see text_normalize.py).
         If the document is None, raise ValueError.
         If the document is of unsupported type, raise ValueError.
         Otherwise, return the extracted text as a string.
@@ -81,22 +315,29 @@ class AutoLoaderDocument:
             extension = self.document.name.split('.')[-1]
             if extension in self.loaders:
                 loader_class = self.loaders[extension]
-                # Save uploaded file to a temporary file
-                with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                    tmp_file.write(self.document.read())
-                    tmp_file_path = tmp_file.name
-                    print(tmp_file_path)
-                    self.document_name = tmp_file.name
-                
-                doc = loader_class(tmp_file_path).load()
-                if self.huge_file:
-                    text_splitter = RecursiveCharacterTextSplitter(chunk_size=4000, chunk_overlap=400)
-                    doc = text_splitter.split_documents(doc)
-                text = [doc[i].page_content for i in range(len(doc))]
-                if isinstance(text, list):
-                    text = " ".join(text)
-                return text.encode("cp1252", errors="replace").decode("utf-8", errors="replace")
+                with tracing.span('extract', extension=extension, huge_file=self.huge_file) as extract_span:
+                    text = None
+                    if extension in FAST_PATHS:
+                        # docx / pptx are read directly from the OOXML zip, Unstructured is only a fallback
+                        with tracing.span('extract.load', loader=FAST_PATHS[extension].__name__) as load_span:
+                            try:
+                                text = FAST_PATHS[extension](self.document)
+                                content_length = self.document.seek(0, 2)
+                            except OOXML_ERRORS as e:
+                                load_span.set(fallback=type(e).__name__)
+                                self.document.seek(0)
+
+                    if text is None:
+                        pages, content_length = self._load_with_langchain(loader_class)
+                    else:
+                        pages = [text]
+                    tracing.increment('extract_bytes_read_total', content_length)
+                    with tracing.span('extract.normalize') as normalize_span:
+                        text = "\n".join(normalize_pages(pages, remove_headers=extension == 'pdf' and not self.huge_file))
+                        normalize_span.set(chars_in=sum(len(page) for page in pages), chars=len(text))
+                    extract_span.set(bytes=content_length, chars=len(text))
+                    return text
             else:
                 raise ValueError('Unsupported file format.')
         else:
-            raise ValueError('No document file provided.')
\ No newline at end of file
+            raise ValueError('No document file provided.')
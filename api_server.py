@@ -0,0 +1,314 @@
+"""
+Headless HTTP API of Flashcard Anything, for the mobile client and for load balancing.
+
+It shares db_services with the Streamlit app: every handler runs the blocking db_services
+calls on a thread pool, over pooled SQLite connections (db_backend.use_pool).
+
+Usage:
+    python api_server.py --port 8080
+
+Endpoints (JSON, authenticated with "Authorization: Bearer <token>" except login):
+    POST /api/login          {"username", "password"} -> {"token"}
+    GET  /api/cards/due      ?search=...&limit=50     -> {"cards": [...]}
+    POST /api/cards/grade    {"search", "name", "grade"}
+    POST /api/jobs           {"search", "text"}       -> {"job_id"}
+    GET  /api/jobs/{job_id}                           -> {"status", "flashcards", "error"}
+    GET  /api/stats                                   -> {"stats", "due"}
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import db_backend
+import db_services
+from generation import extract_flashcards_from_chunks, get_chat_model, save_flashcards, split_text
+from rate_limiter import PRIORITY_BATCH
+from study_queue import card_priority
+import tracing
+
+# Threads running the db_services calls (and size of the connection pool)
+API_WORKERS = int(os.getenv("FLASHCARD_API_WORKERS", "8"))
+# Seconds a login token stays valid
+SESSION_TTL = float(os.getenv("FLASHCARD_API_SESSION_TTL", "86400"))
+# Key signing the login tokens. Without it, a key is generated once and stored in the database,
+# so every replica sharing the database accepts the tokens of the others
+SESSION_SECRET = os.getenv("FLASHCARD_API_SECRET")
+# Generation jobs running at the same time; the LLM calls of a job are already parallel
+JOB_WORKERS = int(os.getenv("FLASHCARD_API_JOB_WORKERS", "2"))
+# Seconds between the heartbeats of the jobs of a replica, and without heartbeat before a job
+# is taken over by another replica (or by the same one, restarted)
+JOB_HEARTBEAT = float(os.getenv("FLASHCARD_API_JOB_HEARTBEAT", "15"))
+JOB_ORPHAN_AFTER = 4 * JOB_HEARTBEAT
+# Seconds a finished job is kept for its status requests
+JOB_RETENTION = float(os.getenv("FLASHCARD_API_JOB_RETENTION", "86400"))
+MAX_DUE_CARDS = 500
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(secret, payload):
+    return _b64encode(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def create_session(secret, username, ttl=SESSION_TTL):
+    """
+    Returns a login token: the user name and the expiry, signed with secret (HMAC-SHA256).
+    Nothing is stored, so any replica knowing the secret checks it.
+    """
+    payload = f"{_b64encode(username.encode())}.{int(time.time() + ttl)}"
+    return f"{payload}.{_sign(secret, payload)}"
+
+
+def session_user(secret, token):
+    """
+    Returns the user of a valid token, or None.
+    """
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature.encode(), _sign(secret, payload).encode()):
+        return None
+    encoded_username, _, expiry = payload.partition(".")
+    try:
+        if int(expiry) < time.time():
+            return None
+        return _b64decode(encoded_username).decode()
+    except ValueError:
+        return None
+
+
+def error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def run(request, func, *args, **kwargs):
+    """
+    Runs a blocking function (a db_services call) on the thread pool of the application.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app["executor"], functools.partial(func, *args, **kwargs))
+
+
+async def read_json(request, *fields):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Invalid JSON body."}), content_type="application/json")
+    missing = [field for field in fields if body.get(field) in (None, "")]
+    if missing:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"Missing fields: {', '.join(missing)}."}), content_type="application/json")
+    # Numbers or lists would only fail deep in sqlite3 or hashlib, as 500s
+    not_strings = [field for field in fields if not isinstance(body[field], str)]
+    if not_strings:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"Fields must be strings: {', '.join(not_strings)}."}), content_type="application/json")
+    return body
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    """
+    Times every request and checks the bearer token of every endpoint but login.
+    """
+    route = request.match_info.route.resource
+    stage = route.canonical if route is not None else "unknown"
+    with tracing.span('api', root=False, stage=stage):
+        if request.path != "/api/login":
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            username = session_user(request.app["secret"], token) if scheme.lower() == "bearer" else None
+            if username is None:
+                return error(401, "Missing or expired token.")
+            request["username"] = username
+        return await handler(request)
+
+
+async def login(request):
+    body = await read_json(request, "username", "password")
+    if not await run(request, db_services.login_user, body["username"], body["password"]):
+        return error(401, "Incorrect username or password.")
+    return web.json_response({"token": create_session(request.app["secret"], body["username"])})
+
+
+def _due_cards(username, search, limit):
+    if search:
+        return [
+            {"search": search, "name": name, "text": text, "interval": interval, "ease": ease, "reps": reps}
+            for name, text, last_studied, interval, ease, reps in db_services.get_flashcards_study(username, search, limit=limit)
+        ]
+    # All searches, most urgent first (the order of the "All searches" study mode)
+    now = time.time()
+    cards = sorted(
+        db_services.get_due_cards_all(username),
+        key=lambda card: card_priority(card[8], card[4], card[5], card[7], now),
+        reverse=True
+    )
+    return [
+        {"search": search, "name": name, "text": text, "interval": interval, "ease": ease, "reps": reps}
+        for search, name, text, last_studied, interval, ease, reps, due_epoch, last_studied_epoch in cards[:limit]
+    ]
+
+
+async def due_cards(request):
+    try:
+        limit = int(request.query.get("limit", "50"))
+    except ValueError:
+        limit = None
+    # A negative LIMIT means no limit to SQLite
+    if limit is None or not 1 <= limit <= MAX_DUE_CARDS:
+        return error(400, f"limit must be an integer from 1 to {MAX_DUE_CARDS}.")
+    cards = await run(request, _due_cards, request["username"], request.query.get("search"), limit)
+    return web.json_response({"cards": cards})
+
+
+def _grade(username, search, name, grade):
+    state = db_services.get_flashcard_state(username, search, name)
+    if state is None:
+        return False
+    flashcard_name, flashcard_text, last_studied, current_interval, current_ease_factor, current_reps = state
+    db_services.update_flashcard_study(username, search, flashcard_name, flashcard_text,
+                                       grade, current_interval, current_ease_factor, current_reps)
+    return True
+
+
+async def grade_card(request):
+    body = await read_json(request, "search", "name")
+    # true and 5.0 compare equal to 1 and 5: only JSON integers are grades
+    if type(body.get("grade")) is not int or body["grade"] not in (1, 2, 3, 4, 5):
+        return error(400, "grade must be an integer from 1 (very hard) to 5 (very easy).")
+    if not await run(request, _grade, request["username"], body["search"], body["name"], body["grade"]):
+        return error(404, "Flashcard not found.")
+    return web.json_response({"status": "ok"})
+
+
+def _run_job(app, job_id, username, search, text):
+    db_services.update_api_job(job_id, "running")
+    try:
+        with tracing.span('api_job', search=search):
+            flashcards, errors = extract_flashcards_from_chunks(split_text(text), app["model"], PRIORITY_BATCH)
+            saved = save_flashcards(username, search, flashcards)
+        db_services.update_api_job(job_id, "done", flashcards=saved, failed_chunks=len(errors))
+    except Exception as e:
+        db_services.update_api_job(job_id, "failed", error=type(e).__name__)
+    finally:
+        app["running_jobs"].discard(job_id)
+
+
+def _start_job(app, job_id, username, search, text):
+    app["running_jobs"].add(job_id)
+    app["job_executor"].submit(_run_job, app, job_id, username, search, text)
+
+
+async def submit_job(request):
+    body = await read_json(request, "search", "text")
+    job_id = uuid.uuid4().hex
+    await run(request, db_services.add_api_job, job_id, request["username"], body["search"], body["text"])
+    _start_job(request.app, job_id, request["username"], body["search"], body["text"])
+    return web.json_response({"job_id": job_id}, status=202)
+
+
+async def job_status(request):
+    job = await run(request, db_services.get_api_job, request.match_info["job_id"])
+    if job is None or job["userName"] != request["username"]:
+        return error(404, "Job not found.")
+    return web.json_response({
+        "status": job["status"], "flashcards": job["flashcards"],
+        "failed_chunks": job["failedChunks"], "error": job["error"]
+    })
+
+
+def _maintain_jobs(app):
+    """
+    Refreshes the heartbeat of the jobs of this replica, restarts the jobs left without heartbeat
+    by a stopped replica and deletes the jobs finished for more than JOB_RETENTION seconds.
+    """
+    now = time.time()
+    db_services.touch_api_jobs(list(app["running_jobs"]))
+    for job_id, username, search, text in db_services.claim_orphaned_api_jobs(int(now - JOB_ORPHAN_AFTER)):
+        _start_job(app, job_id, username, search, text)
+    db_services.delete_finished_api_jobs(int(now - JOB_RETENTION))
+
+
+async def _job_heartbeat(app):
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(app["executor"], _maintain_jobs, app)
+        await asyncio.sleep(JOB_HEARTBEAT)
+
+
+async def _start_heartbeat(app):
+    app["heartbeat"] = asyncio.create_task(_job_heartbeat(app))
+
+
+def _stats(username):
+    return {"stats": db_services.get_user_stats(username), "due": db_services.get_due_counts(username)}
+
+
+async def stats(request):
+    return web.json_response(await run(request, _stats, request["username"]))
+
+
+async def _shutdown(app):
+    app["heartbeat"].cancel()
+    app["executor"].shutdown(wait=False)
+    app["job_executor"].shutdown(wait=False)
+    db_backend.close_pools()
+
+
+def create_app(model=None, workers=API_WORKERS):
+    """
+    Builds the aiohttp application. Its worker threads take their connections from a pool of
+    db_backend.POOL_SIZE connections, or workers when pooling is not configured; the other
+    threads of the process (a Streamlit app) are not affected.
+
+    The replicas of the application only share the database: the login tokens are signed with
+    SESSION_SECRET (or the key stored in the database) and the jobs are rows of apiJobs.
+    """
+    pool_size = db_backend.POOL_SIZE if db_backend.POOL_SIZE > 0 else workers
+    db_services.migrate_database()
+
+    app = web.Application(middlewares=[auth_middleware])
+    app["executor"] = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="api", initializer=db_backend.use_pool, initargs=(pool_size,)
+    )
+    app["job_executor"] = ThreadPoolExecutor(
+        max_workers=JOB_WORKERS, thread_name_prefix="api-job", initializer=db_backend.use_pool, initargs=(pool_size,)
+    )
+    app["model"] = model or get_chat_model()
+    app["secret"] = SESSION_SECRET or db_services.get_api_secret("session")
+    # Jobs queued or running in this replica, whose heartbeat it refreshes
+    app["running_jobs"] = set()
+    app.router.add_post("/api/login", login)
+    app.router.add_get("/api/cards/due", due_cards)
+    app.router.add_post("/api/cards/grade", grade_card)
+    app.router.add_post("/api/jobs", submit_job)
+    app.router.add_get("/api/jobs/{job_id}", job_status)
+    app.router.add_get("/api/stats", stats)
+    app.on_startup.append(_start_heartbeat)
+    app.on_cleanup.append(_shutdown)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flashcard Anything HTTP API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args()
+    web.run_app(create_app(workers=args.workers), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1326 @@
+"""
+Offline benchmarks for Flashcard Anything.
+
+Every benchmark runs against a temporary SQLite database, so my_database.db is never touched.
+
+Usage:
+    python benchmark.py generation --latency 0.2 --tokens-per-second 80
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+import db_backend
+import db_services
+import tracing
+from AutoLoader import AutoLoaderDocument
+from fake_llm import FakeChatModel
+from generation import (
+    count_tokens,
+    extract_flashcards_from_chunks,
+    extract_flashcards_streaming,
+    iter_chunks,
+    save_flashcards,
+    split_text
+)
+from rate_limiter import configure_rate_limiter
+
+BUNDLED_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2412.19437v1.pdf")
+# Transcript of a lecture, in the format of YouTubeTranscriptApi.get_transcript, replayed by the ingest benchmark
+TRANSCRIPT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "youtube_transcript.json")
+
+WORDS = (
+    "memory retrieval interval repetition concept definition gradient network "
+    "attention transformer expert routing latency throughput parameter inference "
+    "training dataset evaluation benchmark tokenizer embedding activation"
+).split()
+
+
+class NamedBytesIO(io.BytesIO):
+    """
+    In-memory file with a name, mimicking the UploadedFile objects given by Streamlit.
+    """
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def use_temporary_database(directory):
+    """
+    Points db_services to an empty database inside directory and creates the tables.
+    """
+    db_services.DB_PATH = os.path.join(directory, "benchmark.db")
+    db_services.create_tables()
+
+
+def synthetic_html(pages, seed):
+    """
+    Builds an HTML document with the given number of pages (~3000 characters each) of random words.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    for page in range(pages):
+        for _ in range(6):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(70))
+            paragraphs.append(f"<p>{sentence.capitalize()}.</p>")
+    body = "\n".join(paragraphs)
+    return f"<html><head><title>Synthetic {seed}</title></head><body>{body}</body></html>".encode("utf-8")
+
+
+def print_table(columns, rows):
+    """
+    Prints rows as a fixed width table.
+    """
+    widths = [max(len(str(column)), *(len(str(row[i])) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def bench_generation(args):
+    """
+    Runs extract -> chunking -> LLM -> persistence on the bundled PDF and on synthetic documents.
+    """
+    documents = []
+    if not args.skip_pdf:
+        with open(BUNDLED_PDF, "rb") as f:
+            documents.append((os.path.basename(BUNDLED_PDF), f.read()))
+    for i in range(args.synthetic_docs):
+        documents.append((f"synthetic_{i}.html", synthetic_html(args.synthetic_pages, seed=i)))
+
+    model = FakeChatModel(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        cards_per_chunk=args.cards_per_chunk,
+        context_window=args.context_window,
+        rate_limit_probability=args.rate_limit_probability,
+        timeout_probability=args.timeout_probability,
+        seed=args.seed
+    )
+
+    limiter = configure_rate_limiter(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_retries=args.max_retries,
+        base_delay=args.retry_base_delay
+    )
+
+    rows = []
+    totals = {"bytes": 0, "chars": 0, "cards": 0, "seconds": 0.0}
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        for name, data in documents:
+            timings = {}
+            with tracing.span('generate_flashcards', document=name):
+                start = time.perf_counter()
+                text = AutoLoaderDocument(document=NamedBytesIO(data, name)).extract_text()
+                timings["extract"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                chunks = split_text(text)
+                timings["chunk"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                flashcards, errors = extract_flashcards_from_chunks(chunks, model)
+                failures = len(errors)
+                timings["llm"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                inserted = save_flashcards("benchmark", name, flashcards)
+                timings["persist"] = time.perf_counter() - start
+
+            total = sum(timings.values())
+            totals["bytes"] += len(data)
+            totals["chars"] += len(text)
+            totals["cards"] += inserted
+            totals["seconds"] += total
+            rows.append((
+                name, f"{len(data) / 1e6:.2f}", len(text), len(chunks), inserted, failures,
+                f"{timings['extract']:.3f}", f"{timings['chunk']:.3f}",
+                f"{timings['llm']:.3f}", f"{timings['persist']:.3f}", f"{total:.3f}"
+            ))
+
+    print_table(
+        ["document", "MB", "chars", "chunks", "cards", "failed", "extract_s", "chunk_s", "llm_s", "persist_s", "total_s"],
+        rows
+    )
+    seconds = totals["seconds"] or 1e-9
+    print(
+        f"\nTotal: {totals['bytes'] / 1e6 / seconds:.2f} MB/s, {totals['chars'] / seconds:,.0f} chars/s, "
+        f"{totals['cards'] / seconds:.1f} cards/s"
+    )
+    print(f"LLM calls: {model.stats}")
+    print(f"Rate limiter: {limiter.metrics()}")
+    if args.metrics_file:
+        tracing.export_prometheus(args.metrics_file)
+
+
+def load_transcript():
+    """
+    Returns the segments of TRANSCRIPT_FIXTURE.
+    """
+    import json
+
+    with open(TRANSCRIPT_FIXTURE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def stub_pages(articles, video_ids, transcript):
+    """
+    Returns the pages of a StubWebServer: articles pages of readable prose, and a playlist
+    (/playlist?list=PLstub) of the given videos, listing the first one twice as the YouTube
+    playlist pages do. Even articles are validated by ETag, odd ones by date.
+    """
+    words = " ".join(segment["text"] for segment in transcript).split()
+    paragraphs = [" ".join(words[i:i + 60]).capitalize() + "." for i in range(0, len(words), 60)]
+
+    def article(i):
+        # goose3 keeps the paragraphs of readable prose: the lecture text, rotated so every page differs
+        body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs[i % len(paragraphs):] + paragraphs[:i % len(paragraphs)])
+        return f"<html><head><title>Article {i}</title></head><body><article><h1>Article {i}</h1>{body}</article></body></html>".encode()
+
+    pages = {
+        f"/article/{i}": [article(i), f'"v1-{i}"' if i % 2 == 0 else None,
+                          None if i % 2 == 0 else "Mon, 19 Oct 2026 08:00:00 GMT"]
+        for i in range(articles)
+    }
+    pages["/playlist?list=PLstub"] = [
+        ("<script>var data = [" + ",".join(f'{{"videoId":"{video_id}"}}' for video_id in video_ids + video_ids[:1]) + "];</script>").encode(),
+        None, None
+    ]
+    return pages
+
+
+class StubWebServer:
+    """
+    Local HTTP server answering from pages (path -> [body, ETag, Last-Modified], modifiable while
+    it runs) after latency seconds, with a 304 to matching conditional requests.
+    Counts the responses by status (served) and the peak of concurrent requests (in_flight).
+    """
+
+    def __init__(self, pages, latency=0.0):
+        import threading
+        from collections import Counter
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.pages = pages
+        self.served = Counter()
+        self.in_flight = {"now": 0, "peak": 0}
+        lock = threading.Lock()
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    stub.in_flight["now"] += 1
+                    stub.in_flight["peak"] = max(stub.in_flight["peak"], stub.in_flight["now"])
+                try:
+                    time.sleep(latency)
+                    page = stub.pages.get(self.path)
+                    if page is None:
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    body, etag, last_modified = page
+                    if (etag and self.headers.get("If-None-Match") == etag) or \
+                            (last_modified and self.headers.get("If-Modified-Since") == last_modified):
+                        stub.served[304] += 1
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    stub.served[200] += 1
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    for name, value in (("ETag", etag), ("Last-Modified", last_modified)):
+                        if value:
+                            self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        stub.in_flight["now"] -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def requests(self):
+        return self.served[200] + self.served[304]
+
+    def session(self):
+        """
+        Returns a requests.Session sending the requests for www.youtube.com (the playlist page) here.
+        """
+        import requests
+
+        base = self.base
+
+        class StubSession(requests.Session):
+            def request(self, method, url, *args, **kwargs):
+                return super().request(method, url.replace("https://www.youtube.com", base), *args, **kwargs)
+
+        return StubSession()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def bench_ingest(args):
+    """
+    Ingests websites and a YouTube playlist from a local stub HTTP server (StubWebServer), with
+    the transcript fixture (TRANSCRIPT_FIXTURE) replayed instead of downloading transcripts:
+    seconds with one worker and with args.workers, then with a fresh cache, with stale entries
+    (revalidated) and for the playlist. The behavior is tested in tests/test_ingestion.py.
+    """
+    from AutoLoader import YouTubeTranscriptApi
+    from ingestion import ingest_urls
+    from url_cache import UrlCache
+
+    transcript = load_transcript()
+    video_ids = [f"video{i:06d}" for i in range(args.videos)]
+    stub = StubWebServer(stub_pages(args.pages, video_ids, transcript), latency=args.latency)
+    urls = [f"{stub.base}/article/{i}" for i in range(args.pages)]
+    rows = []
+
+    def ingest(label, cache, urls, workers=args.workers):
+        requests_before = stub.requests()
+        stub.in_flight["peak"] = 0
+        start = time.perf_counter()
+        sources = list(ingest_urls(urls, cache=cache, max_workers=workers))
+        rows.append((label, len(urls), workers, stub.requests() - requests_before, stub.in_flight["peak"],
+                     sum(1 for source in sources if source.error), f"{time.perf_counter() - start:.2f}"))
+
+    original_get_transcript = YouTubeTranscriptApi.get_transcript
+    YouTubeTranscriptApi.get_transcript = staticmethod(lambda video_id, languages=("en",), **kwargs: [dict(segment) for segment in transcript])
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            ingest("cold, 1 worker", UrlCache(os.path.join(directory, "sequential"), session=stub.session()), urls, workers=1)
+            cache = UrlCache(os.path.join(directory, "cache"), ttl=3600, session=stub.session())
+            ingest("cold", cache, urls)
+            ingest("fresh cache", cache, urls)
+            cache.ttl = 0
+            ingest("stale cache (revalidated)", cache, urls)
+            cache.ttl = 3600
+            ingest("playlist", cache, ["https://www.youtube.com/playlist?list=PLstub"])
+    finally:
+        YouTubeTranscriptApi.get_transcript = original_get_transcript
+        stub.shutdown()
+
+    print_table(["run", "urls", "workers", "requests", "peak_in_flight", "errors", "seconds"], rows)
+
+
+def seed_review_history(username, cards, seed, now=None):
+    """
+    Inserts a study log of cards flashcards in 20 searches for the user: every card was added
+    now and reviewed once, with a random interval, ease factor and number of repetitions.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now()
+    rows = []
+    for i in range(cards):
+        reps = int(rng.integers(0, 6))
+        ease = float(rng.uniform(1.3, 3.0))
+        interval = float(rng.uniform(1, 60))
+        last = now - timedelta(days=float(rng.uniform(0, 30)))
+        rows.append((username, f"search_{i % 20}", f"card_{i}", "text", None,
+                     now.strftime('%Y-%m-%d %H:%M:%S'), 1, 2.5, 0))
+        rows.append((username, f"search_{i % 20}", f"card_{i}", "text", last.strftime('%Y-%m-%d %H:%M:%S'),
+                     str(last + timedelta(days=interval)), interval, ease, reps))
+    conn = db_services.create_connection()
+    conn.executemany("""
+        INSERT INTO flashcardStudyLog (userName, selectedSearch, flashcardName, flashcardText,
+            datetimeLastStudy, datetimeNextStudy, studyInterval, easeFactor, reps)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+
+def bench_forecast(args):
+    """
+    Times the review forecast of a user with args.cards flashcards, from the database to the result.
+    The incremental card states are tested in tests/test_forecast.py.
+    """
+    import forecast
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        seed_review_history("benchmark", args.cards, args.seed)
+
+        states = db_services.get_card_states("benchmark")
+        arrays = forecast.card_states_arrays(states)
+        probabilities = forecast.grade_distribution("benchmark")
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            forecast.simulate_reviews(*arrays, probabilities, horizon=args.horizon, runs=args.runs)
+            timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        forecast.forecast_reviews("benchmark", horizon=args.horizon, runs=args.runs)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        forecast.forecast_reviews("benchmark", horizon=args.horizon, runs=args.runs)
+        cached = time.perf_counter() - start
+
+        # First render of a dashboard opened after the warm up of the login
+        for cache in (forecast._cache, forecast._grade_cache, forecast._states_cache):
+            cache.clear()
+        forecast.warm_forecast("benchmark", horizon=args.horizon, runs=args.runs).result()
+        start = time.perf_counter()
+        forecast.forecast_reviews("benchmark", horizon=args.horizon, runs=args.runs)
+        warmed = time.perf_counter() - start
+
+        db_services.update_flashcard_study("benchmark", "search_0", "card_0", "text", 4, 1, 2.5, 1)
+        start = time.perf_counter()
+        forecast.forecast_reviews("benchmark", horizon=args.horizon, runs=args.runs)
+        after_write = time.perf_counter() - start
+
+    print(f"Cards: {args.cards}, horizon: {args.horizon} days, runs: {args.runs}")
+    print(f"Simulation: best {min(timings) * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+    print(
+        f"forecast_reviews: cold {cold * 1000:.1f} ms (including queries), cached {cached * 1000:.1f} ms, "
+        f"after the login warm up {warmed * 1000:.1f} ms, after a review {after_write * 1000:.1f} ms"
+    )
+
+
+def bench_logins(args):
+    """
+    Measures logins/sec with the scrypt KDF pool, with and without the login cache,
+    for several numbers of concurrent clients.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        db_services.create_usertable()
+        users = [(f"user_{i}", f"password_{i}") for i in range(args.users)]
+        for username, password in users:
+            db_services.add_userdata(username, password)
+
+        def login(i):
+            username, password = users[i % len(users)]
+            if not db_services.login_user(username, password):
+                raise AssertionError(f"Login failed for {username}")
+
+        rows = []
+        ttl = db_services.LOGIN_CACHE_TTL
+        for cached in (False, True):
+            db_services.LOGIN_CACHE_TTL = ttl if cached else 0
+            for threads in args.threads:
+                db_services.invalidate_login_cache()
+                if cached:
+                    for i in range(len(users)):
+                        login(i)
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    list(executor.map(login, range(args.attempts)))
+                elapsed = time.perf_counter() - start
+                rows.append(("yes" if cached else "no", threads, args.attempts, f"{elapsed:.3f}", f"{args.attempts / elapsed:,.1f}"))
+        db_services.LOGIN_CACHE_TTL = ttl
+
+    print(f"KDF workers: {db_services.KDF_WORKERS}, scrypt n={db_services.SCRYPT_N}")
+    print_table(["cache", "clients", "logins", "seconds", "logins/s"], rows)
+
+
+def _contention_worker(path, journal_mode, busy_timeout_ms, seconds, write_ratio, worker_id, results):
+    """
+    One "replica": mixes study log writes and due card reads on the shared database for the given time.
+    """
+    import sqlite3
+
+    db_backend.JOURNAL_MODE = journal_mode
+    db_backend.BUSY_TIMEOUT_MS = busy_timeout_ms
+    db_services.DB_PATH = path
+    rng = random.Random(worker_id)
+    ops = errors = 0
+    worst = 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        card = f"card_{rng.randrange(200)}"
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                db_services.update_flashcard_study("benchmark", "shared", card, "text", 4, 1, 2.5, 1)
+            else:
+                db_services.get_flashcards_study("benchmark", "shared")
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        worst = max(worst, time.perf_counter() - start)
+    results.put((ops, errors, worst))
+
+
+def bench_contention(args):
+    """
+    Runs several processes against the same SQLite file, with the old defaults
+    (rollback journal, no busy timeout) and with the db_backend settings (WAL + busy_timeout).
+    tests/test_contention.py checks that the latter gives no locked errors.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    saved_settings = (db_backend.JOURNAL_MODE, db_backend.BUSY_TIMEOUT_MS)
+    configurations = [("DELETE", 0), ("WAL", args.busy_timeout_ms)]
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for journal_mode, busy_timeout_ms in configurations:
+            path = os.path.join(directory, f"contention_{journal_mode}.db")
+            db_backend.JOURNAL_MODE = journal_mode
+            db_backend.BUSY_TIMEOUT_MS = busy_timeout_ms
+            db_services.DB_PATH = path
+            db_services.create_tables()
+            for i in range(200):
+                db_services.add_flashcard_study("benchmark", "shared", f"card_{i}", "text")
+
+            results = context.Queue()
+            processes = [
+                context.Process(
+                    target=_contention_worker,
+                    args=(path, journal_mode, busy_timeout_ms, args.seconds, args.write_ratio, i, results)
+                )
+                for i in range(args.processes)
+            ]
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            ops = sum(outcome[0] for outcome in outcomes)
+            errors = sum(outcome[1] for outcome in outcomes)
+            worst = max(outcome[2] for outcome in outcomes)
+            rows.append((
+                journal_mode, busy_timeout_ms, args.processes, ops, errors,
+                f"{ops / args.seconds:,.0f}", f"{worst * 1000:.1f}"
+            ))
+
+    db_backend.JOURNAL_MODE, db_backend.BUSY_TIMEOUT_MS = saved_settings
+    print_table(["journal", "busy_timeout_ms", "processes", "ops", "locked_errors", "ops/s", "worst_ms"], rows)
+
+
+def bench_book(args):
+    """
+    Compares flat chunked extraction with the hierarchical mode on a synthetic book, then
+    re-runs the hierarchical mode to show what the stage cache saves.
+    """
+    import hierarchical
+
+    text = AutoLoaderDocument(document=NamedBytesIO(synthetic_html(args.pages, seed=args.seed), "book.html")).extract_text()
+    configure_rate_limiter(requests_per_minute=100000, tokens_per_minute=100000000)
+    rows = []
+
+    def run(label, func):
+        model = FakeChatModel(latency=args.latency, cards_per_chunk=args.cards_per_chunk, seed=args.seed)
+        start = time.perf_counter()
+        flashcards = func(model)
+        rows.append((
+            label, len(flashcards), model.stats["calls"], model.stats["tokens_in"] + model.stats["tokens_out"],
+            f"{time.perf_counter() - start:.3f}"
+        ))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = hierarchical.StageCache(directory)
+        run("chunked", lambda model: extract_flashcards_from_chunks(split_text(text), model)[0])
+        run("hierarchical", lambda model: hierarchical.generate_hierarchical(text, model, args.max_cards, cache=cache)[0])
+        run("hierarchical (cached)", lambda model: hierarchical.generate_hierarchical(text, model, args.max_cards, cache=cache)[0])
+        # A different cap changes the section prompt inputs: only the section level is recomputed
+        run("hierarchical (new cap)", lambda model: hierarchical.generate_hierarchical(text, model, args.max_cards + 1, cache=cache)[0])
+
+    print(f"{len(text):,} characters")
+    print_table(["mode", "cards", "llm_calls", "tokens", "seconds"], rows)
+
+
+def bench_decks(args):
+    """
+    Exports a study log of args.rows rows to both deck formats and imports it back,
+    reporting throughput, file size and peak Python memory (tracemalloc).
+    """
+    import tracemalloc
+    import deck_io
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+
+    def synthetic_rows():
+        for start in range(0, args.rows, deck_io.BATCH_SIZE):
+            rows = []
+            for i in range(start, min(start + deck_io.BATCH_SIZE, args.rows)):
+                next_study = now + timedelta(days=rng.randint(-30, 60))
+                rows.append((
+                    f"search {i % 20}", f"Concept {i // 10}", " ".join(rng.choice(WORDS) for _ in range(30)),
+                    (next_study - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S'),
+                    next_study.strftime('%Y-%m-%d %H:%M:%S'), rng.uniform(1, 90), rng.uniform(1.3, 3.0),
+                    rng.randint(0, 10), int(next_study.timestamp())
+                ))
+            yield rows
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        db_services.bulk_insert_study_log("benchmark", synthetic_rows())
+        for fmt, extension in deck_io.FORMATS.items():
+            path = os.path.join(directory, f"deck{extension}")
+            tracemalloc.start()
+            start = time.perf_counter()
+            with open(path, "wb") as f:
+                exported = deck_io.export_deck("benchmark", f, fmt)
+            export_seconds = time.perf_counter() - start
+            export_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                imported, _ = deck_io.import_deck(f"imported_{fmt}", f, fmt)
+            import_seconds = time.perf_counter() - start
+            import_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert exported == imported == args.rows
+
+            rows.append((
+                fmt, exported, f"{os.path.getsize(path) / 1e6:.1f}",
+                f"{exported / export_seconds:,.0f}", f"{export_peak / 1e6:.1f}",
+                f"{imported / import_seconds:,.0f}", f"{import_peak / 1e6:.1f}"
+            ))
+
+    print_table(["format", "rows", "file_MB", "export_rows/s", "export_peak_MB", "import_rows/s", "import_peak_MB"], rows)
+
+
+def synthetic_apkg(path, cards, seed):
+    """
+    Writes a minimal Anki package (a zip holding a collection.anki2 database with a notes table).
+    """
+    import sqlite3
+    import zipfile
+
+    rng = random.Random(seed)
+    collection = f"{path}.anki2"
+    conn = sqlite3.connect(collection)
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, flds TEXT NOT NULL)")
+    conn.executemany("INSERT INTO notes (id, flds) VALUES (?, ?)", (
+        (i, f"<b>Concept {i}</b>\x1f" + " ".join(rng.choice(WORDS) for _ in range(30)) + "<br>&nbsp;")
+        for i in range(cards)
+    ))
+    conn.commit()
+    conn.close()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        package.write(collection, "collection.anki2")
+    os.remove(collection)
+
+
+def bench_cards(args):
+    """
+    Imports a CSV and an Anki package of args.cards cards, reporting cards/s and peak Python memory.
+    """
+    import csv
+    import tracemalloc
+    import card_import
+
+    rng = random.Random(args.seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        csv_path = os.path.join(directory, "deck.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["front", "back"])
+            for i in range(args.cards):
+                writer.writerow([f"Concept {i}", " ".join(rng.choice(WORDS) for _ in range(30))])
+        apkg_path = os.path.join(directory, "deck.apkg")
+        synthetic_apkg(apkg_path, args.cards, args.seed)
+
+        for path in (csv_path, apkg_path):
+            name = os.path.basename(path)
+            tracemalloc.start()
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                inserted, skipped = card_import.import_cards("benchmark", name, card_import.iter_deck_cards(f, name))
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rows.append((
+                name, f"{os.path.getsize(path) / 1e6:.1f}", inserted, skipped,
+                f"{seconds:.2f}", f"{inserted / seconds:,.0f}", f"{peak / 1e6:.1f}"
+            ))
+
+    print_table(["deck", "MB", "cards", "skipped", "seconds", "cards/s", "peak_MB"], rows)
+
+
+def synthetic_office(path, pages, seed):
+    """
+    Writes a .docx (pages of paragraphs) or .pptx (one slide per page) of random words,
+    with python-docx / python-pptx (dependencies of the Unstructured loaders).
+    """
+    rng = random.Random(seed)
+
+    def sentence(words):
+        return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    if path.endswith(".docx"):
+        import docx
+        document = docx.Document()
+        for page in range(pages):
+            document.add_heading(f"Section {page}", level=2)
+            for _ in range(6):
+                document.add_paragraph(sentence(70))
+        document.save(path)
+    else:
+        import pptx
+        presentation = pptx.Presentation()
+        for page in range(pages):
+            slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+            slide.shapes.title.text = f"Slide {page}"
+            body = slide.placeholders[1].text_frame
+            body.text = sentence(20)
+            for _ in range(5):
+                body.add_paragraph().text = sentence(20)
+        presentation.save(path)
+
+
+def bench_office(args):
+    """
+    Compares the OOXML fast path of AutoLoaderDocument with the Unstructured loaders on
+    synthetic .docx and .pptx files. Every loader is timed, then run again under tracemalloc
+    for its peak memory (tracing allocations slows the parsers down a lot).
+    """
+    import tracemalloc
+    import docx
+    import pptx
+    import ooxml
+
+    def measure(load):
+        load()  # warm up imports and caches
+        start = time.perf_counter()
+        text = load()
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        load()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return text, seconds, peak
+
+    def without_fast_path(load):
+        saved_fast_paths = dict(ooxml.FAST_PATHS)
+        ooxml.FAST_PATHS.clear()
+        try:
+            return load()
+        finally:
+            ooxml.FAST_PATHS.update(saved_fast_paths)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in ("docx", "pptx"):
+            path = os.path.join(directory, f"synthetic.{extension}")
+            synthetic_office(path, args.pages, args.seed)
+            with open(path, "rb") as f:
+                data = f.read()
+
+            def auto_loader():
+                return AutoLoaderDocument(document=NamedBytesIO(data, os.path.basename(path))).extract_text()
+
+            def python_ooxml():
+                # python-docx / python-pptx build the whole XML tree: a lower bound of the Unstructured cost
+                if extension == "docx":
+                    return "\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+                return "\n\n".join(
+                    shape.text_frame.text
+                    for slide in pptx.Presentation(path).slides for shape in slide.shapes if shape.has_text_frame
+                )
+
+            loaders = [
+                ("fast path", auto_loader),
+                ("unstructured", lambda: without_fast_path(auto_loader)),
+                (f"python-{extension}", python_ooxml),
+            ]
+            for name, load in loaders:
+                try:
+                    text, seconds, peak = measure(load)
+                except Exception as e:
+                    # Unstructured needs NLP models that may not be installed (or downloadable)
+                    rows.append((extension, name, f"{len(data) / 1e6:.2f}", f"failed: {type(e).__name__}", "", "", ""))
+                    continue
+                rows.append((
+                    extension, name, f"{len(data) / 1e6:.2f}", len(text), f"{seconds:.3f}",
+                    f"{len(data) / 1e6 / seconds:.2f}", f"{peak / 1e6:.1f}"
+                ))
+
+    print_table(["format", "loader", "MB", "chars", "seconds", "MB/s", "peak_MB"], rows)
+
+
+def bench_queue(args):
+    """
+    Loads the global study queue of a user with args.cards cards in args.searches searches,
+    and compares it with querying every search with get_flashcards_study.
+    """
+    import study_queue
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+
+    def synthetic_rows():
+        rows = []
+        for i in range(args.cards):
+            search, name = f"search_{i % args.searches}", f"card_{i}"
+            # Half of the cards are due (some overdue), the others in the next weeks
+            due = now + timedelta(days=rng.uniform(-20, 0) if i % 2 else rng.uniform(1, 30))
+            last = due - timedelta(days=rng.uniform(1, 30))
+            rows.append((search, name, "text", None, None, 1, 2.5, 0, None))
+            rows.append((search, name, "text", last.strftime('%Y-%m-%d %H:%M:%S'), due.strftime('%Y-%m-%d %H:%M:%S'),
+                         rng.uniform(1, 30), rng.uniform(1.3, 3.0), rng.randint(1, 8), int(due.timestamp())))
+            if len(rows) >= 10000:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        db_services.bulk_insert_study_log("benchmark", synthetic_rows())
+
+        start = time.perf_counter()
+        searches = [search for (search,) in db_services.query_searches_flashcards("benchmark")]
+        per_search = [card for search in searches for card in db_services.get_flashcards_study("benchmark", search)]
+        per_search_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cards = db_services.get_due_cards_all("benchmark")
+        query_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        queue = study_queue.GlobalStudyQueue("benchmark", cards)
+        heapify_seconds = time.perf_counter() - start
+        assert len(queue) == len(per_search)
+
+        # Pops and pushes only: the grades themselves are saved by the background writer
+        operations = min(args.operations, len(queue))
+        start = time.perf_counter()
+        popped = [queue.pop() for _ in range(operations)]
+        pop_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for card in popped:
+            queue.push(card)
+        push_seconds = time.perf_counter() - start
+
+    print(f"Cards: {args.cards} in {args.searches} searches, due: {len(cards)}")
+    print_table(["step", "ms", "us/op"], [
+        ("get_flashcards_study per search", f"{per_search_seconds * 1000:.1f}", ""),
+        ("get_due_cards_all (one query)", f"{query_seconds * 1000:.1f}", ""),
+        ("heapify", f"{heapify_seconds * 1000:.1f}", ""),
+        (f"pop x{operations}", f"{pop_seconds * 1000:.1f}", f"{pop_seconds / operations * 1e6:.1f}"),
+        (f"push x{operations}", f"{push_seconds * 1000:.1f}", f"{push_seconds / operations * 1e6:.1f}"),
+    ])
+
+
+def bench_api(args):
+    """
+    Load test of api_server.py: requests/sec of the study endpoints for args.concurrency clients,
+    compared with the Streamlit path (a full rerun of the study page per interaction).
+    The behavior of the API (replicas, restarts, validation) is tested in tests/test_api.py.
+    """
+    import asyncio
+    import threading
+    import aiohttp
+    from aiohttp import web
+    import api_server
+
+    def seed():
+        db_services.create_usertable()
+        now = datetime.now()
+        for u in range(args.users):
+            db_services.add_userdata(f"user_{u}", "password")
+            db_services.bulk_insert_study_log(f"user_{u}", [[
+                (f"search_{i % 5}", f"card_{i}", "text", str(now - timedelta(days=1)), str(now - timedelta(minutes=1)),
+                 1, 2.5, 1, int(now.timestamp()) - 60)
+                for i in range(args.cards)
+            ]])
+
+    def start_server(app):
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port = runner.addresses[0][1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        return loop, runner, port
+
+    def stop_server(loop, runner):
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    async def load(port):
+        base = f"http://127.0.0.1:{port}/api"
+        results = {}
+        async with aiohttp.ClientSession() as session:
+            tokens = []
+            for u in range(args.users):
+                async with session.post(f"{base}/login", json={"username": f"user_{u}", "password": "password"}) as response:
+                    tokens.append((await response.json())["token"])
+
+            async def client(i, endpoint, deadline, counter):
+                headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+                n = 0
+                while time.perf_counter() < deadline:
+                    if endpoint == "grade":
+                        request = session.post(f"{base}/cards/grade", headers=headers,
+                                               json={"search": "search_0", "name": f"card_{(n * 5) % args.cards}", "grade": 4})
+                    elif endpoint == "due":
+                        request = session.get(f"{base}/cards/due?search=search_{n % 5}&limit=20", headers=headers)
+                    else:
+                        request = session.get(f"{base}/stats", headers=headers)
+                    async with request as response:
+                        await response.read()
+                        if response.status != 200:
+                            counter["errors"] += 1
+                    n += 1
+                counter["requests"] += n
+
+            for endpoint in ("due", "stats", "grade"):
+                counter = {"requests": 0, "errors": 0}
+                start = time.perf_counter()
+                deadline = start + args.seconds
+                await asyncio.gather(*(client(i, endpoint, deadline, counter) for i in range(args.concurrency)))
+                results[endpoint] = (counter["requests"] / (time.perf_counter() - start), counter["errors"])
+        return results
+
+    def streamlit_reruns():
+        from streamlit.testing.v1 import AppTest
+        os.environ["FLASHCARD_FAKE_LLM"] = "1"
+        app_test = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), default_timeout=60)
+        app_test.session_state["username"] = "user_0"
+        app_test.run()
+        app_test.sidebar.selectbox[0].select("Study Flashcards").run()
+        reruns = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            app_test.button(key="grade_4").click().run()
+            reruns += 1
+        return reruns / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        os.environ["FLASHCARD_DB_PATH"] = db_services.DB_PATH
+        seed()
+        loop, runner, port = start_server(api_server.create_app(model=FakeChatModel(), workers=args.workers))
+        try:
+            results = asyncio.run(load(port))
+        finally:
+            stop_server(loop, runner)
+        streamlit_rps = streamlit_reruns()
+
+    rows = [(f"API {endpoint}", args.concurrency, f"{rps:,.0f}", errors) for endpoint, (rps, errors) in results.items()]
+    rows.append(("Streamlit study rerun", 1, f"{streamlit_rps:,.1f}", 0))
+    print_table(["path", "clients", "requests/s", "errors"], rows)
+
+
+def synthetic_pdf(path, size_mb, seed, page_chars=3000, image_kb=256):
+    """
+    Writes a PDF of about size_mb MB, page by page: every page holds page_chars characters of
+    random words and an uncompressed image of image_kb KB, like the scans and figures that make
+    real PDFs big. Returns the number of pages.
+    """
+    rng = random.Random(seed)
+    offsets = {}
+    with open(path, "wb") as f:
+        def write(object_id, body):
+            offsets[object_id] = f.tell()
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (object_id, body))
+
+        def write_stream(object_id, header, data):
+            write(object_id, b"<< %s /Length %d >>\nstream\n%s\nendstream" % (header, len(data), data))
+
+        f.write(b"%PDF-1.4\n")
+        # 1: catalog, 2: page tree (written last, once the pages are known), 3: font
+        write(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        pages, next_id = [], 4
+        while f.tell() < size_mb * 1024 * 1024:
+            lines, chars = [], 0
+            while chars < page_chars:
+                line = " ".join(rng.choice(WORDS) for _ in range(10))
+                chars += len(line)
+                lines.append(b"(%s) Tj T*" % line.encode())
+            content_id, image_id, page_id = next_id, next_id + 1, next_id + 2
+            next_id += 3
+            write_stream(content_id, b"", b"BT /F1 10 Tf 12 TL 50 780 Td " + b" ".join(lines) + b" ET q 500 0 0 300 50 50 cm /Im0 Do Q")
+            image = rng.randbytes(image_kb * 1024) if image_kb else b"\0"
+            write_stream(image_id, b"/Type /XObject /Subtype /Image /Width %d /Height 1 /ColorSpace /DeviceGray /BitsPerComponent 8" % len(image), image)
+            write(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                           b"/Resources << /Font << /F1 3 0 R >> /XObject << /Im0 %d 0 R >> >> >>" % (content_id, image_id))
+            pages.append(page_id)
+        write(2, b"<< /Type /Pages /Count %d /Kids [%s] >>" % (len(pages), b" ".join(b"%d 0 R" % page for page in pages)))
+        write(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % next_id)
+        for object_id in range(1, next_id):
+            f.write(b"%010d 00000 n \n" % offsets[object_id])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_id, xref))
+    return len(pages)
+
+
+def bench_stream(args):
+    """
+    Runs a synthetic PDF of args.mb MB through the streaming pipeline (iter_text, iter_chunks,
+    extract_flashcards_streaming with a fake LLM, save_flashcards) under tracemalloc, and
+    compares it with extract_text + split_text on a smaller PDF (args.baseline_mb).
+    The memory bound itself is tested in tests/test_autoloader.py.
+    """
+    import tracemalloc
+    import AutoLoader
+
+    configure_rate_limiter(requests_per_minute=100000, tokens_per_minute=100000000)
+    count_tokens("warm up")  # loads the tokenizer before memory is traced
+    rows = []
+
+    def measure(label, path, pages, run):
+        model = FakeChatModel(cards_per_chunk=args.cards_per_chunk, seed=args.seed)
+        search = f"{label} {len(rows)}"
+        with open(path, "rb") as document:
+            tracemalloc.start()
+            start = time.perf_counter()
+            chunks, saved = run(AutoLoaderDocument(document=document), model, search)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        size = os.path.getsize(path) / 1e6
+        rows.append((label, f"{size:.0f}", pages, chunks, saved, f"{seconds:.1f}", f"{size / seconds:.1f}", f"{peak / 1e6:.1f}"))
+        return peak
+
+    def streaming(loader, model, search):
+        chunks, saved = 0, 0
+        for flashcards, error in extract_flashcards_streaming(iter_chunks(loader.iter_text()), model):
+            chunks += 1
+            saved += save_flashcards("benchmark", search, flashcards or [])
+        return chunks, saved
+
+    def in_memory(loader, model, search):
+        chunks = split_text(loader.extract_text())
+        flashcards, errors = extract_flashcards_from_chunks(chunks, model)
+        return len(chunks), save_flashcards("benchmark", search, flashcards)
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        path = os.path.join(directory, "synthetic.pdf")
+        if args.baseline_mb:
+            pages = synthetic_pdf(path, args.baseline_mb, args.seed)
+            measure("extract_text", path, pages, in_memory)
+            measure("iter_text", path, pages, streaming)
+        pages = synthetic_pdf(path, args.mb, args.seed)
+        peak = measure("iter_text", path, pages, streaming)
+
+    print_table(["mode", "MB", "pages", "chunks", "flashcards", "seconds", "MB/s", "peak_MB"], rows)
+    budget = AutoLoader.EXTRACT_MEMORY_MB * 1024 * 1024
+    print(f"Streaming peak {peak / 1e6:.1f} MB, budget {budget / 1e6:.1f} MB (FLASHCARD_EXTRACT_MEMORY_MB)")
+
+
+def bench_cache(args):
+    """
+    Replays the reads of dashboard / menu reruns (stats, daily reviews, searches, due counts,
+    user_exists) with a grade every args.write_every reads, without and with the query cache.
+    That the cache never serves a stale result is tested in tests/test_query_cache.py.
+    """
+    import query_cache
+
+    users = [f"user_{i}" for i in range(args.users)]
+    rows = []
+
+    def seed():
+        for user in users:
+            db_services.bulk_insert_study_log(user, [[
+                (f"search_{i % 10}", f"card_{i}", "text", None, None, 1, 2.5, 0, int(time.time()))
+                for i in range(args.cards)
+            ]])
+
+    def session_reads(rng, reads):
+        for i in range(reads):
+            user = rng.choice(users)
+            if args.write_every and i % args.write_every == 0:
+                db_services.update_flashcard_study(user, "search_0", f"card_{rng.randrange(args.cards)}", "text", 4, 1, 2.5, 1)
+            db_services.get_user_stats(user)
+            db_services.get_daily_reviews(user)
+            db_services.query_searches_flashcards(user)
+            db_services.get_due_counts(user)
+            db_services.user_exists(user)
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        seed()
+        saved_size = query_cache.get_query_cache().max_entries
+        for label, size in (("no cache", 0), ("query cache", saved_size or query_cache.QUERY_CACHE_SIZE)):
+            cache = query_cache.get_query_cache()
+            cache.max_entries = size
+            cache.invalidate()
+            before = cache.metrics()
+            start = time.perf_counter()
+            session_reads(random.Random(args.seed), args.reads)
+            seconds = time.perf_counter() - start
+            after = cache.metrics()
+            hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+            rows.append((label, args.reads * 5, f"{seconds:.2f}", f"{args.reads * 5 / seconds:,.0f}",
+                         f"{hits / (hits + misses):.1%}" if hits + misses else "-"))
+        cache.max_entries = saved_size
+
+    print_table(["mode", "reads", "seconds", "reads/s", "hit_rate"], rows)
+
+
+def revise_document(text, edits, seed):
+    """
+    Returns a revised version of a text of paragraphs (one per line): a paragraph inserted
+    at the beginning, edits paragraphs rewritten and the last 10% removed.
+    """
+    rng = random.Random(seed)
+    paragraphs = text.split("\n")
+    revised = list(paragraphs[:int(len(paragraphs) * 0.9)])
+    for index in rng.sample(range(1, len(revised)), edits):
+        revised[index] = " ".join(rng.choice(WORDS) for _ in range(70)).capitalize() + "."
+    revised.insert(1, "A new introduction paragraph about " + " ".join(rng.choice(WORDS) for _ in range(40)) + ".")
+    return "\n".join(revised)
+
+
+def bench_incremental(args):
+    """
+    Uploads a synthetic document, then a revised version of it (revise_document), and compares
+    the incremental generation with a full regeneration: LLM calls, tokens, stale flashcards.
+    Also shows how many chunks of fixed size (split_text) would have been reused.
+    That stale flashcards are not scheduled anymore is tested in tests/test_incremental.py.
+    """
+    import incremental
+
+    configure_rate_limiter(requests_per_minute=100000, tokens_per_minute=100000000)
+    text = AutoLoaderDocument(document=NamedBytesIO(synthetic_html(args.pages, seed=args.seed), "v1.html")).extract_text()
+    revised = revise_document(text, args.edits, args.seed)
+
+    def reuse(chunks_v1, chunks_v2):
+        known = set(chunks_v1)
+        return f"{sum(chunk in known for chunk in chunks_v2)}/{len(chunks_v2)}"
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        use_temporary_database(directory)
+        for label, version in (("v1 (first upload)", text), ("v2 (revised)", revised)):
+            model = FakeChatModel(cards_per_chunk=args.cards_per_chunk, seed=args.seed)
+            start = time.perf_counter()
+            flashcards, report = incremental.generate_incremental("benchmark", "document", version, model)
+            save_flashcards("benchmark", "document", flashcards)
+            rows.append((
+                f"incremental {label}", model.stats["calls"], report["tokens_sent"], report["tokens_saved"],
+                report["reused"], len(report["stale_flashcards"]), f"{time.perf_counter() - start:.2f}"
+            ))
+        model = FakeChatModel(cards_per_chunk=args.cards_per_chunk, seed=args.seed)
+        start = time.perf_counter()
+        extract_flashcards_from_chunks(split_text(revised), model)
+        rows.append((
+            "full regeneration v2", model.stats["calls"], model.stats["tokens_in"] + model.stats["tokens_out"], 0, 0, "-",
+            f"{time.perf_counter() - start:.2f}"
+        ))
+
+    print_table(["run", "llm_calls", "tokens_sent", "tokens_saved", "reused_chunks", "stale_cards", "seconds"], rows)
+    print(f"Chunks reused after the revision: content defined {reuse(incremental.content_defined_chunks(text), incremental.content_defined_chunks(revised))}, "
+          f"split_text {reuse(split_text(text), split_text(revised))}")
+
+
+def synthetic_pages(pages, seed, non_latin_ratio=0.2, ligatures=True):
+    """
+    Builds the raw text of PDF pages as extractors return it: a running header, page numbers,
+    words hyphenated at line ends, ligatures, runs of spaces, and non-Latin lines.
+    Without ligatures and non-Latin lines the pages are ASCII.
+    """
+    rng = random.Random(seed)
+    non_latin = ["Ελληνικό κείμενο για επανάληψη", "Интервальное повторение памяти", "間隔反復による記憶の定着", "تكرار متباعد للذاكرة"]
+    texts = []
+    for page in range(1, pages + 1):
+        lines = ["Flashcard Anything  Handbook", ""]
+        for _ in range(40):
+            if rng.random() < non_latin_ratio:
+                lines.append(rng.choice(non_latin))
+                continue
+            words = [rng.choice(WORDS) for _ in range(10)]
+            tail = " ".join(words[5:])
+            line = "  ".join(words[:5]) + " " + (tail.replace("fi", "\ufb01") if ligatures else tail)
+            if rng.random() < 0.3:
+                word = rng.choice(WORDS)
+                line += f" {word[:len(word) // 2]}-"
+                lines.append(line)
+                lines.append(f"{word[len(word) // 2:]} \t")
+            else:
+                lines.append(line)
+        lines += ["", "", "", f"Page {page} of {pages}"]
+        texts.append("\n".join(lines))
+    return texts
+
+
+def bench_normalize(args):
+    """
+    Compares the cp1252 round trip formerly applied to the extracted text with
+    text_normalize.normalize_pages: throughput, corrupted characters and tokens sent to the model.
+    """
+    from text_normalize import normalize_pages
+
+    pages = synthetic_pages(args.pages, args.seed)
+    ascii_pages = synthetic_pages(args.pages, args.seed, non_latin_ratio=0, ligatures=False)
+    raw = "\n".join(pages)
+    rows = []
+
+    def corrupted(text):
+        # Characters cp1252 cannot encode become "?", and the cp1252 bytes of the others are not UTF-8
+        return text.count("?") + text.count("\ufffd")
+
+    def run(label, func, pages=pages):
+        source = "\n".join(pages)
+        size = len(source.encode("utf-8")) / 1e6
+        func()  # warm up
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            text = func()
+        seconds = (time.perf_counter() - start) / args.repeat
+        rows.append((
+            label, f"{size:.1f}", f"{seconds:.3f}", f"{size / seconds:.1f}", len(text),
+            corrupted(text) - corrupted(source), count_tokens(text)
+        ))
+
+    def round_trip(text):
+        return text.encode("cp1252", errors="replace").decode("utf-8", errors="replace")
+
+    run("raw text", lambda: raw)
+    run("cp1252 round trip", lambda: round_trip(raw))
+    run("normalize_pages", lambda: "\n".join(normalize_pages(pages)))
+    run("normalize (no headers)", lambda: "\n".join(normalize_pages(pages, remove_headers=False)))
+    # ASCII pages skip NFKC
+    ascii_raw = "\n".join(ascii_pages)
+    run("cp1252 round trip (ASCII)", lambda: round_trip(ascii_raw), ascii_pages)
+    run("normalize_pages (ASCII)", lambda: "\n".join(normalize_pages(ascii_pages)), ascii_pages)
+
+    print_table(["stage", "MB", "seconds", "MB/s", "chars", "corrupted_chars", "tokens"], rows)
+    print("tokens: generation.count_tokens (tiktoken, or 4 characters per token when it is not available)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Flashcard Anything")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    generation = subparsers.add_parser("generation", help="Full generation pipeline with a fake LLM")
+    generation.add_argument("--synthetic-docs", type=int, default=3)
+    generation.add_argument("--synthetic-pages", type=int, default=50)
+    generation.add_argument("--skip-pdf", action="store_true", help="Do not benchmark the bundled PDF")
+    generation.add_argument("--latency", type=float, default=0.0, help="Seconds per LLM call")
+    generation.add_argument("--tokens-per-second", type=float, default=None)
+    generation.add_argument("--cards-per-chunk", type=int, default=5)
+    generation.add_argument("--context-window", type=int, default=128000)
+    generation.add_argument("--rate-limit-probability", type=float, default=0.0)
+    generation.add_argument("--timeout-probability", type=float, default=0.0)
+    generation.add_argument("--seed", type=int, default=0)
+    generation.add_argument("--rpm", type=int, default=100000, help="Rate limiter requests per minute")
+    generation.add_argument("--tpm", type=int, default=100000000, help="Rate limiter tokens per minute")
+    generation.add_argument("--max-retries", type=int, default=5)
+    generation.add_argument("--retry-base-delay", type=float, default=0.05)
+    generation.add_argument("--metrics-file", help="Write the Prometheus metrics of the run to this file")
+    generation.set_defaults(func=bench_generation)
+
+    ingest = subparsers.add_parser("ingest", help="URL / playlist ingestion against a local stub HTTP server")
+    ingest.add_argument("--pages", type=int, default=24)
+    ingest.add_argument("--videos", type=int, default=5)
+    ingest.add_argument("--workers", type=int, default=8)
+    ingest.add_argument("--latency", type=float, default=0.05, help="Seconds the stub server waits before answering")
+    ingest.set_defaults(func=bench_ingest)
+
+    forecast = subparsers.add_parser("forecast", help="Review load forecast simulation")
+    forecast.add_argument("--cards", type=int, default=50000)
+    forecast.add_argument("--horizon", type=int, default=365)
+    forecast.add_argument("--runs", type=int, default=4)
+    forecast.add_argument("--repeat", type=int, default=5)
+    forecast.add_argument("--seed", type=int, default=0)
+    forecast.set_defaults(func=bench_forecast)
+
+    logins = subparsers.add_parser("logins", help="Login throughput under concurrency")
+    logins.add_argument("--users", type=int, default=20)
+    logins.add_argument("--attempts", type=int, default=200)
+    logins.add_argument("--threads", type=lambda value: [int(v) for v in value.split(",")], default=[1, 4, 16])
+    logins.set_defaults(func=bench_logins)
+
+    contention = subparsers.add_parser("contention", help="Several processes sharing one SQLite file")
+    contention.add_argument("--processes", type=int, default=4)
+    contention.add_argument("--seconds", type=float, default=5)
+    contention.add_argument("--write-ratio", type=float, default=0.3)
+    contention.add_argument("--busy-timeout-ms", type=int, default=5000)
+    contention.set_defaults(func=bench_contention)
+
+    book = subparsers.add_parser("book", help="Hierarchical mode on a book-length document")
+    book.add_argument("--pages", type=int, default=400)
+    book.add_argument("--max-cards", type=int, default=10, help="Flashcards per section")
+    book.add_argument("--cards-per-chunk", type=int, default=5)
+    book.add_argument("--latency", type=float, default=0.0, help="Seconds per LLM call")
+    book.add_argument("--seed", type=int, default=0)
+    book.set_defaults(func=bench_book)
+
+    decks = subparsers.add_parser("decks", help="Deck export / import throughput and memory")
+    decks.add_argument("--rows", type=int, default=200000)
+    decks.add_argument("--seed", type=int, default=0)
+    decks.set_defaults(func=bench_decks)
+
+    cards = subparsers.add_parser("cards", help="CSV / Anki deck import throughput and memory")
+    cards.add_argument("--cards", type=int, default=100000)
+    cards.add_argument("--seed", type=int, default=0)
+    cards.set_defaults(func=bench_cards)
+
+    office = subparsers.add_parser("office", help="DOCX / PPTX fast path against the Unstructured loaders")
+    office.add_argument("--pages", type=int, default=200, help="Pages of the .docx and slides of the .pptx")
+    office.add_argument("--seed", type=int, default=0)
+    office.set_defaults(func=bench_office)
+
+    queue = subparsers.add_parser("queue", help="Global study queue load and heap operations")
+    queue.add_argument("--cards", type=int, default=50000)
+    queue.add_argument("--searches", type=int, default=50)
+    queue.add_argument("--operations", type=int, default=5000)
+    queue.add_argument("--seed", type=int, default=0)
+    queue.set_defaults(func=bench_queue)
+
+    api = subparsers.add_parser("api", help="Load test of the HTTP API against the Streamlit path")
+    api.add_argument("--users", type=int, default=8)
+    api.add_argument("--cards", type=int, default=500)
+    api.add_argument("--concurrency", type=int, default=16)
+    api.add_argument("--workers", type=int, default=8)
+    api.add_argument("--seconds", type=float, default=5)
+    api.set_defaults(func=bench_api)
+
+    stream = subparsers.add_parser("stream", help="Peak memory of the streaming extraction of a huge PDF")
+    stream.add_argument("--mb", type=int, default=500, help="Size of the synthetic PDF")
+    stream.add_argument("--baseline-mb", type=int, default=20, help="Size of the PDF also run with extract_text (0 to skip)")
+    stream.add_argument("--cards-per-chunk", type=int, default=5)
+    stream.add_argument("--seed", type=int, default=0)
+    stream.set_defaults(func=bench_stream)
+
+    cache = subparsers.add_parser("cache", help="Query cache hit rate and speedup")
+    cache.add_argument("--users", type=int, default=20)
+    cache.add_argument("--cards", type=int, default=2000)
+    cache.add_argument("--reads", type=int, default=2000, help="Reruns, 5 reads each")
+    cache.add_argument("--write-every", type=int, default=20, help="A grade every this many reruns (0: none)")
+    cache.add_argument("--seed", type=int, default=0)
+    cache.set_defaults(func=bench_cache)
+
+    incremental = subparsers.add_parser("incremental", help="Re-upload of a revised document: tokens saved")
+    incremental.add_argument("--pages", type=int, default=200)
+    incremental.add_argument("--edits", type=int, default=10, help="Paragraphs rewritten in the revised version")
+    incremental.add_argument("--cards-per-chunk", type=int, default=5)
+    incremental.add_argument("--seed", type=int, default=0)
+    incremental.set_defaults(func=bench_incremental)
+
+    normalize = subparsers.add_parser("normalize", help="Text normalization throughput and tokens saved")
+    normalize.add_argument("--pages", type=int, default=2000)
+    normalize.add_argument("--repeat", type=int, default=3)
+    normalize.add_argument("--seed", type=int, default=0)
+    normalize.set_defaults(func=bench_normalize)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
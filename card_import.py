@@ -0,0 +1,173 @@
+import csv
+import html
+import io
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime
+from itertools import chain, islice
+import zstandard
+from db_services import bulk_insert_study_log, query_flashcards
+import tracing
+
+# Cards parsed and inserted per transaction at a time
+BATCH_SIZE = 5000
+# File extensions imported as ready made cards, without the LLM
+DECK_EXTENSIONS = ('csv', 'tsv', 'apkg')
+# Header cells recognized as the front / back of a card, skipped when found in the first row
+HEADER_NAMES = {'front', 'back', 'question', 'answer', 'name', 'definition', 'term', 'key_concepts', 'flashcardname', 'flashcardtext'}
+
+HTML_TAG = re.compile(r'<[^>]+>')
+LINE_BREAK = re.compile(r'<br\s*/?>|</div>|</p>', re.IGNORECASE)
+SOUND = re.compile(r'\[sound:[^\]]*\]')
+
+
+def is_deck_file(file_name):
+    return file_name.rsplit('.', 1)[-1].lower() in DECK_EXTENSIONS
+
+
+def strip_html(text):
+    """
+    Converts an Anki field (HTML) to plain text. Escaped markup (&lt;img ...&gt;) comes out as
+    text: render_card_html escapes it again before it is displayed.
+    """
+    text = LINE_BREAK.sub('\n', text)
+    text = SOUND.sub('', HTML_TAG.sub('', text))
+    return html.unescape(text).strip()
+
+
+def iter_csv_cards(file, delimiter=None):
+    """
+    Yields (name, text) pairs from a CSV / TSV file object, one row at a time.
+
+    The first column is the front of the card and the second the back. The delimiter is
+    sniffed from the beginning of the file when not given, and a header row is skipped.
+    """
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    head = list(islice(file, 50))
+    if delimiter is None:
+        sample = ''.join(head)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = '\t' if '\t' in sample else ','
+
+    for i, row in enumerate(csv.reader(chain(head, file), delimiter=delimiter)):
+        if len(row) < 2:
+            continue
+        if i == 0 and row[0].strip().lower() in HEADER_NAMES:
+            continue
+        name, text = row[0].strip(), row[1].strip()
+        if name and text:
+            yield name, text
+
+
+def _open_collection(package, directory):
+    """
+    Extracts the collection database of an .apkg archive into directory and returns its path.
+    Recent Anki versions store a zstd compressed collection.anki21b next to a placeholder collection.anki2.
+    """
+    names = set(package.namelist())
+    path = os.path.join(directory, 'collection.db')
+    for member in ('collection.anki21b', 'collection.anki21', 'collection.anki2'):
+        if member not in names:
+            continue
+        with package.open(member) as source, open(path, 'wb') as target:
+            if member.endswith('b'):
+                zstandard.ZstdDecompressor().copy_stream(source, target)
+            else:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+        return path
+    raise ValueError("Invalid Anki package: no collection found.")
+
+
+def iter_apkg_cards(file):
+    """
+    Yields (name, text) pairs from the notes of an Anki .apkg package: the first field of a
+    note is the front of the card and the second the back, converted from HTML to text.
+    """
+    try:
+        package = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ValueError("Invalid Anki package: not a zip file.")
+    with package, tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(_open_collection(package, directory))
+        try:
+            c = conn.cursor()
+            c.execute('SELECT flds FROM notes ORDER BY id')
+            while True:
+                rows = c.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                for (fields,) in rows:
+                    fields = fields.split('\x1f')
+                    if len(fields) < 2:
+                        continue
+                    name, text = strip_html(fields[0]), strip_html(fields[1])
+                    if name and text:
+                        yield name, text
+        except sqlite3.DatabaseError:
+            raise ValueError("Invalid Anki package: unreadable collection.")
+        finally:
+            conn.close()
+
+
+def iter_deck_cards(file, file_name):
+    """
+    Yields the (name, text) pairs of a CSV, TSV or Anki deck.
+    """
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    if extension == 'apkg':
+        return iter_apkg_cards(file)
+    if extension == 'tsv':
+        return iter_csv_cards(file, delimiter='\t')
+    if extension == 'csv':
+        return iter_csv_cards(file)
+    raise ValueError(f"Unsupported deck format: {extension}")
+
+
+def import_cards(username, search, cards, batch_size=BATCH_SIZE):
+    """
+    Adds (name, text) pairs to the study log of a user under search, with the initial SM-2
+    state of add_flashcard_study (interval 1, ease 2.5, due now).
+
+    Cards whose name already exists in the search, or appears earlier in cards, are skipped.
+    Rows are inserted with executemany, one transaction per batch_size cards.
+
+    Returns
+    -------
+    tuple
+        (inserted, skipped): number of inserted and skipped cards.
+    """
+    now = datetime.now()
+    next_study = now.strftime('%Y-%m-%d %H:%M:%S')
+    due_epoch = int(now.timestamp())
+    seen = {name for name, _ in query_flashcards(username, search)}
+    skipped = 0
+
+    def batches():
+        nonlocal skipped
+        cards_iterator = iter(cards)
+        while True:
+            batch = list(islice(cards_iterator, batch_size))
+            if not batch:
+                break
+            rows = []
+            for name, text in batch:
+                if name in seen:
+                    skipped += 1
+                    continue
+                seen.add(name)
+                rows.append((search, name, text, None, next_study, 1, 2.5, 0, due_epoch))
+            if rows:
+                yield rows
+
+    with tracing.span('import_cards') as import_span:
+        inserted = bulk_insert_study_log(username, batches())
+        import_span.set(cards=inserted, skipped=skipped)
+    tracing.increment('cards_imported_total', inserted)
+    return inserted, skipped
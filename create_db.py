@@ -1,11 +1,13 @@
 import sqlite3
+import db_backend
 
 def create_empty_db():
     # Connect to a local database
     """
     Initializes an SQLite database with the necessary tables for the application.
 
-    This function connects to a local SQLite database ('my_database.db') and creates 
+    This function connects to the SQLite database configured in db_backend
+    (FLASHCARD_DB_PATH, 'my_database.db' by default) and creates 
     the following tables if they do not already exist:
     - users: Stores user information with unique user IDs.
     - usersSearch: Records user searches and associated flashcards with timestamps.
@@ -17,7 +19,7 @@ def create_empty_db():
     After creating the tables, the connection to the database is closed.
     """
 
-    conn = sqlite3.connect('my_database.db')
+    conn = db_backend.connect_sqlite()
     c = conn.cursor()
 
     # Create the user table
@@ -59,10 +61,21 @@ def create_empty_db():
             datetimeNextStudy DATETIME,
             studyInterval REAL,
             easeFactor REAL,
-            reps INTEGER
+            reps INTEGER,
+            dueEpoch INTEGER
         );
     ''')
 
+    # Indexes of the study queries (see db_services.migrate_study_log)
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_study_log_due
+        ON flashcardStudyLog(userName, selectedSearch, dueEpoch);
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_study_log_card
+        ON flashcardStudyLog(userName, selectedSearch, flashcardName);
+    ''')
+
     # Table for documents
     c.execute('''
         CREATE TABLE IF NOT EXISTS userDocuments(
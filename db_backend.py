@@ -0,0 +1,201 @@
+import functools
+import os
+import queue
+import sqlite3
+import threading
+
+# SQLAlchemy URL of the database, e.g. sqlite:////data/my_database.db or postgresql://user@host/db
+DATABASE_URL = os.getenv("FLASHCARD_DATABASE_URL")
+# Path of the SQLite database file, used when DATABASE_URL is not set
+DB_PATH = os.getenv("FLASHCARD_DB_PATH", "my_database.db")
+# How long a connection waits for a lock held by another process before failing
+BUSY_TIMEOUT_MS = int(os.getenv("FLASHCARD_DB_BUSY_TIMEOUT_MS", "5000"))
+# WAL lets readers and one writer work at the same time, across processes on the same host
+JOURNAL_MODE = os.getenv("FLASHCARD_DB_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.getenv("FLASHCARD_DB_SYNCHRONOUS", "NORMAL")
+# Idle connections kept open per database file and reused by connect(); 0 opens a connection per call
+POOL_SIZE = int(os.getenv("FLASHCARD_DB_POOL_SIZE", "0"))
+
+_initialized_paths = set()
+_initialized_lock = threading.Lock()
+_pools = {}
+_pools_lock = threading.Lock()
+# Pool size of the connections opened by the current thread, overriding POOL_SIZE (see use_pool)
+_thread_settings = threading.local()
+
+
+def is_sqlite_url(url):
+    return url is None or url.startswith("sqlite")
+
+
+def sqlite_path(url=DATABASE_URL, default=DB_PATH):
+    """
+    Returns the SQLite file path of a sqlite:/// URL, or default when there is no URL.
+    """
+    if url is None:
+        return default
+    if not is_sqlite_url(url):
+        raise ValueError(f"{url} is not a SQLite URL.")
+    path = url.split("://", 1)[1]
+    # sqlite:///relative.db -> relative.db, sqlite:////absolute.db -> /absolute.db
+    return path[1:] if path.startswith("/") else path
+
+
+def configure_sqlite(conn, path):
+    """
+    Applies the per connection pragmas, and the journal mode once per database file.
+    """
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    with _initialized_lock:
+        if path in _initialized_paths or path == ":memory:":
+            return
+        # The journal mode is stored in the database file, so it only needs to be set once
+        try:
+            conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        except sqlite3.OperationalError:
+            # Another process holds a lock; it will be retried on the next connection
+            return
+        _initialized_paths.add(path)
+
+
+def connect_sqlite(path=None, factory=sqlite3.Connection, **kwargs):
+    """
+    Opens a SQLite connection configured for several processes sharing the same file.
+    """
+    path = path or sqlite_path()
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, factory=factory, **kwargs)
+    configure_sqlite(conn, path)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Keeps up to size idle connections to a SQLite file, so the threads serving requests
+    do not pay for opening a connection and setting its pragmas on every query.
+
+    The connections of the factory class must give themselves back with release() when
+    closed (see db_services.TracedConnection). Uncommitted work is rolled back on release.
+    A connection closed twice is only given back once: otherwise two threads would get it.
+    """
+
+    def __init__(self, path, factory, size):
+        self.path = path
+        self.factory = factory
+        self.idle = queue.LifoQueue(maxsize=size)
+        # ids of the connections in idle
+        self.idle_ids = set()
+        self.lock = threading.Lock()
+        self.stats = {"opened": 0, "reused": 0, "double_releases": 0}
+
+    def acquire(self):
+        try:
+            with self.lock:
+                conn = self.idle.get_nowait()
+                self.idle_ids.discard(id(conn))
+                self.stats["reused"] += 1
+        except queue.Empty:
+            # Pooled connections move between the threads of the server
+            conn = connect_sqlite(self.path, factory=self.factory, check_same_thread=False)
+            conn.pool = self
+            self.stats["opened"] += 1
+        return conn
+
+    def release(self, conn):
+        with self.lock:
+            if id(conn) in self.idle_ids:
+                self.stats["double_releases"] += 1
+                return
+            try:
+                conn.rollback()
+                self.idle.put_nowait(conn)
+                self.idle_ids.add(id(conn))
+                return
+            except (queue.Full, sqlite3.Error):
+                pass
+        conn.pool = None
+        conn.close()
+
+    def close(self):
+        while True:
+            try:
+                with self.lock:
+                    conn = self.idle.get_nowait()
+                    self.idle_ids.discard(id(conn))
+            except queue.Empty:
+                return
+            conn.pool = None
+            conn.close()
+
+
+def get_pool(path, factory, size=None):
+    """
+    Returns the shared ConnectionPool of a database file and connection class.
+    """
+    key = (path, factory)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(path, factory, size or POOL_SIZE)
+        return _pools[key]
+
+
+def use_pool(size):
+    """
+    Makes connect() give the calling thread connections from a pool of the given size, whatever
+    POOL_SIZE is. Meant as the initializer of worker threads (the API server), so that pooling
+    does not change for the other threads of the process.
+    """
+    _thread_settings.pool_size = size
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine(url=None):
+    """
+    Returns a pooled SQLAlchemy engine for DATABASE_URL (or the SQLite file).
+
+    Useful for tools that work with SQLAlchemy or a server database. db_services itself
+    runs SQLite SQL on sqlite3 connections (see create_connection).
+    """
+    from sqlalchemy import create_engine, event
+
+    url = url or DATABASE_URL or f"sqlite:///{DB_PATH}"
+    engine = create_engine(url, pool_pre_ping=True)
+    if is_sqlite_url(url):
+        path = sqlite_path(url)
+
+        @event.listens_for(engine, "connect")
+        def _configure(dbapi_connection, connection_record):
+            configure_sqlite(dbapi_connection, path)
+
+    return engine
+
+
+def connect(path=None, factory=sqlite3.Connection):
+    """
+    Returns a DB-API connection for db_services.
+
+    Parameters
+    ----------
+    path : str
+        SQLite file, overriding DATABASE_URL / DB_PATH.
+    factory : type
+        sqlite3.Connection subclass to use. When POOL_SIZE (or use_pool) is set, it must support pooling
+        (a pool attribute and a close() calling pool.release, see ConnectionPool).
+    """
+    if path is None and not is_sqlite_url(DATABASE_URL):
+        raise ValueError(
+            "db_services uses SQLite SQL: FLASHCARD_DATABASE_URL must be a sqlite:/// URL. "
+            "Use db_backend.get_engine() to access a server database."
+        )
+    pool_size = getattr(_thread_settings, "pool_size", None) or POOL_SIZE
+    if pool_size > 0:
+        return get_pool(path or sqlite_path(), factory, pool_size).acquire()
+    return connect_sqlite(path or sqlite_path(), factory=factory)
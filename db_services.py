@@ -1,32 +1,182 @@
 import sqlite3
+import base64
 import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pandas as pd
+import tracing
+import sql_profiler
+import db_backend
+from query_cache import cached_read, invalidate_user
+
+# Path of the SQLite database file, overriding FLASHCARD_DB_PATH / FLASHCARD_DATABASE_URL (see db_backend.py)
+# when set. The configured database is only resolved by create_connection, so importing this
+# module never fails on a FLASHCARD_DATABASE_URL it cannot use
+DB_PATH = None
+
+# ------------------ Query Tracing ------------------
+def statement_name(query):
+    """
+    Returns a short label for a SQL statement, e.g. 'SELECT flashcardStudyLog'.
+    """
+    verb = query.split(None, 1)[0].upper() if query.strip() else ''
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?|ON)\s+(\w+)', query, re.IGNORECASE)
+    return f"{verb} {table.group(1)}" if table else verb
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    Cursor recording the duration of every statement in the tracing layer,
+    and in the SQL profiler when it is enabled (see sql_profiler.py).
+    """
+    def execute(self, sql, parameters=()):
+        with tracing.span('sql', root=False, statement=statement_name(sql)):
+            start = time.perf_counter()
+            result = super().execute(sql, parameters)
+            if sql_profiler.ENABLED:
+                sql_profiler.record(self.connection, sql, parameters, time.perf_counter() - start)
+            return result
+
+    def executemany(self, sql, seq_of_parameters):
+        with tracing.span('sql', root=False, statement=statement_name(sql)):
+            start = time.perf_counter()
+            result = super().executemany(sql, seq_of_parameters)
+            if sql_profiler.ENABLED:
+                sql_profiler.record(self.connection, sql, None, time.perf_counter() - start)
+            return result
+
+class TracedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors are TracedCursor instances.
+    When it comes from a pool (db_backend.POOL_SIZE or use_pool), close() gives it back.
+    """
+    pool = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
 
 # Function to create a connection to SQLite
 def create_connection():
     """
-    Creates and returns a connection to the local SQLite database (my_database.db).
+    Creates and returns a connection to the SQLite database (DB_PATH, or the database configured
+    in db_backend, my_database.db by default), in WAL mode with a busy timeout so several processes
+    can share it. Raises ValueError when FLASHCARD_DATABASE_URL is not a SQLite URL.
     """
-    conn = sqlite3.connect('my_database.db')
+    conn = db_backend.connect(DB_PATH, factory=TracedConnection)
     return conn
 
 # ------------------ Security and Hashing ------------------
-def make_hashes(password):
+# scrypt cost parameters (~16 MB and a few tens of ms per hash)
+SCRYPT_N = int(os.getenv('FLASHCARD_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+# Maximum number of password hashes computed at the same time. The callers still wait for their
+# hash: the pool caps the CPU and memory taken by concurrent logins, it does not make them asynchronous
+KDF_WORKERS = int(os.getenv('FLASHCARD_KDF_WORKERS', '4'))
+# Seconds a successful login is remembered, so repeated logins skip the KDF and the DB
+LOGIN_CACHE_TTL = float(os.getenv('FLASHCARD_LOGIN_CACHE_TTL', '300'))
+
+_kdf_pool = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='kdf')
+_login_cache = {}
+_login_cache_lock = threading.Lock()
+# Key of the login cache digests, never stored: cached entries are useless outside this process
+_login_cache_key = secrets.token_bytes(32)
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=2 * 128 * r * (n + p + 2))
+
+def legacy_hash(password):
     """
-    Generates a SHA-256 hash from a string (password).
+    Unsalted SHA-256 hash used by older accounts, only kept to migrate them.
     """
     return hashlib.sha256(str.encode(password)).hexdigest()
 
+def make_hashes(password):
+    """
+    Generates a salted scrypt hash of a password, formatted as
+    scrypt$n$r$p$salt$hash (salt and hash in base64).
+    The KDF runs in the bounded worker pool (at most KDF_WORKERS at a time) and the caller
+    blocks until it is done.
+    """
+    salt = os.urandom(16)
+    digest = _kdf_pool.submit(_scrypt, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P).result()
+    return '$'.join([
+        'scrypt', str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+    ])
+
+def verify_password(password, hashed_text):
+    """
+    Checks a password against a stored hash (scrypt or legacy SHA-256).
+    Returns (matches, needs_rehash): needs_rehash is True when the password matches
+    a legacy hash or a scrypt hash with outdated parameters.
+    Like make_hashes, blocks the caller while the KDF runs in the bounded worker pool.
+    """
+    if not hashed_text:
+        return False, False
+    if not hashed_text.startswith('scrypt$'):
+        matches = hmac.compare_digest(legacy_hash(password), hashed_text)
+        return matches, matches
+    try:
+        _, n, r, p, salt, digest = hashed_text.split('$')
+        n, r, p = int(n), int(r), int(p)
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return False, False
+    computed = _kdf_pool.submit(_scrypt, password, salt, n, r, p).result()
+    matches = hmac.compare_digest(computed, digest)
+    return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
 def check_hashes(password, hashed_text):
     """
-    Compares the hash of a password with the stored hash.
+    Compares a password with the stored hash.
     Returns the hash if they match or False otherwise.
     """
-    if make_hashes(password) == hashed_text:
+    if verify_password(password, hashed_text)[0]:
         return hashed_text
     return False
 
+def _login_cache_digest(username, password):
+    return hmac.new(_login_cache_key, f'{username}\0{password}'.encode(), hashlib.sha256).digest()
+
+def _login_cache_check(username, password):
+    """
+    Returns True if the same credentials were verified less than LOGIN_CACHE_TTL seconds ago.
+    """
+    with _login_cache_lock:
+        entry = _login_cache.get(username)
+    if entry is None or entry[1] < time.monotonic():
+        return False
+    return hmac.compare_digest(entry[0], _login_cache_digest(username, password))
+
+def _login_cache_store(username, password):
+    if LOGIN_CACHE_TTL <= 0:
+        return
+    with _login_cache_lock:
+        _login_cache[username] = (_login_cache_digest(username, password), time.monotonic() + LOGIN_CACHE_TTL)
+
+def invalidate_login_cache(username=None):
+    """
+    Forgets the cached logins of a user (or of every user).
+    """
+    with _login_cache_lock:
+        if username is None:
+            _login_cache.clear()
+        else:
+            _login_cache.pop(username, None)
+
 # ------------------ Table Creation ------------------
 def create_tables():
     """
@@ -71,9 +221,60 @@ def create_tables():
             datetimeNextStudy DATETIME,
             studyInterval REAL,
             easeFactor REAL,
-            reps INTEGER
+            reps INTEGER,
+            dueEpoch INTEGER
+        );
+    ''')
+
+    # Chunks of the documents already sent to the model, with the names of the flashcards
+    # extracted from them (JSON list), see incremental.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS documentChunks(
+            userName TEXT NOT NULL,
+            selectedSearch TEXT NOT NULL,
+            chunkHash TEXT NOT NULL,
+            flashcardNames TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            createdAt DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (userName, selectedSearch, chunkHash)
+        );
+    ''')
+
+    # Flashcards whose chunks were removed from a new version of their document: they are not
+    # scheduled anymore (get_flashcards_study, get_due_cards_all, get_due_counts)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS staleFlashcards(
+            userName TEXT NOT NULL,
+            selectedSearch TEXT NOT NULL,
+            flashcardName TEXT NOT NULL,
+            PRIMARY KEY (userName, selectedSearch, flashcardName)
+        );
+    ''')
+
+    # Secrets shared by the replicas of the API server (the key signing the login tokens), see api_server.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS apiSecrets(
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    ''')
+
+    # Generation jobs of the API server, visible to every replica. heartbeat (epoch seconds) is
+    # refreshed by the replica running the job: a job without heartbeat is taken over by another one
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS apiJobs(
+            jobId TEXT PRIMARY KEY,
+            userName TEXT NOT NULL,
+            selectedSearch TEXT NOT NULL,
+            sourceText TEXT,
+            status TEXT NOT NULL,
+            flashcards INTEGER NOT NULL DEFAULT 0,
+            failedChunks INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            heartbeat INTEGER NOT NULL
         );
     ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_api_jobs_heartbeat ON apiJobs(status, heartbeat)')
 
     # Table to store uploaded documents (e.g., PDFs)
     c.execute('''
@@ -85,33 +286,68 @@ def create_tables():
         );
     ''')
 
+    migrate_study_log(conn)
+
     conn.commit()
     conn.close()
+    # Migrations rewrite rows, and benchmarks point DB_PATH to another file before calling this
+    invalidate_user()
 
-# ------------------ User Functions ------------------
-def add_userdata(username, password):
+def migrate_study_log(conn):
     """
-    Adds a user to the 'users' table.
+    Brings an existing flashcardStudyLog table up to date:
+    - adds the dueEpoch column and fills it from datetimeNextStudy;
+    - creates the indexes used by the study queries.
+
+    dueEpoch (Unix epoch seconds) is only set on the latest row of each flashcard,
+    so counting due cards is a range scan of idx_study_log_due.
     """
-    conn = create_connection()
     c = conn.cursor()
-    hashed_password = make_hashes(password)
-    c.execute('INSERT INTO users(userName, userPassword) VALUES (?, ?)', (username, hashed_password))
+    c.execute('PRAGMA table_info(flashcardStudyLog)')
+    columns = [row[1] for row in c.fetchall()]
+    if 'dueEpoch' not in columns:
+        c.execute('ALTER TABLE flashcardStudyLog ADD COLUMN dueEpoch INTEGER')
+        # datetimeNextStudy holds local times; the row kept is the one with the latest due date
+        c.execute('''
+            UPDATE flashcardStudyLog
+            SET dueEpoch = CAST(strftime('%s', datetimeNextStudy, 'utc') AS INTEGER)
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, MAX(datetimeNextStudy)
+                    FROM flashcardStudyLog
+                    WHERE datetimeNextStudy IS NOT NULL
+                    GROUP BY userName, selectedSearch, flashcardName
+                )
+            )
+        ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_study_log_due
+        ON flashcardStudyLog(userName, selectedSearch, dueEpoch)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_study_log_card
+        ON flashcardStudyLog(userName, selectedSearch, flashcardName)
+    ''')
     conn.commit()
-    conn.close()
 
-def login_user(username, password):
+_migrated_paths = set()
+
+def migrate_database():
     """
-    Checks if a user with the provided username and password exists.
-    Returns the user data if exists, or an empty list otherwise.
+    Creates the tables and runs the migrations, once per process and database file.
     """
-    conn = create_connection()
-    c = conn.cursor()
-    hashed_password = make_hashes(password)
-    c.execute('SELECT * FROM users WHERE userName = ? AND userPassword = ?', (username, hashed_password))
-    data = c.fetchall()
-    conn.close()
-    return data
+    if DB_PATH in _migrated_paths:
+        return
+    create_tables()
+    _migrated_paths.add(DB_PATH)
+
+def due_cutoff_epoch(now=None):
+    """
+    Returns the epoch of the start of tomorrow (local time): cards due before it are due today.
+    """
+    today = (now or datetime.now()).date()
+    return int(datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp())
 
 # ------------------ Search and Flashcard Functions ------------------
 def add_usersearch(username, search, flashcard_name, flashcard_text, timestamp):
@@ -132,6 +368,7 @@ def add_usersearch(username, search, flashcard_name, flashcard_text, timestamp):
     conn.commit()
     conn.close()
 
+@cached_read
 def query_searches_flashcards(username):
     """
     Returns distinct searches that already have flashcards studied by the user.
@@ -147,6 +384,7 @@ def query_searches_flashcards(username):
     conn.close()
     return data
 
+@cached_read
 def query_flashcards(username, search):
     """
     Returns a list of flashcards (flashcardName and flashcardText) for a specific user search.
@@ -191,7 +429,8 @@ def add_flashcard_study(username, selected_search, flashcard_name, flashcard_tex
 
     # 2. If it does not exist, insert it with initial datetimeNextStudy as now
     initial_datetime_now = None
-    initial_next_study_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Due immediately
+    now = datetime.now()
+    initial_next_study_date = now.strftime('%Y-%m-%d %H:%M:%S')  # Due immediately
     insert_query = """
     INSERT INTO flashcardStudyLog (
         userName,
@@ -202,9 +441,10 @@ def add_flashcard_study(username, selected_search, flashcard_name, flashcard_tex
         datetimeNextStudy,
         studyInterval,
         easeFactor,
-        reps
+        reps,
+        dueEpoch
     )
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """
     c.execute(insert_query, (
         username, 
@@ -215,18 +455,22 @@ def add_flashcard_study(username, selected_search, flashcard_name, flashcard_tex
         initial_next_study_date,  # Set nextStudyDate to now
         1, 
         2.5, 
-        0
+        0,
+        int(now.timestamp())
     ))
     
     conn.commit()
     conn.close()
+    invalidate_user(username)
     return True
 
-def get_flashcards_study(username, selected_search):
+def get_flashcards_study(username, selected_search, limit=None):
     """
     Returns the list of flashcards ready for study:
-    - Have not been studied today;
-    - Ordered by the number of repetitions (ASC).
+    - Due today or earlier (latest dueEpoch before the start of tomorrow);
+    - Not flagged as stale (see get_stale_flashcards);
+    - Ordered by the number of repetitions (ASC);
+    - At most limit flashcards when limit is given.
     """
     conn = create_connection()
     c = conn.cursor()
@@ -243,22 +487,141 @@ def get_flashcards_study(username, selected_search):
     WHERE 
         userName = ?
         AND selectedSearch = ?
-        AND DATE(datetimeNextStudy) <= DATETIME('now', 'localtime', '-1 minute')
-        AND flashcardName NOT IN (
+        AND datetimeNextStudy IS NOT NULL
+        AND flashcardName IN (
             SELECT flashcardName 
             FROM flashcardStudyLog
-            WHERE DATE(datetimeNextStudy) > DATETIME('now', 'localtime')
+            WHERE userName = ?
+              AND selectedSearch = ?
+              AND dueEpoch < ?
+        )
+        AND flashcardName NOT IN (
+            SELECT flashcardName
+            FROM staleFlashcards
+            WHERE userName = ?
+              AND selectedSearch = ?
         )
     GROUP BY 
         flashcardName
     ORDER BY 
-        current_reps ASC;
+        current_reps ASC
+    LIMIT ?;
     """
-    c.execute(query, (username, selected_search))
+    c.execute(query, (
+        username, selected_search, username, selected_search, due_cutoff_epoch(),
+        username, selected_search, -1 if limit is None else limit
+    ))
     flashcards = c.fetchall()
     conn.close()
     return flashcards
 
+def get_flashcard_state(username, selected_search, flashcard_name):
+    """
+    Returns the get_flashcards_study tuple of one flashcard
+    (flashcardName, flashcardText, lastStudied, studyInterval, easeFactor, current_reps), or None.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT
+            flashcardName,
+            MAX(flashcardText),
+            MAX(datetimeLastStudy),
+            MAX(studyInterval),
+            MAX(easeFactor),
+            COUNT(*)
+        FROM flashcardStudyLog
+        WHERE userName = ?
+          AND selectedSearch = ?
+          AND flashcardName = ?
+        GROUP BY flashcardName
+    ''', (username, selected_search, flashcard_name))
+    row = c.fetchone()
+    conn.close()
+    return row
+
+@cached_read
+def get_due_counts(username):
+    """
+    Returns a dict {selectedSearch: number of flashcards due today} for all the user's searches,
+    counted on idx_study_log_due.
+
+    Stale flashcards are not counted: their due rows are counted from staleFlashcards and
+    subtracted, so the main count stays on the covering index. Both counts are made by one
+    statement, on the same snapshot of the database: a card flagged stale by a concurrent
+    write is either in both or in none.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    cutoff = due_cutoff_epoch()
+    c.execute('''
+        SELECT selectedSearch, SUM(due)
+        FROM (
+            SELECT selectedSearch, COUNT(*) AS due
+            FROM flashcardStudyLog
+            WHERE userName = ?
+              AND dueEpoch < ?
+            GROUP BY selectedSearch
+            UNION ALL
+            SELECT stale.selectedSearch, -COUNT(*)
+            FROM staleFlashcards AS stale
+            CROSS JOIN flashcardStudyLog AS due
+              ON due.userName = stale.userName
+             AND due.selectedSearch = stale.selectedSearch
+             AND due.flashcardName = stale.flashcardName
+            WHERE stale.userName = ?
+              AND due.dueEpoch < ?
+            GROUP BY stale.selectedSearch
+        )
+        GROUP BY selectedSearch
+        HAVING SUM(due) > 0
+    ''', (username, cutoff, username, cutoff))
+    counts = dict(c.fetchall())
+    conn.close()
+    return counts
+
+def get_due_cards_all(username):
+    """
+    Returns the flashcards due today in all the user's searches, as tuples
+    (selectedSearch, flashcardName, flashcardText, lastStudied, studyInterval, easeFactor, current_reps, dueEpoch,
+    lastStudiedEpoch), with the same per card values as get_flashcards_study. Stale flashcards are left out.
+
+    The due rows are found on idx_study_log_due and joined with the history of their card on
+    idx_study_log_card. CROSS JOIN fixes that join order, and the GROUP BY follows idx_study_log_due
+    so no temporary B-tree is needed.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT
+            due.selectedSearch,
+            due.flashcardName,
+            due.flashcardText,
+            MAX(log.datetimeLastStudy) AS lastStudied,
+            MAX(log.studyInterval) AS studyInterval,
+            MAX(log.easeFactor) AS easeFactor,
+            COUNT(*) AS current_reps,
+            due.dueEpoch,
+            CAST(strftime('%s', MAX(log.datetimeLastStudy), 'utc') AS INTEGER) AS lastStudiedEpoch
+        FROM flashcardStudyLog AS due
+        CROSS JOIN flashcardStudyLog AS log
+          ON log.userName = due.userName
+         AND log.selectedSearch = due.selectedSearch
+         AND log.flashcardName = due.flashcardName
+        WHERE due.userName = ?
+          AND due.dueEpoch < ?
+          AND NOT EXISTS (
+              SELECT 1 FROM staleFlashcards AS stale
+              WHERE stale.userName = due.userName
+                AND stale.selectedSearch = due.selectedSearch
+                AND stale.flashcardName = due.flashcardName
+          )
+        GROUP BY due.selectedSearch, due.dueEpoch, due.id
+    ''', (username, due_cutoff_epoch()))
+    cards = c.fetchall()
+    conn.close()
+    return cards
+
 def update_flashcard_study(username, selected_search, flashcard_name, flashcard_text, grade, current_interval, current_ease_factor, current_reps):
     """
     Updates the study log of a flashcard by calculating new intervals and ease factors.
@@ -284,7 +647,18 @@ def update_flashcard_study(username, selected_search, flashcard_name, flashcard_
     new_ease_factor = max(1.3, current_ease_factor * ease_delta[grade])
     
     # Next study date
-    new_due_date = datetime.now() + timedelta(days=new_interval)
+    now = datetime.now()
+    new_due_date = now + timedelta(days=new_interval)
+
+    # Only the latest row of a flashcard holds its due date
+    c.execute("""
+    UPDATE flashcardStudyLog
+    SET dueEpoch = NULL
+    WHERE userName = ?
+      AND selectedSearch = ?
+      AND flashcardName = ?
+      AND dueEpoch IS NOT NULL;
+    """, (username, selected_search, flashcard_name))
 
     query = """
     INSERT INTO flashcardStudyLog (
@@ -296,23 +670,26 @@ def update_flashcard_study(username, selected_search, flashcard_name, flashcard_
         datetimeNextStudy,
         studyInterval, 
         easeFactor, 
-        reps
+        reps,
+        dueEpoch
     )
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """
     c.execute(query, (
         username, 
         selected_search, 
         flashcard_name, 
         flashcard_text,
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        new_due_date, 
+        now.strftime('%Y-%m-%d %H:%M:%S'),
+        new_due_date.strftime('%Y-%m-%d %H:%M:%S'), 
         new_interval, 
         new_ease_factor, 
-        current_reps
+        current_reps,
+        int(new_due_date.timestamp())
     ))
     conn.commit()
     conn.close()
+    invalidate_user(username)
 
 def insert_study_log(username, selected_search, flashcard_name, flashcard_text):
     """
@@ -332,6 +709,265 @@ def insert_study_log(username, selected_search, flashcard_name, flashcard_text):
     c.execute(insert_query, (username, selected_search, flashcard_name, flashcard_text))
     conn.commit()
     conn.close()
+    invalidate_user(username)
+
+def update_flashcard_text(username, selected_search, flashcard_name, flashcard_text):
+    """
+    Replaces the text of a flashcard in all its study log rows, keeping its schedule.
+    Returns True if the text changed.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE flashcardStudyLog
+        SET flashcardText = ?
+        WHERE userName = ?
+          AND selectedSearch = ?
+          AND flashcardName = ?
+          AND flashcardText != ?
+    ''', (flashcard_text, username, selected_search, flashcard_name, flashcard_text))
+    changed = c.rowcount > 0
+    conn.commit()
+    conn.close()
+    if changed:
+        invalidate_user(username)
+    return changed
+
+# Columns of a study log row, as exported and imported by deck_io.py (the userName is not part of a deck)
+STUDY_LOG_COLUMNS = (
+    'selectedSearch', 'flashcardName', 'flashcardText', 'datetimeLastStudy', 'datetimeNextStudy',
+    'studyInterval', 'easeFactor', 'reps', 'dueEpoch'
+)
+
+def iter_study_log(username, batch_size=10000):
+    """
+    Yields the study log rows of a user (STUDY_LOG_COLUMNS tuples) in lists of at most batch_size,
+    oldest first, so the whole history of a user is never held in memory.
+    """
+    conn = create_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT {', '.join(STUDY_LOG_COLUMNS)}
+            FROM flashcardStudyLog
+            WHERE userName = ?
+            ORDER BY id
+        ''', (username,))
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def bulk_insert_study_log(username, batches):
+    """
+    Inserts lists of STUDY_LOG_COLUMNS tuples for a user, one transaction per list,
+    so a large import neither holds the write lock for long nor loses everything on failure.
+    Returns the number of inserted rows.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    insert_query = f'''
+        INSERT INTO flashcardStudyLog (userName, {', '.join(STUDY_LOG_COLUMNS)})
+        VALUES (?, {', '.join('?' * len(STUDY_LOG_COLUMNS))})
+    '''
+    inserted = 0
+    try:
+        for rows in batches:
+            c.executemany(insert_query, ((username, *row) for row in rows))
+            conn.commit()
+            invalidate_user(username)
+            inserted += len(rows)
+    finally:
+        conn.close()
+    return inserted
+
+# ------------------ Document Chunks ------------------
+def has_document_chunks(username, search):
+    """
+    Checks if chunks of a document were recorded: a previous version was processed incrementally.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM documentChunks WHERE userName = ? AND selectedSearch = ? LIMIT 1', (username, search))
+    found = c.fetchone() is not None
+    conn.close()
+    return found
+
+def get_document_chunks(username, search):
+    """
+    Returns {chunkHash: (flashcard names, tokens)} for the chunks of a document already sent to the model.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT chunkHash, flashcardNames, tokens
+        FROM documentChunks
+        WHERE userName = ? AND selectedSearch = ?
+    ''', (username, search))
+    chunks = {chunk_hash: (json.loads(names), tokens) for chunk_hash, names, tokens in c.fetchall()}
+    conn.close()
+    return chunks
+
+def update_document_chunks(username, search, added, removed):
+    """
+    Records the chunks of a new version of a document in one transaction:
+    added is a list of (chunkHash, flashcard names, tokens), removed a list of chunk hashes.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.executemany('''
+        INSERT OR REPLACE INTO documentChunks(userName, selectedSearch, chunkHash, flashcardNames, tokens)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(username, search, chunk_hash, json.dumps(names), tokens) for chunk_hash, names, tokens in added])
+    c.executemany(
+        'DELETE FROM documentChunks WHERE userName = ? AND selectedSearch = ? AND chunkHash = ?',
+        [(username, search, chunk_hash) for chunk_hash in removed]
+    )
+    conn.commit()
+    conn.close()
+
+def set_stale_flashcards(username, search, stale, current):
+    """
+    Flags the stale flashcard names of a document and clears the flag of the current ones
+    (a flashcard extracted again from a new chunk is not stale anymore).
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.executemany(
+        'INSERT OR IGNORE INTO staleFlashcards(userName, selectedSearch, flashcardName) VALUES (?, ?, ?)',
+        [(username, search, name) for name in stale]
+    )
+    c.executemany(
+        'DELETE FROM staleFlashcards WHERE userName = ? AND selectedSearch = ? AND flashcardName = ?',
+        [(username, search, name) for name in current]
+    )
+    conn.commit()
+    conn.close()
+    invalidate_user(username)
+
+@cached_read
+def get_stale_flashcards(username, search):
+    """
+    Returns the names of the flashcards of a document flagged as stale.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT flashcardName
+        FROM staleFlashcards
+        WHERE userName = ? AND selectedSearch = ?
+        ORDER BY flashcardName
+    ''', (username, search))
+    names = [name for (name,) in c.fetchall()]
+    conn.close()
+    return names
+
+# ------------------ API Secrets and Jobs ------------------
+def get_api_secret(name):
+    """
+    Returns the secret stored under name, created (random) by the first replica asking for it.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('INSERT OR IGNORE INTO apiSecrets(name, value) VALUES (?, ?)', (name, secrets.token_hex(32)))
+    conn.commit()
+    c.execute('SELECT value FROM apiSecrets WHERE name = ?', (name,))
+    (value,) = c.fetchone()
+    conn.close()
+    return value
+
+# Columns of a job as returned by get_api_job
+API_JOB_COLUMNS = ('jobId', 'userName', 'selectedSearch', 'status', 'flashcards', 'failedChunks', 'error')
+
+def add_api_job(job_id, username, search, text):
+    """
+    Records a queued generation job, with the text to generate from.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO apiJobs(jobId, userName, selectedSearch, sourceText, status, heartbeat)
+        VALUES (?, ?, ?, ?, 'queued', ?)
+    ''', (job_id, username, search, text, int(time.time())))
+    conn.commit()
+    conn.close()
+
+def get_api_job(job_id):
+    """
+    Returns a job as a dict (API_JOB_COLUMNS), or None.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute(f'SELECT {", ".join(API_JOB_COLUMNS)} FROM apiJobs WHERE jobId = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(zip(API_JOB_COLUMNS, row)) if row else None
+
+def update_api_job(job_id, status, flashcards=0, failed_chunks=0, error=None):
+    """
+    Sets the status of a job. The text of a finished job ("done" or "failed") is dropped.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE apiJobs
+        SET status = ?, flashcards = ?, failedChunks = ?, error = ?, heartbeat = ?,
+            sourceText = CASE WHEN ? IN ('done', 'failed') THEN NULL ELSE sourceText END
+        WHERE jobId = ?
+    ''', (status, flashcards, failed_chunks, error, int(time.time()), status, job_id))
+    conn.commit()
+    conn.close()
+
+def touch_api_jobs(job_ids):
+    """
+    Refreshes the heartbeat of the jobs run by this replica.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    now = int(time.time())
+    c.executemany('UPDATE apiJobs SET heartbeat = ? WHERE jobId = ?', [(now, job_id) for job_id in job_ids])
+    conn.commit()
+    conn.close()
+
+def claim_orphaned_api_jobs(stale_before):
+    """
+    Takes over the queued or running jobs whose heartbeat is older than stale_before (epoch
+    seconds): their replica stopped. Returns the claimed jobs as (jobId, userName, selectedSearch,
+    sourceText) tuples; a job is only claimed by one replica.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT jobId, userName, selectedSearch, sourceText, heartbeat
+        FROM apiJobs
+        WHERE status IN ('queued', 'running') AND heartbeat < ?
+    ''', (stale_before,))
+    claimed = []
+    now = int(time.time())
+    for job_id, username, search, text, heartbeat in c.fetchall():
+        # The heartbeat read is part of the condition: another replica claiming it first changes it
+        c.execute('''
+            UPDATE apiJobs SET status = 'queued', heartbeat = ?
+            WHERE jobId = ? AND heartbeat = ? AND status IN ('queued', 'running')
+        ''', (now, job_id, heartbeat))
+        conn.commit()
+        if c.rowcount:
+            claimed.append((job_id, username, search, text))
+    conn.close()
+    return claimed
+
+def delete_finished_api_jobs(finished_before):
+    """
+    Deletes the jobs finished before finished_before (epoch seconds).
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM apiJobs WHERE status IN ('done', 'failed') AND heartbeat < ?", (finished_before,))
+    conn.commit()
+    conn.close()
 
 # ------------------ Function to Store File in DB ------------------
 def store_document(username, file_name, file_content):
@@ -369,41 +1005,59 @@ def create_usertable():
     conn.commit()
     conn.close()
 
-def make_hashes(password: str) -> str:
-    """
-    Returns the SHA-256 hash of the provided password string.
-    """
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def add_userdata(username, password):
     """
-    Adds a new user to the 'users' table (unique username, userPassword hashed).
+    Adds a new user to the 'users' table (unique username, userPassword hashed with scrypt).
     """
+    hashed_password = make_hashes(password)
+
     conn = create_connection()
     c = conn.cursor()
-
-    hashed_password = make_hashes(password)
     c.execute('INSERT INTO users(userName, userPassword) VALUES (?, ?)', (username, hashed_password))
 
     conn.commit()
     conn.close()
+    invalidate_login_cache(username)
+    invalidate_user(username)
 
 def login_user(username, password):
     """
-    Checks if a user with the corresponding username and hashed password exists.
+    Checks if a user with the corresponding username and password exists.
     Returns True if login is successful, or False otherwise.
+
+    Legacy SHA-256 hashes are replaced by scrypt hashes on the first successful login,
+    and successful logins are cached for LOGIN_CACHE_TTL seconds.
     """
+    if _login_cache_check(username, password):
+        return True
+
     conn = create_connection()
     c = conn.cursor()
+    c.execute('SELECT id, userPassword FROM users WHERE userName = ?', (username,))
+    rows = c.fetchall()
+    conn.close()
 
-    hashed_password = make_hashes(password)
-    query = 'SELECT * FROM users WHERE userName = ? AND userPassword = ?'
-    c.execute(query, (username, hashed_password))
-    result = c.fetchone()
+    # The KDF takes tens of milliseconds: no connection is held while it runs
+    result = False
+    for user_id, hashed_password in rows:
+        matches, needs_rehash = verify_password(password, hashed_password)
+        if matches:
+            if needs_rehash:
+                new_hash = make_hashes(password)
+                conn = create_connection()
+                # Unless the password was changed in the meantime
+                conn.execute('UPDATE users SET userPassword = ? WHERE id = ? AND userPassword = ?',
+                             (new_hash, user_id, hashed_password))
+                conn.commit()
+                conn.close()
+            result = True
+            break
 
-    conn.close()
-    return True if result else False
+    if result:
+        _login_cache_store(username, password)
+    return result
 
+@cached_read
 def user_exists(username):
     """
     Checks if a given username already exists in the database.
@@ -420,6 +1074,7 @@ def user_exists(username):
     return True if result else False
 
 # ------------------ Function user informations ------------------
+@cached_read
 def get_daily_reviews(user_name: str) -> pd.DataFrame:
     """
     Returns a DataFrame with columns [study_date, reviews]
@@ -441,6 +1096,7 @@ def get_daily_reviews(user_name: str) -> pd.DataFrame:
     conn.close()
     return df
 
+@cached_read
 def get_daily_reviews_current_year(user_name: str) -> pd.DataFrame:
     """
     Returns a DataFrame with columns [study_date, reviews],
@@ -463,6 +1119,7 @@ def get_daily_reviews_current_year(user_name: str) -> pd.DataFrame:
     conn.close()
     return df
 
+@cached_read
 def get_user_stats(user_name: str) -> dict:
     """
     Returns a dictionary containing the user's general metrics:
@@ -502,3 +1159,97 @@ def get_user_stats(user_name: str) -> dict:
             'avg_ease_factor': 0.0,
             'avg_interval': 0.0
         }
+
+def get_card_states(user_name: str, max_id=None) -> pd.DataFrame:
+    """
+    Returns a DataFrame with one row per flashcard of the user and columns
+    [selectedSearch, flashcardName, rows, studyInterval, easeFactor, nextStudy],
+    holding the values get_flashcards_study gives to update_flashcard_study
+    (number of log rows, max interval, max ease factor) and the latest due date.
+
+    With max_id, only the log rows up to that id are aggregated, so that the result
+    matches a get_user_log_version read before it.
+    """
+    conn = create_connection()
+    query = """
+        SELECT
+            selectedSearch,
+            flashcardName,
+            COUNT(*) AS rows,
+            MAX(studyInterval) AS studyInterval,
+            MAX(easeFactor) AS easeFactor,
+            MAX(datetimeNextStudy) AS nextStudy
+        FROM flashcardStudyLog
+        WHERE userName = ?
+          AND (? IS NULL OR id <= ?)
+        GROUP BY selectedSearch, flashcardName;
+    """
+    c = conn.cursor()
+    c.execute(query, (user_name, max_id, max_id))
+    # Built directly from the rows: read_sql_query adds noticeable overhead for large decks
+    df = pd.DataFrame(
+        c.fetchall(),
+        columns=['selectedSearch', 'flashcardName', 'rows', 'studyInterval', 'easeFactor', 'nextStudy']
+    )
+    conn.close()
+    return df
+
+def get_review_ease_history(user_name: str) -> pd.DataFrame:
+    """
+    Returns a DataFrame with columns [easeFactor, previousEase, reps] for every review of the user,
+    where previousEase is the ease factor given to update_flashcard_study for that review.
+    Used to infer the grades the user gives.
+    """
+    conn = create_connection()
+    query = """
+        SELECT easeFactor, previousEase, reps
+        FROM (
+            SELECT
+                easeFactor,
+                reps,
+                datetimeLastStudy,
+                MAX(easeFactor) OVER (
+                    PARTITION BY selectedSearch, flashcardName
+                    ORDER BY id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ) AS previousEase
+            FROM flashcardStudyLog
+            WHERE userName = ?
+        )
+        WHERE datetimeLastStudy IS NOT NULL
+          AND previousEase IS NOT NULL;
+    """
+    df = pd.read_sql_query(query, conn, params=(user_name,))
+    conn.close()
+    return df
+
+def get_study_log_since(user_name: str, after_id: int) -> list:
+    """
+    Returns the study log rows of the user with an id above after_id, as tuples
+    (id, selectedSearch, flashcardName, studyInterval, easeFactor, datetimeNextStudy)
+    in id order. Lets the forecast apply new reviews to its cached card states.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    # The rowid range is far more selective than the userName indexes
+    c.execute("""
+        SELECT id, selectedSearch, flashcardName, studyInterval, easeFactor, datetimeNextStudy
+        FROM flashcardStudyLog
+        WHERE id > ?
+          AND +userName = ?
+        ORDER BY id;
+    """, (after_id, user_name))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def get_user_log_version(user_name: str) -> tuple:
+    """
+    Returns (MAX(id), COUNT(*)) of the user's study log, which changes on every write.
+    """
+    conn = create_connection()
+    c = conn.cursor()
+    c.execute('SELECT MAX(id), COUNT(*) FROM flashcardStudyLog WHERE userName = ?', (user_name,))
+    row = c.fetchone()
+    conn.close()
+    return row
@@ -0,0 +1,167 @@
+import io
+import json
+from itertools import islice
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+from db_services import STUDY_LOG_COLUMNS, bulk_insert_study_log, iter_study_log, query_searches_flashcards
+import tracing
+
+# Rows read from the database, written to the file and inserted per transaction at a time
+BATCH_SIZE = 10000
+FORMATS = {"parquet": ".parquet", "jsonl": ".jsonl.zst"}
+
+SCHEMA = pa.schema([
+    ("selectedSearch", pa.string()),
+    ("flashcardName", pa.string()),
+    ("flashcardText", pa.string()),
+    ("datetimeLastStudy", pa.string()),
+    ("datetimeNextStudy", pa.string()),
+    ("studyInterval", pa.float64()),
+    ("easeFactor", pa.float64()),
+    ("reps", pa.int64()),
+    ("dueEpoch", pa.int64()),
+])
+
+
+def format_of(file_name):
+    """
+    Returns the deck format ("parquet" or "jsonl") of a file name.
+    """
+    for fmt, extension in FORMATS.items():
+        if file_name.endswith(extension):
+            return fmt
+    raise ValueError(f"Unsupported deck file {file_name}. Available extensions: {', '.join(FORMATS.values())}")
+
+
+def _as_text(value):
+    # Dates written by older versions may be stored as DATETIME values rather than text
+    return None if value is None else str(value)
+
+
+def _record_batch(rows):
+    columns = list(zip(*rows))
+    for i in (3, 4):
+        columns[i] = [_as_text(value) for value in columns[i]]
+    return pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, SCHEMA)], schema=SCHEMA)
+
+
+def export_parquet(username, destination, batch_size=BATCH_SIZE):
+    """
+    Writes the cards and review history of a user to a zstd compressed Parquet file,
+    one row group per batch of the study log.
+
+    Parameters
+    ----------
+    username : str
+        User whose study log is exported.
+    destination : str or file-like
+        Path or binary file object.
+    batch_size : int
+        Rows per row group.
+
+    Returns
+    -------
+    int
+        Number of exported rows.
+    """
+    exported = 0
+    with pq.ParquetWriter(destination, SCHEMA, compression="zstd") as writer:
+        for rows in iter_study_log(username, batch_size):
+            writer.write_batch(_record_batch(rows))
+            exported += len(rows)
+    return exported
+
+
+def export_jsonl(username, destination, batch_size=BATCH_SIZE):
+    """
+    Writes the cards and review history of a user as zstd compressed JSON lines,
+    one object per study log row.
+
+    Returns
+    -------
+    int
+        Number of exported rows.
+    """
+    exported = 0
+    compressor = zstandard.ZstdCompressor()
+    with compressor.stream_writer(destination, closefd=False) as writer:
+        for rows in iter_study_log(username, batch_size):
+            lines = (json.dumps(dict(zip(STUDY_LOG_COLUMNS, row)), default=str) + "\n" for row in rows)
+            writer.write("".join(lines).encode("utf-8"))
+            exported += len(rows)
+    return exported
+
+
+def _parquet_batches(source, batch_size):
+    parquet_file = pq.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=list(STUDY_LOG_COLUMNS)):
+        columns = [batch.column(name).to_pylist() for name in STUDY_LOG_COLUMNS]
+        yield list(zip(*columns))
+
+
+def _jsonl_batches(source, batch_size):
+    reader = zstandard.ZstdDecompressor().stream_reader(source, closefd=False)
+    lines = io.TextIOWrapper(reader, encoding="utf-8")
+    while True:
+        batch = [json.loads(line) for line in islice(lines, batch_size) if line.strip()]
+        if not batch:
+            break
+        yield [tuple(record.get(column) for column in STUDY_LOG_COLUMNS) for record in batch]
+
+
+def export_deck(username, destination, fmt="parquet", batch_size=BATCH_SIZE):
+    """
+    Exports the study log of a user to destination in the given format ("parquet" or "jsonl").
+    """
+    with tracing.span('export_deck', format=fmt) as export_span:
+        if fmt == "parquet":
+            exported = export_parquet(username, destination, batch_size)
+        elif fmt == "jsonl":
+            exported = export_jsonl(username, destination, batch_size)
+        else:
+            raise ValueError(f"Unknown deck format {fmt}.")
+        export_span.set(rows=exported)
+    tracing.increment('deck_rows_exported_total', exported)
+    return exported
+
+
+def import_deck(username, source, fmt, batch_size=BATCH_SIZE):
+    """
+    Imports a deck exported by export_deck into the study log of a user.
+
+    The file is read in batches of batch_size rows, each inserted with executemany in its own
+    transaction. Searches the user already has are skipped, so importing a deck twice does not
+    duplicate its review history.
+
+    Returns
+    -------
+    tuple
+        (inserted, skipped_searches): number of inserted rows and the set of skipped searches.
+    """
+    if fmt == "parquet":
+        batches = _parquet_batches(source, batch_size)
+    elif fmt == "jsonl":
+        batches = _jsonl_batches(source, batch_size)
+    else:
+        raise ValueError(f"Unknown deck format {fmt}.")
+
+    existing = {search for (search,) in query_searches_flashcards(username)}
+    skipped = set()
+
+    def new_rows():
+        for rows in batches:
+            kept = []
+            for row in rows:
+                if row[0] in existing:
+                    skipped.add(row[0])
+                else:
+                    kept.append(row)
+            if kept:
+                yield kept
+
+    with tracing.span('import_deck', format=fmt) as import_span:
+        inserted = bulk_insert_study_log(username, new_rows())
+        import_span.set(rows=inserted, skipped_searches=len(skipped))
+    tracing.increment('deck_rows_imported_total', inserted)
+    return inserted, skipped
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import httpx
+import openai
+from langchain_core.runnables import RunnableLambda
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+
+
+def _api_error(error_class, status_code, message, code):
+    """
+    Builds an openai exception identical to the ones raised by the real client.
+    """
+    request = httpx.Request("POST", OPENAI_URL)
+    response = httpx.Response(status_code, request=request)
+    return error_class(message, response=response, body={"message": message, "code": code})
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for ChatOpenAI used to benchmark the generation pipeline.
+
+    Parameters
+    ----------
+    latency : float
+        Fixed time in seconds spent on every call (time to first token).
+    tokens_per_second : float
+        Output throughput. None disables the streaming delay.
+    cards_per_chunk : int
+        Number of flashcards returned for every call.
+    context_window : int
+        Maximum number of input tokens. Bigger inputs raise a context length BadRequestError.
+    rate_limit_probability : float
+        Probability of a call raising a 429 RateLimitError.
+    timeout_probability : float
+        Probability of a call raising an APITimeoutError.
+    seed : int
+        Seed for the failure injection.
+    """
+
+    def __init__(self, latency=0.0, tokens_per_second=None, cards_per_chunk=5,
+                 context_window=128000, rate_limit_probability=0.0,
+                 timeout_probability=0.0, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.cards_per_chunk = cards_per_chunk
+        self.context_window = context_window
+        self.rate_limit_probability = rate_limit_probability
+        self.timeout_probability = timeout_probability
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "tokens_in": 0, "tokens_out": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates a FakeChatModel from the FAKE_LLM_* environment variables.
+        """
+        tokens_per_second = os.getenv("FAKE_LLM_TOKENS_PER_SECOND")
+        seed = os.getenv("FAKE_LLM_SEED")
+        return cls(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0")),
+            tokens_per_second=float(tokens_per_second) if tokens_per_second else None,
+            cards_per_chunk=int(os.getenv("FAKE_LLM_CARDS_PER_CHUNK", "5")),
+            context_window=int(os.getenv("FAKE_LLM_CONTEXT_WINDOW", "128000")),
+            rate_limit_probability=float(os.getenv("FAKE_LLM_RATE_LIMIT_PROBABILITY", "0")),
+            timeout_probability=float(os.getenv("FAKE_LLM_TIMEOUT_PROBABILITY", "0")),
+            seed=int(seed) if seed else None
+        )
+
+    @staticmethod
+    def count_tokens(text):
+        """
+        Rough token count (4 characters per token), enough for benchmarking.
+        """
+        return max(1, len(text) // 4)
+
+    def with_structured_output(self, schema):
+        """
+        Mirrors ChatOpenAI.with_structured_output: returns a runnable producing schema instances.
+        """
+        return RunnableLambda(lambda prompt_value: self._respond(prompt_value, schema))
+
+    def _record(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def _respond(self, prompt_value, schema):
+        text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        tokens_in = self.count_tokens(text)
+        self._record(calls=1, tokens_in=tokens_in)
+
+        with self.lock:
+            draw = self.random.random()
+        if tokens_in > self.context_window:
+            self._record(errors=1)
+            raise _api_error(
+                openai.BadRequestError, 400,
+                f"This model's maximum context length is {self.context_window} tokens. "
+                f"However, your messages resulted in {tokens_in} tokens.",
+                "context_length_exceeded"
+            )
+        if draw < self.rate_limit_probability:
+            self._record(errors=1)
+            raise _api_error(openai.RateLimitError, 429, "Rate limit reached for requests", "rate_limit_exceeded")
+        if draw < self.rate_limit_probability + self.timeout_probability:
+            self._record(errors=1)
+            raise openai.APITimeoutError(request=httpx.Request("POST", OPENAI_URL))
+
+        output = self._make_output(schema, text)
+        tokens_out = self.count_tokens(json.dumps(output))
+        self._record(tokens_out=tokens_out)
+
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += tokens_out / self.tokens_per_second
+        if delay > 0:
+            time.sleep(delay)
+
+        return schema.model_validate(output)
+
+    def _make_output(self, schema, text):
+        """
+        Fills the fields of schema: flashcards for the flashcards field, excerpts of the text for strings.
+        """
+        output = {}
+        words = text.split()
+        for name, field in schema.model_fields.items():
+            if name == "flashcards":
+                output[name] = self._make_cards(text)
+            elif field.annotation is int:
+                output[name] = len(words)
+            else:
+                output[name] = " ".join(words[:80])
+        return output
+
+    def _make_cards(self, text):
+        """
+        Builds deterministic flashcards from the words of the text, so that
+        the same chunk always produces the same cards.
+        """
+        digest = hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()[:8]
+        words = re.findall(r"[A-Za-z][A-Za-z\-]{5,}", text) or ["Concept"]
+        flashcards = []
+        for i in range(self.cards_per_chunk):
+            word = words[(i * 7919) % len(words)]
+            start = (i * 104729) % len(words)
+            flashcards.append({
+                "key_concepts": f"{word.capitalize()} {digest}-{i}",
+                "definition": " ".join(words[start:start + 40])
+            })
+        return flashcards
@@ -0,0 +1,247 @@
+import functools
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import openai
+from pydantic import BaseModel, Field, ValidationError
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from db_services import add_flashcard_study
+import tracing
+from rate_limiter import PRIORITY_INTERACTIVE, get_rate_limiter
+
+# Tokens reserved in the rate limiter for the answer, corrected once the answer is known
+EXPECTED_OUTPUT_TOKENS = 1000
+# Chunks sent to the model at the same time by extract_flashcards_from_chunks
+LLM_WORKERS = int(os.getenv("FLASHCARD_LLM_WORKERS", "4"))
+# Chunks of text buffered by iter_chunks before they are split
+STREAM_BUFFER_CHUNKS = 8
+
+
+class KeyConcepts(BaseModel):
+    key_concepts: str = Field(..., title="Key Concepts", description="A single and relevant Key concept extracted from the text")
+    definition: str = Field(..., title="Definition", description="Simple and 3-lines technical definition of the key concept")
+
+
+class Flashcards(BaseModel):
+    """Extracted flashcards from the text"""
+    flashcards: List[KeyConcepts]
+
+
+prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are an expert key concepts extraction algorithm. "
+            "Extract all the relevant key concepts from the text. "
+            "If you do not know the value of an attribute asked to extract, "
+            "return null for the attribute's value."
+        ),
+        ("human", "{text}")
+    ]
+)
+
+
+def get_chat_model():
+    """
+    Returns the chat model used to extract flashcards.
+
+    When the FLASHCARD_FAKE_LLM environment variable is set, a FakeChatModel
+    (see fake_llm.py) configured from the environment is returned instead of
+    the OpenAI model, so the pipeline can run offline.
+    """
+    if os.getenv("FLASHCARD_FAKE_LLM"):
+        from fake_llm import FakeChatModel
+        return FakeChatModel.from_env()
+
+    from langchain_openai import ChatOpenAI
+    # Retries are handled by the shared rate limiter (see rate_limiter.py)
+    return ChatOpenAI(model="gpt-4o-mini", max_retries=0)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text with tiktoken, or estimates them (4 characters per token)
+    when the encoding is not available.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_text(text, chunk_size=4000, chunk_overlap=400):
+    """
+    Splits a text into chunks of chunk_size characters with chunk_overlap characters of overlap.
+    """
+    with tracing.span('chunk', chars=len(text)) as chunk_span:
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks = text_splitter.split_text(text)
+        chunk_span.set(chunks=len(chunks))
+    tracing.increment('chunks_total', len(chunks))
+    return chunks
+
+
+def iter_chunks(pieces, chunk_size=4000, chunk_overlap=400):
+    """
+    Streams text pieces (the pages of AutoLoaderDocument.iter_text) into the chunks of split_text.
+
+    Pieces are buffered until they hold about STREAM_BUFFER_CHUNKS chunks. The buffer is then
+    split, every chunk but the last one is yielded, and the last one starts the next buffer,
+    which keeps the overlap between consecutive chunks. Memory does not grow with the document.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    buffer, length, count = [], 0, 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece) + 1
+        if length < chunk_size * STREAM_BUFFER_CHUNKS:
+            continue
+        chunks = text_splitter.split_text("\n".join(buffer))
+        buffer, length = chunks[-1:], sum(len(chunk) for chunk in chunks[-1:])
+        count += len(chunks[:-1])
+        yield from chunks[:-1]
+    chunks = text_splitter.split_text("\n".join(buffer))
+    count += len(chunks)
+    yield from chunks
+    tracing.increment('chunks_total', count)
+
+
+def is_context_length_error(error):
+    """
+    Checks if an OpenAI error was raised because the input is bigger than the context window.
+    """
+    message = str(error)
+    return isinstance(error, openai.BadRequestError) and (
+        "context_length_exceeded" in message or "maximum context length" in message
+    )
+
+
+def invoke_structured(chat_prompt, inputs, schema, model, priority=PRIORITY_INTERACTIVE):
+    """
+    Runs chat_prompt | model with structured output through the process wide rate limiter,
+    which retries 429s and timeouts, and records the tokens in the tracing layer.
+    Returns an instance of schema.
+    """
+    tokens_in = count_tokens(chat_prompt.format(**inputs))
+    with tracing.span('llm', tokens_in=tokens_in, schema=schema.__name__) as llm_span:
+        runnable = chat_prompt | model.with_structured_output(schema=schema)
+
+        def invoke():
+            result = runnable.invoke(inputs)
+            return result, count_tokens(result.model_dump_json())
+
+        # Each attempt reserves the expected size and settles it with the real one (or gives it back)
+        result, tokens_out = get_rate_limiter().call(
+            invoke, tokens_in + EXPECTED_OUTPUT_TOKENS, priority,
+            usage=lambda outcome: tokens_in + outcome[1]
+        )
+        llm_span.set(tokens_out=tokens_out)
+    tracing.increment('llm_calls_total')
+    tracing.increment('llm_tokens_in_total', tokens_in)
+    tracing.increment('llm_tokens_out_total', tokens_out)
+    return result
+
+
+def extract_flashcards(text, model, priority=PRIORITY_INTERACTIVE):
+    """
+    Sends a text to the model and returns the list of extracted KeyConcepts.
+    """
+    return invoke_structured(prompt, {"text": text}, Flashcards, model, priority).flashcards
+
+
+def _call_returning_error(func, item):
+    # A response not matching the schema fails the chunk like an API error, not the whole map
+    try:
+        return func(item), None
+    except (openai.OpenAIError, ValidationError) as e:
+        return None, e
+
+
+def parallel_map(func, items, max_workers=LLM_WORKERS):
+    """
+    Calls func on every item, max_workers at a time, keeping the spans in the caller's trace.
+    Returns a list of (result, error) in item order; OpenAI errors are returned, not raised.
+    """
+    parent = tracing.current_span()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if parent is not None:
+            return list(executor.map(lambda item: _run_in_span(parent, _call_returning_error, func, item), items))
+        return list(executor.map(lambda item: _call_returning_error(func, item), items))
+
+
+def iter_parallel_map(func, items, max_workers=LLM_WORKERS):
+    """
+    Streaming parallel_map: yields (result, error) in item order, reading items from the
+    iterable only when a worker frees up, so at most 2 * max_workers items are in memory.
+    """
+    parent = tracing.current_span()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for item in items:
+            if parent is not None:
+                pending.append(executor.submit(_run_in_span, parent, _call_returning_error, func, item))
+            else:
+                pending.append(executor.submit(_call_returning_error, func, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def extract_flashcards_from_chunks(chunks, model, priority=PRIORITY_INTERACTIVE):
+    """
+    Extracts flashcards from every chunk, LLM_WORKERS chunks at a time.
+
+    Returns
+    -------
+    tuple
+        (flashcards, errors): the flashcards of the successful chunks, in chunk order,
+        and the errors of the chunks that failed after all retries.
+    """
+    flashcards, errors = [], []
+    for chunk_flashcards, error in parallel_map(lambda chunk: extract_flashcards(chunk, model, priority), chunks):
+        if error is not None:
+            errors.append(error)
+        else:
+            flashcards.extend(chunk_flashcards)
+    return flashcards, errors
+
+
+def extract_flashcards_streaming(chunks, model, priority=PRIORITY_INTERACTIVE):
+    """
+    Extracts flashcards from a stream of chunks (see iter_chunks), LLM_WORKERS chunks at a time.
+    Yields (flashcards, error) for every chunk, in chunk order, so the caller can save the
+    flashcards of a huge document as they come.
+    """
+    return iter_parallel_map(lambda chunk: extract_flashcards(chunk, model, priority), chunks)
+
+
+def _run_in_span(parent, func, *args):
+    with tracing.attach(parent):
+        return func(*args)
+
+
+def save_flashcards(username, source_search, flashcards):
+    """
+    Saves the extracted flashcards to the database.
+    Returns the number of flashcards that were actually inserted.
+    """
+    inserted = 0
+    with tracing.span('persist', flashcards=len(flashcards)) as persist_span:
+        for card in flashcards:
+            if add_flashcard_study(username, source_search, card.key_concepts, card.definition):
+                inserted += 1
+        persist_span.set(inserted=inserted)
+    tracing.increment('flashcards_saved_total', inserted)
+    return inserted
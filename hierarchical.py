@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+from pydantic import BaseModel, Field
+from langchain_core.prompts import ChatPromptTemplate
+from generation import Flashcards, invoke_structured, parallel_map, split_text
+from rate_limiter import PRIORITY_BATCH
+import tracing
+
+# Directory of the cached summaries and section flashcards
+CACHE_DIR = os.getenv("FLASHCARD_HIERARCHY_CACHE_DIR", ".generation_cache")
+# Characters of chunk summaries grouped into one section
+SECTION_CHARS = int(os.getenv("FLASHCARD_SECTION_CHARS", "6000"))
+# Maximum number of flashcards extracted from a section
+MAX_CARDS_PER_SECTION = int(os.getenv("FLASHCARD_MAX_CARDS_PER_SECTION", "10"))
+
+
+class ChunkSummary(BaseModel):
+    """Summary of a part of a long document"""
+    title: str = Field(..., title="Title", description="Short title of the topic of the text")
+    summary: str = Field(..., title="Summary", description="Dense summary of the concepts, definitions and facts of the text")
+
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are an expert technical summarizer. "
+            "Summarize the text, keeping every key concept together with its definition. "
+            "Give the text a short title describing its topic."
+        ),
+        ("human", "{text}")
+    ]
+)
+
+section_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are an expert key concepts extraction algorithm. "
+            "The text is a sequence of summaries of one section of a book. "
+            "Extract the {max_cards} most important key concepts of the section, or fewer if "
+            "the section does not have as many. "
+            "If you do not know the value of an attribute asked to extract, "
+            "return null for the attribute's value."
+        ),
+        ("human", "{text}")
+    ]
+)
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _prompt_digest(chat_prompt):
+    """
+    Identifies a prompt by its messages, so editing a prompt only invalidates the level using it.
+    """
+    return _digest(*(repr(message) for message in chat_prompt.messages))
+
+
+def _model_name(model):
+    return getattr(model, "model_name", type(model).__name__)
+
+
+class StageCache:
+    """
+    Cache of the intermediate results of generate_hierarchical, one JSON file per key
+    in a directory per level ("summaries", "sections").
+
+    Keys include the digest of the prompt of their level and of their input, so a re-run
+    after a crash skips the finished work and a prompt tweak only recomputes its level.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _path(self, level, key):
+        return os.path.join(self.directory, level, key + ".json")
+
+    def get(self, level, key):
+        try:
+            with open(self._path(level, key), encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+        return value
+
+    def put(self, level, key, value):
+        path = self._path(level, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+
+def _cached(cache, level, key, schema, produce):
+    """
+    Returns the schema instance cached under key, calling produce() and storing its result when missing.
+    """
+    value = cache.get(level, key)
+    if value is not None:
+        return schema.model_validate(value)
+    result = produce()
+    cache.put(level, key, result.model_dump())
+    return result
+
+
+def summarize_chunks(chunks, model, cache):
+    """
+    Summarizes every chunk in parallel, with the batch priority of the rate limiter.
+
+    Returns
+    -------
+    tuple
+        (summaries, errors): a ChunkSummary per chunk (None for the failed ones), and the errors.
+    """
+    prompt_digest = _prompt_digest(summary_prompt)
+    model_name = _model_name(model)
+
+    def summarize(chunk):
+        key = _digest(prompt_digest, model_name, chunk)
+        return _cached(cache, "summaries", key, ChunkSummary, lambda: invoke_structured(
+            summary_prompt, {"text": chunk}, ChunkSummary, model, PRIORITY_BATCH
+        ))
+
+    with tracing.span('summarize', chunks=len(chunks)):
+        results = parallel_map(summarize, chunks)
+    summaries = [summary for summary, error in results]
+    errors = [error for summary, error in results if error is not None]
+    return summaries, errors
+
+
+def group_sections(summaries, section_chars=SECTION_CHARS):
+    """
+    Groups consecutive chunk summaries into sections of about section_chars characters,
+    so that each section covers a contiguous part of the document.
+    """
+    sections, current, size = [], [], 0
+    for summary in summaries:
+        if summary is None:
+            continue
+        text = f"## {summary.title}\n{summary.summary}"
+        if current and size + len(text) > section_chars:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += len(text)
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def extract_section_flashcards(sections, model, cache, max_cards=MAX_CARDS_PER_SECTION):
+    """
+    Extracts at most max_cards flashcards from every section, in parallel.
+
+    Returns
+    -------
+    tuple
+        (flashcards, errors): the flashcards of the successful sections, in section order,
+        and the errors of the sections that failed.
+    """
+    prompt_digest = _prompt_digest(section_prompt)
+    model_name = _model_name(model)
+
+    def extract(section):
+        key = _digest(prompt_digest, model_name, max_cards, section)
+        result = _cached(cache, "sections", key, Flashcards, lambda: invoke_structured(
+            section_prompt, {"text": section, "max_cards": max_cards}, Flashcards, model, PRIORITY_BATCH
+        ))
+        # The model does not always respect the cap of the prompt
+        return result.flashcards[:max_cards]
+
+    flashcards, errors = [], []
+    with tracing.span('extract_sections', sections=len(sections)):
+        for section_flashcards, error in parallel_map(extract, sections):
+            if error is not None:
+                errors.append(error)
+            else:
+                flashcards.extend(section_flashcards)
+    return flashcards, errors
+
+
+def generate_hierarchical(text, model, max_cards_per_section=MAX_CARDS_PER_SECTION,
+                          section_chars=SECTION_CHARS, cache=None):
+    """
+    Generates flashcards from a book-length text in three levels: the chunks of split_text
+    are summarized in parallel, consecutive summaries are grouped into sections, and at most
+    max_cards_per_section flashcards are extracted from each section.
+
+    Returns
+    -------
+    tuple
+        (flashcards, report): the flashcards, and a dict with the number of chunks and sections,
+        the cache hits / misses and the errors of both levels.
+    """
+    cache = cache or StageCache()
+    with tracing.span('hierarchical', chars=len(text)) as hierarchical_span:
+        chunks = split_text(text)
+        summaries, summary_errors = summarize_chunks(chunks, model, cache)
+        sections = group_sections(summaries, section_chars)
+        flashcards, section_errors = extract_section_flashcards(sections, model, cache, max_cards_per_section)
+        hierarchical_span.set(chunks=len(chunks), sections=len(sections), flashcards=len(flashcards))
+
+    report = {
+        "chunks": len(chunks),
+        "sections": len(sections),
+        "cache_hits": cache.stats["hits"],
+        "cache_misses": cache.stats["misses"],
+        "errors": summary_errors + section_errors
+    }
+    return flashcards, report
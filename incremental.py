@@ -0,0 +1,138 @@
+import hashlib
+import zlib
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from db_services import get_document_chunks, query_flashcards, set_stale_flashcards, update_document_chunks, update_flashcard_text
+from generation import Flashcards, count_tokens, extract_flashcards, parallel_map, prompt
+from rate_limiter import PRIORITY_INTERACTIVE
+import tracing
+
+# Maximum characters of a chunk
+CHUNK_SIZE = 4000
+# Once a chunk holds CHUNK_SIZE / 2 characters, it ends after the first line whose checksum is a
+# multiple of this (blank lines always qualify: paragraphs are the preferred boundaries)
+BOUNDARY_DIVISOR = 16
+
+
+def content_defined_chunks(text, chunk_size=CHUNK_SIZE):
+    """
+    Splits a text into chunks of at most chunk_size characters, without overlap, whose
+    boundaries depend on the lines around them instead of on the position in the text.
+
+    With fixed size chunks (split_text), a paragraph inserted at the beginning of a document
+    shifts every following chunk. Here the chunks after an edit find the same boundaries
+    again within a chunk or two, so the unchanged parts of a document give the same chunks.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    chunks, lines, length = [], [], 0
+
+    def flush():
+        nonlocal lines, length
+        chunk = "\n".join(lines).strip()
+        if chunk:
+            chunks.append(chunk)
+        lines, length = [], 0
+
+    for line in text.split("\n"):
+        if len(line) > chunk_size:
+            flush()
+            chunks.extend(text_splitter.split_text(line))
+            continue
+        if lines and length + len(line) + 1 > chunk_size:
+            flush()
+        lines.append(line)
+        length += len(line) + 1
+        if length >= chunk_size // 2 and zlib.crc32(line.encode("utf-8")) % BOUNDARY_DIVISOR == 0:
+            flush()
+    flush()
+    return chunks
+
+
+def chunk_hash(chunk):
+    """
+    Identifies a chunk by its content, ignoring whitespace changes.
+    """
+    return hashlib.sha256(" ".join(chunk.split()).encode("utf-8")).hexdigest()
+
+
+def chunk_tokens(chunk, flashcards):
+    """
+    Tokens of the extraction of a chunk: the prompt and the structured answer.
+    """
+    return count_tokens(prompt.format(text=chunk)) + count_tokens(Flashcards(flashcards=flashcards).model_dump_json())
+
+
+def generate_incremental(username, search, text, model, priority=PRIORITY_INTERACTIVE):
+    """
+    Generates the flashcards of a new version of a document, only sending to the model the
+    chunks (content_defined_chunks) it has not seen for this user and search.
+
+    The chunks sent to the model are recorded (documentChunks) with the names of their
+    flashcards. The flashcards of chunks that are not part of the document anymore, and not
+    extracted again from another chunk, are flagged as stale (get_stale_flashcards) and not
+    scheduled anymore. A flashcard of a new chunk that already exists in the search gets the new
+    definition (add_flashcard_study keeps existing flashcards as they are).
+    Chunks that failed are not recorded: they are sent again on the next upload, and until then
+    the removed chunks are kept (nothing is flagged stale).
+
+    Returns
+    -------
+    tuple
+        (flashcards, report): the flashcards of the new chunks, and a dict with the number of
+        chunks, reused, new, failed and removed (0 when a chunk failed) chunks, the stale and updated flashcard names,
+        the errors, and the tokens sent, saved (the recorded tokens of the reused chunks) and of
+        a full regeneration.
+    """
+    with tracing.span('incremental', search=search) as incremental_span:
+        chunks = {}
+        for chunk in content_defined_chunks(text):
+            chunks.setdefault(chunk_hash(chunk), chunk)
+        known = get_document_chunks(username, search)
+        new = [key for key in chunks if key not in known]
+        removed = [key for key in known if key not in chunks]
+
+        results = parallel_map(lambda key: extract_flashcards(chunks[key], model, priority), new)
+        flashcards, errors, added = [], [], []
+        for key, (chunk_flashcards, error) in zip(new, results):
+            if error is not None:
+                errors.append(error)
+                continue
+            flashcards.extend(chunk_flashcards)
+            added.append((key, [card.key_concepts for card in chunk_flashcards], chunk_tokens(chunks[key], chunk_flashcards)))
+
+        existing = dict(query_flashcards(username, search))
+        updated = []
+        for card in flashcards:
+            name = card.key_concepts
+            if name in existing and name not in updated and existing[name] != card.definition:
+                if update_flashcard_text(username, search, name, card.definition):
+                    updated.append(name)
+
+        # The chunks replacing a removed one are unknown: while a new chunk failed, the removed
+        # chunks keep their rows and flashcards, and the next upload (which retries the failed
+        # chunks) removes them
+        if errors:
+            removed = []
+        update_document_chunks(username, search, added, removed)
+        current = {name for key in chunks if key in known for name in known[key][0]}
+        current.update(name for _, names, _ in added for name in names)
+        stale = {name for key in removed for name in known[key][0]} - current
+        set_stale_flashcards(username, search, sorted(stale), sorted(current))
+
+        tokens_saved = sum(known[key][1] for key in chunks if key in known)
+        tokens_sent = sum(tokens for _, _, tokens in added)
+        report = {
+            "chunks": len(chunks),
+            "reused": len(chunks) - len(new),
+            "new": len(added),
+            "failed": len(errors),
+            "removed": len(removed),
+            "stale_flashcards": sorted(stale),
+            "updated_flashcards": sorted(updated),
+            "errors": errors,
+            "tokens_sent": tokens_sent,
+            "tokens_saved": tokens_saved,
+            "tokens_full": tokens_sent + tokens_saved,
+        }
+        incremental_span.set(**{key: value for key, value in report.items() if isinstance(value, int)})
+    tracing.increment('incremental_tokens_saved_total', tokens_saved)
+    return flashcards, report
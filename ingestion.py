@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from AutoLoader import Website, Youtube, YoutubePlaylist, is_youtube_playlist, is_youtube_url
+from generation import split_text
+from url_cache import UrlCache
+import tracing
+
+# Maximum number of URLs fetched at the same time
+INGEST_WORKERS = int(os.getenv("FLASHCARD_INGEST_WORKERS", "8"))
+
+
+class Source:
+    """
+    Content fetched from a URL: text for websites, transcript segments for YouTube videos.
+    When the fetch fails, error holds the exception.
+    """
+    def __init__(self, url, kind, text=None, segments=None, error=None):
+        self.url = url
+        self.kind = kind
+        self.text = text
+        self.segments = segments
+        self.error = error
+
+
+def expand_urls(urls, cache):
+    """
+    Cleans the list of URLs, replacing YouTube playlists by the URLs of their videos.
+    Returns (urls, sources) where sources are the playlists that could not be expanded.
+    """
+    expanded, failed = [], []
+    for url in urls:
+        url = url.strip()
+        if not url:
+            continue
+        if is_youtube_playlist(url):
+            try:
+                expanded.extend(YoutubePlaylist(url, cache=cache).video_urls())
+            except Exception as e:
+                failed.append(Source(url, "playlist", error=e))
+        else:
+            expanded.append(url)
+    return list(dict.fromkeys(expanded)), failed
+
+
+def fetch_source(url, cache):
+    """
+    Fetches a website or a YouTube transcript. Errors are returned in the Source instead of raised.
+    """
+    kind = "youtube" if is_youtube_url(url) else "website"
+    with tracing.span('ingest.fetch', kind=kind, url=url) as fetch_span:
+        try:
+            if kind == "youtube":
+                segments = Youtube(url, cache=cache).get_segments()
+                fetch_span.set(segments=len(segments))
+                return Source(url, kind, segments=segments)
+            text = Website(url, cache=cache).extract_text()
+            fetch_span.set(chars=len(text))
+            return Source(url, kind, text=text)
+        except Exception as e:
+            fetch_span.set(error=type(e).__name__)
+            return Source(url, kind, error=e)
+
+
+def ingest_urls(urls, cache=None, max_workers=INGEST_WORKERS):
+    """
+    Fetches websites, YouTube videos and playlists concurrently with at most max_workers threads.
+    Yields a Source as soon as each URL is done, in completion order.
+    """
+    cache = cache or UrlCache()
+    urls, failed = expand_urls(urls, cache)
+    yield from failed
+    if not urls:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        futures = [executor.submit(fetch_source, url, cache) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def iter_segment_chunks(segments, chunk_size=4000, chunk_overlap=400):
+    """
+    Streams transcript segments into chunks of about chunk_size characters.
+    The last chunk_overlap characters of a chunk are repeated at the beginning of the next one.
+    """
+    buffer, length, pending = [], 0, False
+    for segment in segments:
+        text = segment['text'].strip()
+        if not text:
+            continue
+        buffer.append(text)
+        length += len(text) + 1
+        pending = True
+        if length >= chunk_size:
+            chunk = " ".join(buffer)
+            yield chunk
+            tail = chunk[-chunk_overlap:] if chunk_overlap else ""
+            buffer = [tail] if tail else []
+            length = len(tail)
+            pending = False
+    if pending:
+        yield " ".join(buffer)
+
+
+def source_chunks(source):
+    """
+    Returns the chunks of a Source to send to the model.
+    """
+    if source.segments is not None:
+        return iter_segment_chunks(source.segments)
+    return split_text(source.text)
@@ -1,18 +1,39 @@
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pydantic import BaseModel, Field
-from typing import Dict, List
+import io
 import json
+import os
+import time
 from AutoLoader import AutoLoaderDocument, Pdf
 from db_services import *
+from generation import (
+    extract_flashcards,
+    extract_flashcards_from_chunks,
+    extract_flashcards_streaming,
+    get_chat_model,
+    is_context_length_error,
+    iter_chunks,
+    save_flashcards,
+    split_text
+)
+from rate_limiter import get_rate_limiter
+from query_cache import get_query_cache
+from ingestion import ingest_urls, source_chunks
+from forecast import forecast_reviews, warm_forecast
+from hierarchical import MAX_CARDS_PER_SECTION, generate_hierarchical
+from incremental import generate_incremental
+from deck_io import FORMATS, export_deck, format_of, import_deck
+from card_import import is_deck_file, iter_deck_cards, import_cards
+from study_prefetch import GradeWriter, StudyQueue, render_card_html
+from study_queue import GlobalStudyQueue
 import ast
 import altair as alt
 import pandas as pd
 import openai
+import tracing
+import sql_profiler
 
 
+@st.cache_data
 def load_css(file_name):
     """
     Reads a CSS file and returns its content as a string.
@@ -85,10 +106,17 @@ def login_section():
             st.success(f"Welcome, {user}!")
             # Store the logged-in user in the session
             st.session_state['username'] = user
+            # The first forecast reads the whole study log: compute it before the dashboard is opened
+            warm_forecast(user)
         else:
             st.error("Incorrect username or password. Please try again.")
     
 
+# Option of the search selectbox studying the due cards of every search
+ALL_SEARCHES = "All searches"
+# Labels of the grade buttons and the grade given to update_flashcard_study
+GRADE_BUTTONS = [("Very Easy", 5), ("Easy", 4), ("OK", 3), ("Hard", 2), ("Very Hard", 1)]
+
 def study_flashcards():
     """
     Creates a flashcard study session in the Streamlit sidebar,
@@ -103,112 +131,111 @@ def study_flashcards():
             return
         username = st.session_state['username']
 
-    # Load searches that already have flashcards for this user
-    search_list = query_searches_flashcards(username)
-    # Convert to set and then to list in case of duplicates
-    search_list = set(item[0] for item in search_list)
+    # The searches and due counts are kept in the session and updated by the grade clicks,
+    # instead of being queried on every rerun
+    overview = st.session_state.get('study_overview')
+    if overview is None or overview[0] != username:
+        # Load searches that already have flashcards for this user
+        search_list = query_searches_flashcards(username)
+        # Convert to set and then to list in case of duplicates
+        search_list = set(item[0] for item in search_list)
+        # Number of cards due today in every search, shown next to the search names
+        overview = (username, search_list, get_due_counts(username))
+        st.session_state['study_overview'] = overview
+    _, search_list, due_counts = overview
+
+    # The grades of the session are saved in the background (see study_prefetch.GradeWriter).
+    # The cards of the grades that could not be saved are due again
+    writer = st.session_state.setdefault('study_writer', GradeWriter())
+    failed_grades = writer.failures()
+    for search, flashcard, grade, error in failed_grades:
+        due_counts[search] = due_counts.get(search, 0) + 1
 
     # If there are no available searches, display a message
     if not search_list:
         st.info("There are no searches with flashcards to study.")
         return
 
-    # Allow the user to select which "search" they want to study
+    with st.sidebar.expander("Due today", expanded=False):
+        for search in sorted(search_list):
+            st.write(f"{search}: **{due_counts.get(search, 0)}**")
+
+    # Allow the user to select which "search" they want to study, or all of them at once
     selected_search = st.selectbox(
         "Select a search to study:",
-        sorted(list(search_list))
+        [ALL_SEARCHES] + sorted(list(search_list)),
+        format_func=lambda search: (
+            f"{search} ({sum(due_counts.values())} due)" if search == ALL_SEARCHES
+            else f"{search} ({due_counts.get(search, 0)} due)"
+        )
     )
 
-    # Retrieve the saved strings (JSON/Dict) for this search
-    # Retrieve the saved flashcards for this search
-    flashcard_list = query_flashcards(username, selected_search)
-
-    # Optional: load custom CSS
-    css = load_css("styles.html")
-    st.markdown(css, unsafe_allow_html=True)
-
-
-    # Control the index of the current flashcard
-    if 'current_card' not in st.session_state:
-        st.session_state.current_card = 0
-
-    # Load the flashcards ready for study
-    flashcards = get_flashcards_study(username, selected_search)
-
-    # Check if there are more flashcards to study
-    if st.session_state.current_card < len(flashcards):
-        # Unpack the flashcard information
-        flashcard = flashcards[st.session_state.current_card]
-        flashcard_name, flashcard_text, last_studied, current_interval, current_ease_factor, current_reps = flashcard
-
-        # Display the flashcard in a styled card (HTML/CSS)
-        card_html = f"""
-            <div class="card">
-                <div class="card-title">{flashcard_name}</div>
-                <div class="small-desc">{flashcard_text}</div>
-                <div class="go-corner"></div>
-            </div>
-        """
-        st.markdown(card_html, unsafe_allow_html=True)
-
-        # Create columns for the evaluation buttons
-        col1, col2, col3, col4, col5 = st.columns(5)
-
-        # Button: Very Easy
-        with col1:
-            if st.button("Very Easy"):
-                update_flashcard_study(username, selected_search, flashcard_name, flashcard_text,
-                                       5, current_interval, current_ease_factor, current_reps)
-                st.session_state.current_card += 1
-
-        # Button: Easy
-        with col2:
-            if st.button("Easy"):
-                update_flashcard_study(username, selected_search, flashcard_name, flashcard_text,
-                                       4, current_interval, current_ease_factor, current_reps)
-                st.session_state.current_card += 1
-
-        # Button: OK
-        with col3:
-            if st.button("OK"):
-                update_flashcard_study(username, selected_search, flashcard_name, flashcard_text,
-                                       3, current_interval, current_ease_factor, current_reps)
-                st.session_state.current_card += 1
-
-        # Button: Hard
-        with col4:
-            if st.button("Hard"):
-                update_flashcard_study(username, selected_search, flashcard_name, flashcard_text,
-                                       2, current_interval, current_ease_factor, current_reps)
-                st.session_state.current_card += 1
-
-        # Button: Very Hard
-        with col5:
-            if st.button("Very Hard"):
-                update_flashcard_study(username, selected_search, flashcard_name, flashcard_text,
-                                       1, current_interval, current_ease_factor, current_reps)
-                st.session_state.current_card += 1
-
-        # If reached the end of the flashcard list, reset the index
-        if st.session_state.current_card >= len(flashcards):
-            st.session_state.current_card = 0
-
-    else:
+    st.markdown(load_css("styles.html"), unsafe_allow_html=True)
+
+    # The due cards of the search are prefetched with their HTML (see study_prefetch.py),
+    # so a grade click shows the next card without querying the database
+    queues = st.session_state.setdefault('study_queues', {})
+    queue_key = (username, selected_search)
+    if queue_key not in queues:
+        # The new queue must not see cards whose grade is still being saved
+        writer.wait()
+        if selected_search == ALL_SEARCHES:
+            # Every due card of the user, most urgent first (see study_queue.py)
+            queues[queue_key] = GlobalStudyQueue(username, writer=writer)
+        else:
+            queues[queue_key] = StudyQueue(username, selected_search, writer=writer)
+    queue = queues[queue_key]
+    for search, flashcard, grade, error in failed_grades:
+        st.error(f"Your answer to '{flashcard[0]}' could not be saved ({type(error).__name__}). Please grade it again.")
+        queue.requeue(search, flashcard)
+
+    card = queue.current()
+    if card is None:
+        # The last grades may still be saving: the next run puts back the cards of the failed ones
+        writer.wait()
+        if writer.has_failures():
+            st.rerun()
         # If there are no more flashcards to study
         st.markdown("You have no more pending flashcards for today.")
+        # New flashcards may be added to the search later in the session
+        del queues[queue_key]
+        st.session_state.pop('study_overview', None)
+        return
 
+    search, flashcard, card_html = card
+    if selected_search == ALL_SEARCHES:
+        st.caption(search)
+    # Display the flashcard in a styled card (HTML/CSS)
+    st.markdown(card_html, unsafe_allow_html=True)
 
-class KeyConcepts(BaseModel):
-    key_concepts: str = Field(..., title="Key Concepts", description="A single and relevant Key concept extracted from the text")
-    definition: str = Field(..., title="Definition", description="Simple and 3-lines technical definition of the key concept")
+    click_time = st.session_state.pop('study_click_time', None)
+    if click_time is not None:
+        tracing.observe('study_next_card_seconds', time.perf_counter() - click_time)
 
+    # Create columns for the evaluation buttons
+    columns = st.columns(5)
+    for column, (label, grade) in zip(columns, GRADE_BUTTONS):
+        with column:
+            st.button(label, key=f"grade_{grade}", on_click=grade_card, args=(queue, grade))
 
-class Flashcards(BaseModel):
-    """Extracted flashcards from the text"""
-    flashcards: List[KeyConcepts]
+
+def grade_card(queue, grade):
+    """
+    Callback of the grade buttons: runs before the rerun, so the rerun already shows the next card.
+    """
+    st.session_state['study_click_time'] = time.perf_counter()
+    search = queue.grade(grade)
+    if search is None:
+        return
+    due_counts = st.session_state['study_overview'][2]
+    due_counts[search] = max(0, due_counts.get(search, 0) - 1)
+    # The queues of the other modes still hold the graded card: they are reloaded when selected
+    queues = st.session_state['study_queues']
+    for key in [key for key, other in queues.items() if other is not queue]:
+        del queues[key]
 
 
-model = ChatOpenAI(model="gpt-4o-mini")
+model = get_chat_model()
 
 def user_performance_dashboard():
     """
@@ -300,6 +327,28 @@ def user_performance_dashboard():
 
     st.altair_chart(chart)
 
+    # 5) Forecast of the upcoming review load
+    df_forecast = forecast_reviews(username)
+    forecast_chart = (
+        alt.Chart(df_forecast)
+        .mark_bar(color="#ea7b13")
+        .encode(
+            x=alt.X("date:T", axis=alt.Axis(format="%b", title=None)),
+            y=alt.Y("reviews:Q", title="Expected reviews"),
+            tooltip=[
+                alt.Tooltip("date:T", title="Data"),
+                alt.Tooltip("reviews:Q", title="Expected reviews", format=".1f")
+            ]
+        )
+        .properties(
+            width=800,
+            height=200,
+            title="Expected reviews per day (next 365 days)"
+        )
+    )
+
+    st.altair_chart(forecast_chart)
+
 def generate_flashcards():
     """
     Generates flashcards from a document.
@@ -318,7 +367,7 @@ def generate_flashcards():
     Notes
     -----
     This function uses the LLM from langchain to process the text and generate the flashcards.
-    The flashcards are saved to the database using the add_flashcard_study function.
+    The flashcards are saved to the database using the save_flashcards function.
     """
     st.markdown(css, unsafe_allow_html=True)
 
@@ -327,71 +376,276 @@ def generate_flashcards():
     st.write("This application extracts key concepts from a PDF and returns a structured object.")
 
     try:
-        uploaded_file = st.file_uploader("Upload a document", type=["pdf", "docx", "csv", "html", "ppt"])
+        uploaded_file = st.file_uploader("Upload a document", type=["pdf", "docx", "csv", "tsv", "apkg", "html", "ppt", "pptx"])
     except:
-        st.error("Invalid document. Available extensions: pdf, docx, html, ppt")
-
-    if uploaded_file is not None:
-        # Define the prompt
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are an expert key concepts extraction algorithm. "
-                    "Extract all the relevant key concepts from the text. "
-                    "If you do not know the value of an attribute asked to extract, "
-                    "return null for the attribute's value."
-                ),
-                ("human", "{text}")
-            ]
-        )
-        if st.button("Generate Flashcards"):
-            try:
-                loader = AutoLoaderDocument(document=uploaded_file)
-                text = loader.extract_text()
+        st.error("Invalid document. Available extensions: pdf, docx, csv, tsv, apkg, html, ppt, pptx")
 
-                source_search = loader.document.name
-
-                runnable = prompt | model.with_structured_output(schema=Flashcards)
-                
-                with st.spinner(f"Processing {source_search}..."):
-                    result = runnable.invoke(input=text)
+    if uploaded_file is not None and is_deck_file(uploaded_file.name):
+        # CSV / TSV / Anki decks already hold flashcards: they are imported without the LLM
+        if st.button("Import Flashcards"):
+            try:
+                with st.spinner(f"Importing {uploaded_file.name}..."):
+                    inserted, skipped = import_cards(
+                        st.session_state['username'],
+                        uploaded_file.name,
+                        iter_deck_cards(uploaded_file, uploaded_file.name)
+                    )
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"Could not import {uploaded_file.name}: {e}")
+                return
+            st.session_state.pop('study_overview', None)
+            st.success(f"{inserted} flashcards imported from {uploaded_file.name}.")
+            if skipped:
+                st.info(f"{skipped} duplicate flashcards were skipped.")
+
+    book_mode = st.checkbox("Book mode", help="For very long documents: summarizes the document and extracts a limited number of flashcards per section.")
+    if book_mode:
+        max_cards_per_section = st.slider("Flashcards per section", 1, 30, MAX_CARDS_PER_SECTION)
+    # On by default for the new versions of documents already processed this way: on a first
+    # upload it splits the document in parts, one model call each, instead of a single call
+    incremental = not book_mode and st.checkbox(
+        "Only process new or changed parts",
+        value=uploaded_file is not None and has_document_chunks(st.session_state['username'], uploaded_file.name),
+        help="Splits the document in parts and remembers them, so that when a new version of the document "
+             "is uploaded, only the parts that changed are sent to the model."
+    )
 
-            except openai.BadRequestError as e:
-                if "context_length_exceeded" in str(e) or "maximum context length" in str(e):
-                    loader = AutoLoaderDocument(document=uploaded_file, huge_file=True)
+    if uploaded_file is not None and not is_deck_file(uploaded_file.name):
+        generate = st.button("Generate Flashcards")
+        loader = AutoLoaderDocument(document=uploaded_file)
+        if generate and loader.is_huge():
+            # Too big to hold its text in memory: streamed page by page, without book mode
+            with tracing.span('generate_flashcards', document=uploaded_file.name, streaming=True):
+                generate_flashcards_streaming(loader, uploaded_file.name)
+        elif generate:
+            with tracing.span('generate_flashcards', document=uploaded_file.name):
+                try:
                     text = loader.extract_text()
 
                     source_search = loader.document.name
 
-                    runnable = prompt | model.with_structured_output(schema=Flashcards)
-                    
-                    with st.spinner(f"Processing {source_search}..."):
-                        result = runnable.invoke(input=text)
+                    if book_mode:
+                        with st.spinner(f"Summarizing {source_search}..."):
+                            flashcards, report = generate_hierarchical(text, model, max_cards_per_section)
+                        if report["errors"]:
+                            st.warning(f"{len(report['errors'])} parts could not be processed.")
+                    elif incremental:
+                        with st.spinner(f"Processing the new parts of {source_search}..."):
+                            flashcards, report = generate_incremental(st.session_state['username'], source_search, text, model)
+                        show_incremental_report(report)
+                    else:
+                        with st.spinner(f"Processing {source_search}..."):
+                            flashcards = extract_flashcards(text, model)
+
+                except ValueError as e:
+                    st.error(str(e))
+                    return
+
+                except openai.OpenAIError as e:
+                    if not is_context_length_error(e):
+                        st.error(f"Could not generate flashcards, please try again later. ({type(e).__name__})")
+                        return
+
+                    # The document does not fit in the context window: process it in chunks
+                    chunks = split_text(text)
+                    with st.spinner(f"Processing {source_search} in {len(chunks)} parts..."):
+                        flashcards, errors = extract_flashcards_from_chunks(chunks, model)
+                    if errors:
+                        st.warning(f"{len(errors)} of {len(chunks)} parts could not be processed.")
+
+                show_and_save_flashcards(flashcards, source_search)
+
+    generate_flashcards_from_urls()
+
+
+def show_incremental_report(report):
+    """
+    Displays what an incremental generation (incremental.generate_incremental) reused and flagged.
+    """
+    if report["reused"]:
+        st.info(
+            f"{report['reused']} of {report['chunks']} parts are unchanged and were not processed again: "
+            f"{report['tokens_saved']:,} of {report['tokens_full']:,} tokens saved."
+        )
+    if report["failed"]:
+        st.warning(f"{report['failed']} of {report['chunks']} parts could not be processed.")
+    if report["updated_flashcards"]:
+        with st.expander(f"{len(report['updated_flashcards'])} flashcards got a new definition from the changed parts"):
+            st.write(", ".join(report["updated_flashcards"]))
+    if report["stale_flashcards"]:
+        with st.expander(f"{len(report['stale_flashcards'])} flashcards come from removed parts of the document and are not scheduled anymore"):
+            st.write(", ".join(report["stale_flashcards"]))
 
 
-            flashcards = result.flashcards
+def generate_flashcards_streaming(loader, source_search):
+    """
+    Generates flashcards from a document bigger than the extraction memory budget
+    (FLASHCARD_EXTRACT_MEMORY_MB): its pages are streamed into the chunks sent to the model,
+    and the flashcards are saved as they come instead of being displayed.
+    """
+    username = st.session_state['username']
+    processed, failed, saved = 0, 0, 0
+    progress = st.empty()
+    try:
+        with st.spinner(f"Processing {source_search} page by page..."):
+            for flashcards, error in extract_flashcards_streaming(iter_chunks(loader.iter_text()), model):
+                processed += 1
+                if error is not None:
+                    failed += 1
+                else:
+                    saved += save_flashcards(username, source_search, flashcards)
+                progress.text(f"{processed} parts processed, {saved} flashcards saved")
+    except ValueError as e:
+        st.error(str(e))
+        return
+    finally:
+        st.session_state.pop('study_overview', None)
+    st.success(f"{saved} flashcards saved from {source_search}.")
+    if failed:
+        st.warning(f"{failed} of {processed} parts could not be processed.")
 
-            for card in flashcards:
-                flashcard_name = card.key_concepts
-                flashcard_text = card.definition
 
-                card_html = f"""
-                    <div class="card">
-                        <div class="card-title">{flashcard_name}</div>
-                        <div class="small-desc">{flashcard_text}</div>
-                        <div class="go-corner">
-                        </div>
-                    </div>"""
-                st.markdown(card_html, unsafe_allow_html=True)
+def generate_flashcards_from_urls():
+    """
+    Streamlit section generating flashcards from websites, YouTube videos and playlists.
+
+    The URLs are fetched concurrently (see ingestion.py) and every source is sent to
+    the model as soon as it is fetched, with transcripts streamed into chunks.
+    """
+    st.subheader("Websites and YouTube")
+
+    urls = st.text_area("URLs (one per line): websites, YouTube videos or playlists")
+
+    if st.button("Generate Flashcards from URLs"):
+        url_list = [url.strip() for url in urls.splitlines() if url.strip()]
+        if not url_list:
+            st.warning("Please enter at least one URL.")
+            return
+
+        with tracing.span('generate_flashcards_from_urls', urls=len(url_list)):
+            with st.spinner("Fetching sources..."):
+                for source in ingest_urls(url_list):
+                    if source.error is not None:
+                        st.error(f"Could not load {source.url}: {source.error}")
+                        continue
+
+                    flashcards, errors = extract_flashcards_from_chunks(source_chunks(source), model)
+                    if errors:
+                        st.warning(f"{len(errors)} parts of {source.url} could not be processed.")
+
+                    st.markdown(f"**{source.url}**")
+                    show_and_save_flashcards(flashcards, source.url)
+
+
+def show_and_save_flashcards(flashcards, source_search):
+    """
+    Displays the generated flashcards as cards and saves them to the database
+    under the given search (document name or URL).
+    """
+    st.session_state.pop('study_overview', None)
+    for card in flashcards:
+        st.markdown(render_card_html(card.key_concepts, card.definition), unsafe_allow_html=True)
+    save_flashcards(st.session_state['username'], source_search, flashcards)
+
+def decks_section():
+    """
+    Exports the user's flashcards and review history to a file, and imports decks exported
+    from another instance.
+    """
+    st.subheader("Decks")
+    username = st.session_state['username']
+
+    fmt = st.radio("Format", list(FORMATS), format_func=lambda fmt: f"{fmt} ({FORMATS[fmt]})", horizontal=True)
+    if st.button("Prepare export"):
+        buffer = io.BytesIO()
+        with st.spinner("Exporting..."):
+            exported = export_deck(username, buffer, fmt)
+        st.session_state['deck_export'] = (f"{username}_flashcards{FORMATS[fmt]}", buffer.getvalue(), exported)
+
+    if 'deck_export' in st.session_state:
+        file_name, data, exported = st.session_state['deck_export']
+        st.download_button(f"Download {file_name} ({exported} rows)", data, file_name=file_name)
+
+    uploaded_deck = st.file_uploader("Import a deck", type=["parquet", "zst"])
+    if uploaded_deck is not None and st.button("Import"):
+        try:
+            with st.spinner("Importing..."):
+                inserted, skipped = import_deck(username, uploaded_deck, format_of(uploaded_deck.name))
+        except ValueError as e:
+            st.error(str(e))
+            return
+        st.session_state.pop('study_overview', None)
+        st.success(f"{inserted} rows imported.")
+        if skipped:
+            st.info(f"Already in your decks, not imported: {', '.join(sorted(skipped))}")
+
+def flatten_spans(trace, depth=0):
+    """
+    Flattens a trace (nested spans) into a list of rows for display.
+    """
+    rows = [{
+        "span": "  " * depth + trace["name"],
+        "duration_ms": round((trace["duration"] or 0) * 1000, 2),
+        "attributes": json.dumps(trace["attributes"], default=str)
+    }]
+    for child in trace["children"]:
+        rows.extend(flatten_spans(child, depth + 1))
+    return rows
+
+
+def traces_admin_panel():
+    """
+    Admin panel listing the recent traces and the current metrics of the tracing layer.
+    Only available in the menu when the FLASHCARD_ADMIN_PANEL environment variable is set.
+    """
+    st.subheader("Traces")
+
+    traces = tracing.recent_traces(limit=50)
+    metrics = tracing.prometheus_text()
+
+    col1, col2 = st.columns(2)
+    col1.download_button(
+        "Download traces (JSONL)",
+        "\n".join(json.dumps(trace, default=str) for trace in traces[::-1]),
+        file_name="traces.jsonl"
+    )
+    col2.download_button("Download metrics (Prometheus)", metrics, file_name="metrics.prom")
+
+    if not traces:
+        st.info("No traces recorded yet.")
+    for trace in traces:
+        started = datetime.fromtimestamp(trace["start_time"]).strftime('%Y-%m-%d %H:%M:%S')
+        with st.expander(f"{started} - {trace['name']} ({trace['duration']:.3f}s)"):
+            st.dataframe(pd.DataFrame(flatten_spans(trace)), use_container_width=True)
+
+    with st.expander("Metrics"):
+        st.code(metrics, language="text")
+
+    with st.expander("OpenAI rate limiter"):
+        st.json(get_rate_limiter().metrics())
+
+    with st.expander("Query cache"):
+        st.json(get_query_cache().metrics())
+
+    st.subheader("SQL Profiler")
+    if not sql_profiler.ENABLED:
+        st.info("SQL profiling is disabled. Set FLASHCARD_SQL_PROFILE=1 to enable it.")
+        return
+    query_stats = sql_profiler.query_stats()
+    if not query_stats:
+        st.info("No SQL statements recorded yet.")
+        return
+    st.caption(f"Slow query threshold: {sql_profiler.SLOW_QUERY_MS} ms, log file: {sql_profiler.SLOW_QUERY_LOG}")
+    st.dataframe(
+        pd.DataFrame(query_stats)[["statement", "count", "avg_ms", "max_ms", "total_ms", "slow"]],
+        use_container_width=True
+    )
+    for entry in query_stats:
+        if entry["issues"]:
+            with st.expander(f"{entry['statement'][:80]}"):
+                st.warning("\n".join(f"- {issue}" for issue in entry["issues"]))
+                st.code("\n".join(entry["plan"]), language="text")
 
-                # Save the flashcards to the database
-                add_flashcard_study(
-                    st.session_state['username'], 
-                    source_search, 
-                    flashcard_name, 
-                    flashcard_text
-                )
 
 def main():
     global css
@@ -399,9 +653,12 @@ def main():
     st.title("Flashcard Anything")
 
     create_usertable()
+    migrate_database()
 
     # Example sidebar menu
-    menu_options = ["Home", "Login", "Sign Up", "Generate Flashcards", "Study Flashcards", "Performance Dashboard"]
+    menu_options = ["Home", "Login", "Sign Up", "Generate Flashcards", "Study Flashcards", "Performance Dashboard", "Decks"]
+    if os.getenv("FLASHCARD_ADMIN_PANEL"):
+        menu_options.append("Traces")
     choice = st.sidebar.selectbox("Menu", menu_options)
 
     # If the user has already logged in, display their name
@@ -436,6 +693,15 @@ def main():
     elif choice == "Performance Dashboard":
         user_performance_dashboard()
 
+    elif choice == "Decks":
+        if "username" in st.session_state:
+            decks_section()
+        else:
+            st.warning("Please log in to export or import decks.")
+
+    elif choice == "Traces":
+        traces_admin_panel()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,101 @@
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+
+# Slides parsed at the same time by pptx_text
+SLIDE_WORKERS = int(os.getenv("FLASHCARD_SLIDE_WORKERS", "4"))
+
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DRAWING_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+SLIDE_NAME = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+
+# Errors meaning the file is not a readable OOXML package: the caller falls back to Unstructured
+OOXML_ERRORS = (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError)
+
+
+def _paragraphs(source, namespace):
+    """
+    Yields the text of every paragraph (<p>) of an OOXML part, streaming the XML with iterparse.
+    Finished elements are cleared, so memory does not grow with the size of the part.
+    """
+    paragraph, text, tab, line_break = (f"{{{namespace}}}{tag}" for tag in ("p", "t", "tab", "br"))
+    parts = []
+    for event, element in etree.iterparse(source, events=("end",), tag=(paragraph, text, tab, line_break)):
+        if element.tag == text:
+            parts.append(element.text or "")
+        elif element.tag == tab:
+            parts.append("\t")
+        elif element.tag == line_break:
+            parts.append("\n")
+        else:
+            if parts:
+                yield "".join(parts)
+                parts = []
+            element.clear()
+            # Also drop the already processed siblings kept by the parent
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def iter_docx_paragraphs(file):
+    """
+    Yields the paragraphs of a .docx file (path or binary file object), in document order.
+    """
+    with zipfile.ZipFile(file) as package, package.open("word/document.xml") as document:
+        yield from _paragraphs(document, WORD_NS)
+
+
+def docx_text(file):
+    """
+    Returns the text of a .docx file (path or binary file object), one paragraph per line.
+    """
+    return "\n".join(iter_docx_paragraphs(file))
+
+
+def _slide_text(package, name):
+    with package.open(name) as slide:
+        return "\n".join(_paragraphs(slide, DRAWING_NS))
+
+
+def iter_pptx_slides(file, max_workers=SLIDE_WORKERS):
+    """
+    Yields the text of every non empty slide of a .pptx file (path or binary file object),
+    in slide order. Slides are parsed in parallel, max_workers at a time, and only the
+    texts of the slides being parsed are held in memory.
+    """
+    with zipfile.ZipFile(file) as package:
+        slides = sorted(
+            (name for name in package.namelist() if SLIDE_NAME.match(name)),
+            key=lambda name: int(SLIDE_NAME.match(name).group(1))
+        )
+        if not slides:
+            raise KeyError("ppt/slides")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for start in range(0, len(slides), max_workers):
+                batch = slides[start:start + max_workers]
+                for text in executor.map(lambda name: _slide_text(package, name), batch):
+                    if text:
+                        yield text
+
+
+def pptx_text(file, max_workers=SLIDE_WORKERS):
+    """
+    Returns the text of a .pptx file (path or binary file object), slides in order and
+    separated by blank lines. Slides are parsed in parallel, max_workers at a time.
+    """
+    return "\n\n".join(iter_pptx_slides(file, max_workers))
+
+
+# Extractors of the formats read without Unstructured, by file extension
+FAST_PATHS = {
+    "docx": docx_text,
+    "pptx": pptx_text,
+}
+
+# Streaming versions of FAST_PATHS, yielding the text piece by piece (see AutoLoaderDocument.iter_text)
+STREAMING_FAST_PATHS = {
+    "docx": iter_docx_paragraphs,
+    "pptx": iter_pptx_slides,
+}
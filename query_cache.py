@@ -0,0 +1,139 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+import tracing
+
+# Results kept by the cache of the db_services reads, least recently used evicted first (0 disables the cache)
+QUERY_CACHE_SIZE = int(os.getenv("FLASHCARD_QUERY_CACHE_SIZE", "2048"))
+# Seconds a cached result is used: bounds the staleness of writes made by other processes
+# (the API server, another Streamlit worker), which do not invalidate this process' cache
+QUERY_CACHE_TTL = float(os.getenv("FLASHCARD_QUERY_CACHE_TTL", "60"))
+
+
+def _copy(value):
+    # Callers may modify what they get (DataFrame columns, lists): the cached value is never handed out
+    if isinstance(value, (pd.DataFrame, dict, list)):
+        return value.copy()
+    return value
+
+
+class QueryCache:
+    """
+    Read-through LRU cache of per user query results.
+
+    Every user has a generation counter, part of the key of its entries. A write of a user
+    bumps the counter once committed (invalidate), so the entries of that user are not
+    read anymore and age out of the LRU, while the entries of the other users stay valid.
+    A result loaded while a write was committing is stored under the old generation and
+    never served after the write returns.
+
+    Invalidation is per process: with several replicas (Streamlit workers, API servers) on
+    one database, a write made through one replica shows up in the others' reads up to
+    ttl seconds (QUERY_CACHE_TTL, 60 by default) later.
+
+    Parameters
+    ----------
+    max_entries : int
+        Number of results kept.
+    ttl : float
+        Seconds a result is used.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        # Generation of every user at once, bumped by invalidate(None)
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_load(self, name, username, args, load):
+        """
+        Returns the cached result of name(username, *args), or calls load() and caches its result.
+        """
+        if self.max_entries <= 0:
+            return load()
+        with self.lock:
+            key = (name, username, args, self.epoch, self.generations.get(username, 0))
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                tracing.increment('query_cache_hits_total', statement=name)
+                return _copy(entry[0])
+            self.stats["misses"] += 1
+        tracing.increment('query_cache_misses_total', statement=name)
+
+        value = load()
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            evicted = 0
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            self.stats["evictions"] += evicted
+        if evicted:
+            tracing.increment('query_cache_evictions_total', evicted)
+        return _copy(value)
+
+    def invalidate(self, username=None):
+        """
+        Invalidates the cached results of a user (or of every user).
+        """
+        with self.lock:
+            if username is None:
+                self.epoch += 1
+                self.entries.clear()
+            else:
+                self.generations[username] = self.generations.get(username, 0) + 1
+            self.stats["invalidations"] += 1
+        tracing.increment('query_cache_invalidations_total')
+
+    def metrics(self):
+        """
+        Returns the cache counters, the hit rate and the number of cached results.
+        """
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["entries"] = len(self.entries)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = round(metrics["hits"] / lookups, 4) if lookups else 0.0
+        return metrics
+
+
+_cache = QueryCache()
+
+
+def get_query_cache():
+    """
+    Returns the process wide cache of the db_services reads.
+    """
+    return _cache
+
+
+def cached_read(func):
+    """
+    Decorator caching a db_services read whose first argument is the user name.
+    The write functions of that user call invalidate_user once their transaction is committed.
+    """
+    @functools.wraps(func)
+    def wrapper(username, *args, **kwargs):
+        return _cache.get_or_load(
+            func.__name__, username, args + tuple(sorted(kwargs.items())),
+            lambda: func(username, *args, **kwargs)
+        )
+    wrapper.uncached = func
+    return wrapper
+
+
+def invalidate_user(username=None):
+    """
+    Invalidates the cached reads of a user (or of every user) after a write.
+    """
+    _cache.invalidate(username)
@@ -0,0 +1,266 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import openai
+import tracing
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Errors worth retrying; anything else (e.g. context length BadRequestError) is raised immediately
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at per_second, holding at most capacity.
+    Not thread safe on its own: RateLimiter only uses it while holding its lock.
+    """
+    def __init__(self, capacity, per_second):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        Seconds until amount can be consumed.
+        """
+        self._refill(now)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.per_second
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, delta):
+        """
+        Gives back (negative delta) or takes (positive delta) tokens after the real usage is known.
+        The level may go negative, which delays the next requests.
+        """
+        self.level = min(self.capacity, self.level - delta)
+
+
+class RateLimiter:
+    """
+    Process wide limiter for OpenAI calls, aware of requests per minute and tokens per minute.
+
+    Callers wait in a priority queue shared by every Streamlit session of the process, so
+    interactive generations go before batch jobs. Retryable errors are retried with
+    exponential backoff and full jitter, and a 429 pauses every caller, not only the one
+    that received it, to avoid error storms.
+
+    Parameters
+    ----------
+    requests_per_minute : int
+        Account limit of requests per minute.
+    tokens_per_minute : int
+        Account limit of tokens (input + output) per minute.
+    max_retries : int
+        Retries of a call before the error is raised.
+    base_delay : float
+        First backoff delay in seconds, doubled at every retry.
+    max_delay : float
+        Upper bound of the backoff delay in seconds.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._metrics = {
+            "requests": 0,
+            "tokens_reserved": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    def reservation(self, tokens):
+        """
+        Returns the number of tokens acquire reserves for a request of the given size,
+        which is what settle must be given back.
+        """
+        # A request bigger than the whole bucket could never be served otherwise
+        return min(tokens, self.tokens.capacity)
+
+    def acquire(self, tokens, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Blocks until a request of the given number of tokens can be sent.
+        Returns the number of tokens reserved (see reservation).
+        """
+        tokens = self.reservation(tokens)
+        entry = (priority, next(self._sequence))
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] == entry:
+                        wait = max(
+                            self.paused_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now)
+                        )
+                        if wait <= 0:
+                            heapq.heappop(self._queue)
+                            self.requests.consume(1, now)
+                            self.tokens.consume(tokens, now)
+                            self._metrics["requests"] += 1
+                            self._metrics["tokens_reserved"] += tokens
+                            self._metrics["throttled_seconds"] += now - start
+                            self._condition.notify_all()
+                            break
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for the OpenAI rate limiter.")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+                raise
+        tracing.observe("llm_throttle_seconds", time.monotonic() - start)
+        return tokens
+
+    def settle(self, reserved, used):
+        """
+        Corrects the token bucket once the real usage of a request is known.
+        """
+        with self._condition:
+            self.tokens.adjust(used - reserved)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Stops every caller for the given number of seconds (after a 429).
+        """
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt, error=None):
+        """
+        Delay before the given retry attempt: the Retry-After header when the API sends one,
+        otherwise exponential backoff with full jitter.
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, func, tokens, priority=PRIORITY_INTERACTIVE, usage=None):
+        """
+        Calls func() once the limiter allows it, retrying retryable OpenAI errors.
+
+        Every attempt reserves tokens and settles its own reservation: with usage(result), the real
+        number of tokens, when it succeeds and usage is given, otherwise a failed attempt gives
+        all of it back, so retries and errors do not drain the bucket.
+        """
+        attempt = 0
+        while True:
+            reserved = self.acquire(tokens, priority)
+            used = 0
+            try:
+                result = func()
+                used = reserved if usage is None else usage(result)
+                return result
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                error_name = type(e).__name__
+                tracing.increment("llm_errors_total", error=error_name)
+                rate_limited = isinstance(e, openai.RateLimitError)
+                with self._condition:
+                    if rate_limited:
+                        self._metrics["rate_limited"] += 1
+                    if attempt > self.max_retries:
+                        self._metrics["failures"] += 1
+                    else:
+                        self._metrics["retries"] += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                tracing.increment("llm_retries_total", error=error_name)
+                if rate_limited:
+                    self.pause(delay)
+            finally:
+                self.settle(reserved, used)
+            time.sleep(delay)
+
+    def metrics(self):
+        """
+        Returns the limiter counters, the queue depth and the current bucket levels.
+        """
+        with self._condition:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._queue)
+            metrics["requests_available"] = round(self.requests.level, 2)
+            metrics["tokens_available"] = round(self.tokens.level, 2)
+            metrics["paused_for"] = round(max(0.0, self.paused_until - now), 2)
+        metrics["throttled_seconds"] = round(metrics["throttled_seconds"], 3)
+        return metrics
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Returns the process wide RateLimiter, created from the FLASHCARD_OPENAI_* environment variables.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_minute=int(os.getenv("FLASHCARD_OPENAI_RPM", "500")),
+                tokens_per_minute=int(os.getenv("FLASHCARD_OPENAI_TPM", "200000")),
+                max_retries=int(os.getenv("FLASHCARD_OPENAI_MAX_RETRIES", "5")),
+                base_delay=float(os.getenv("FLASHCARD_OPENAI_RETRY_BASE_DELAY", "1.0")),
+                max_delay=float(os.getenv("FLASHCARD_OPENAI_RETRY_MAX_DELAY", "60.0"))
+            )
+        return _rate_limiter
+
+
+def configure_rate_limiter(**kwargs):
+    """
+    Replaces the process wide RateLimiter (used by the benchmarks).
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = RateLimiter(**kwargs)
+        return _rate_limiter
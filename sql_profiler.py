@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Profiling is off unless FLASHCARD_SQL_PROFILE is set (or enable() is called)
+ENABLED = bool(os.getenv("FLASHCARD_SQL_PROFILE"))
+# Statements slower than this are written to the slow query log with their query plan
+SLOW_QUERY_MS = float(os.getenv("FLASHCARD_SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG = os.getenv("FLASHCARD_SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_BYTES = int(os.getenv("FLASHCARD_SLOW_QUERY_LOG_BYTES", str(1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("FLASHCARD_SLOW_QUERY_LOG_BACKUPS", "5"))
+
+# Predicates that wrap a column in a function, which prevents SQLite from using an index
+NON_SARGABLE_PATTERNS = [
+    (re.compile(r"\b(?:DATE|DATETIME|STRFTIME|JULIANDAY|LOWER|UPPER|SUBSTR)\s*\(\s*\w+\s*[,)]\s*(?:[<>=!]|IN\b|BETWEEN\b)", re.IGNORECASE),
+     "function applied to a column in a predicate"),
+    (re.compile(r"\bNOT\s+IN\s*\(\s*SELECT\b", re.IGNORECASE),
+     "NOT IN subquery"),
+    (re.compile(r"\bLIKE\s+'%", re.IGNORECASE),
+     "LIKE with a leading wildcard"),
+]
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_lock = threading.Lock()
+_stats = {}
+_plans = {}
+_logger = None
+
+
+def enable(threshold_ms=None, log_path=None):
+    """
+    Turns profiling on, optionally changing the slow query threshold and log file.
+    """
+    global ENABLED, SLOW_QUERY_MS, SLOW_QUERY_LOG, _logger
+    ENABLED = True
+    if threshold_ms is not None:
+        SLOW_QUERY_MS = threshold_ms
+    if log_path is not None and log_path != SLOW_QUERY_LOG:
+        SLOW_QUERY_LOG = log_path
+        _logger = None
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def _get_logger():
+    """
+    Returns the slow query logger, writing JSON lines to a rotating file.
+    """
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("flashcard.slow_queries")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(
+            SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def normalize(sql):
+    """
+    Collapses whitespace so the same statement always has the same key.
+    """
+    return " ".join(sql.split())
+
+
+def explain(conn, sql, parameters=None):
+    """
+    Returns the EXPLAIN QUERY PLAN rows (details only) of a statement.
+    When parameters are unknown (executemany) every placeholder is bound to NULL.
+    """
+    if parameters is None:
+        parameters = [None] * sql.count("?")
+    # A plain sqlite3.Cursor, so the plan query itself is not profiled
+    cursor = sqlite3.Cursor(conn)
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def find_issues(sql, plan):
+    """
+    Flags full table scans in the plan and non sargable predicates in the statement.
+    """
+    issues = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and "USING" not in detail:
+            issues.append(f"full table scan: {detail}")
+        elif "USE TEMP B-TREE" in detail:
+            issues.append(f"temporary b-tree: {detail}")
+    for pattern, description in NON_SARGABLE_PATTERNS:
+        if pattern.search(sql):
+            issues.append(description)
+    return issues
+
+
+def _plan_for(conn, key, sql, parameters):
+    """
+    Returns (plan, issues) for a statement, explaining every distinct statement only once.
+    A statement with issues is written to the log the first time it is seen.
+    """
+    with _lock:
+        cached = _plans.get(key)
+    if cached is not None:
+        return cached
+    try:
+        plan = explain(conn, sql, parameters)
+    except sqlite3.Error as e:
+        plan = [f"EXPLAIN failed: {e}"]
+    issues = find_issues(sql, plan)
+    with _lock:
+        _plans[key] = (plan, issues)
+    if issues:
+        _get_logger().warning(json.dumps({
+            "event": "query_plan_issue",
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "statement": key,
+            "plan": plan,
+            "issues": issues
+        }))
+    return plan, issues
+
+
+def record(conn, sql, parameters, elapsed):
+    """
+    Records the execution of a statement. Called by db_services.TracedCursor when profiling is enabled.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The connection that ran the statement (used for EXPLAIN QUERY PLAN).
+    sql : str
+        The statement.
+    parameters : sequence or None
+        The bound parameters, or None for executemany.
+    elapsed : float
+        Execution time in seconds.
+    """
+    key = normalize(sql)
+    elapsed_ms = elapsed * 1000
+    with _lock:
+        stats = _stats.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms >= SLOW_QUERY_MS:
+            stats["slow"] += 1
+
+    if not key.upper().startswith(EXPLAINABLE):
+        return
+    plan, issues = _plan_for(conn, key, sql, parameters)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _get_logger().info(json.dumps({
+            "event": "slow_query",
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "statement": key,
+            "parameters": [str(p)[:100] for p in parameters] if parameters is not None else None,
+            "plan": plan,
+            "issues": issues
+        }, default=str))
+
+
+def query_stats():
+    """
+    Returns the per statement statistics, slowest (by total time) first.
+    Each entry has statement, count, total_ms, avg_ms, max_ms, slow, plan and issues.
+    """
+    with _lock:
+        items = [(key, dict(stats)) for key, stats in _stats.items()]
+        plans = dict(_plans)
+    report = []
+    for key, stats in items:
+        plan, issues = plans.get(key, ([], []))
+        report.append({
+            "statement": key,
+            "count": stats["count"],
+            "total_ms": round(stats["total_ms"], 3),
+            "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+            "max_ms": round(stats["max_ms"], 3),
+            "slow": stats["slow"],
+            "plan": plan,
+            "issues": issues
+        })
+    return sorted(report, key=lambda entry: entry["total_ms"], reverse=True)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _plans.clear()
@@ -0,0 +1,193 @@
+import html
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from db_services import get_flashcards_study, update_flashcard_study
+import tracing
+
+# Number of due cards kept ready in memory, refilled in the background when half of them are used
+PREFETCH_CARDS = int(os.getenv("FLASHCARD_PREFETCH_CARDS", "10"))
+
+# Shared by every session: reruns of the Streamlit script do not re-import this module
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+# A single writer keeps the grades of a session in click order
+_write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='study-write')
+
+
+def render_card_html(flashcard_name, flashcard_text):
+    """
+    Returns the HTML of a flashcard, styled by styles.html.
+    The fields come from LLM output, imported decks and the API: they are escaped, never markup.
+    """
+    return f"""
+            <div class="card">
+                <div class="card-title">{html.escape(flashcard_name)}</div>
+                <div class="small-desc">{html.escape(flashcard_text)}</div>
+                <div class="go-corner"></div>
+            </div>
+        """
+
+
+def _load_cards(username, search, limit):
+    with tracing.span('study_prefetch', limit=limit) as prefetch_span:
+        flashcards = get_flashcards_study(username, search, limit=limit)
+        cards = [(flashcard, render_card_html(flashcard[0], flashcard[1])) for flashcard in flashcards]
+        prefetch_span.set(cards=len(cards))
+    return cards
+
+
+def _write_grade(username, search, flashcard, grade):
+    flashcard_name, flashcard_text, last_studied, current_interval, current_ease_factor, current_reps = flashcard
+    try:
+        update_flashcard_study(username, search, flashcard_name, flashcard_text,
+                               grade, current_interval, current_ease_factor, current_reps)
+    except Exception:
+        tracing.increment('study_write_errors_total')
+        raise
+
+
+def submit_grade(username, search, flashcard, grade):
+    """
+    Saves the grade of a flashcard (a get_flashcards_study tuple) in the background writer.
+    Returns the future of the write: use a GradeWriter to have its failure reported.
+    """
+    return _write_pool.submit(_write_grade, username, search, flashcard, grade)
+
+
+class GradeWriter:
+    """
+    Grades of one session saved by the background writer, kept in the session state.
+
+    The futures of the writes are kept until failures() reports them, so a grade that could
+    not be saved is shown to the user and its card studied again instead of being lost.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.lock = threading.Lock()
+
+    def submit(self, username, search, flashcard, grade):
+        future = submit_grade(username, search, flashcard, grade)
+        with self.lock:
+            self.pending.append((future, search, flashcard, grade))
+        return future
+
+    def failures(self):
+        """
+        Returns (search, flashcard, grade, exception) for the finished writes that failed,
+        and forgets the finished ones.
+        """
+        failed = []
+        with self.lock:
+            # The single writer finishes the grades in submission order
+            while self.pending and self.pending[0][0].done():
+                future, search, flashcard, grade = self.pending.popleft()
+                if future.exception() is not None:
+                    failed.append((search, flashcard, grade, future.exception()))
+        return failed
+
+    def wait(self):
+        """
+        Blocks until the grades submitted so far by this session are written (saved or failed).
+        main.py calls it before loading a new queue, so the queue does not see cards whose grade
+        is still being saved. The grades of the other sessions are not waited for.
+        """
+        with self.lock:
+            futures = [future for future, _, _, _ in self.pending]
+        wait(futures)
+
+    def has_failures(self):
+        """
+        Checks if a finished write failed, without forgetting it.
+        """
+        with self.lock:
+            return any(future.done() and future.exception() is not None for future, _, _, _ in self.pending)
+
+
+class StudyQueue:
+    """
+    Due cards of one search with their pre-rendered HTML, kept in the session state.
+
+    The cards are loaded by a background thread, and reloaded when half of them have been
+    studied, so showing the next card after a grade click does not touch the database.
+    Grades are written by a background writer (writer, a GradeWriter); the cards graded in
+    this session are never queued again, even when a reload runs before their grade is saved,
+    unless their grade could not be saved (requeue).
+    """
+
+    def __init__(self, username, search, size=PREFETCH_CARDS, writer=None):
+        self.username = username
+        self.search = search
+        self.size = size
+        self.writer = writer or GradeWriter()
+        self.cards = deque()
+        self.graded = set()
+        self.exhausted = False
+        self.future = None
+        self.future_limit = 0
+        self.lock = threading.Lock()
+        self.prefetch()
+
+    def prefetch(self):
+        """
+        Starts loading more cards in the background, unless a load is running or every due card is queued.
+        """
+        if self.exhausted or (self.future is not None and not self.future.done()):
+            return
+        # The graded and queued cards can still be due: ask for enough rows to get size new ones
+        limit = self.size + len(self.cards) + len(self.graded)
+        self.future = _prefetch_pool.submit(_load_cards, self.username, self.search, limit)
+        self.future_limit = limit
+
+    def _merge(self):
+        if self.future is None or not self.future.done():
+            return
+        future, self.future = self.future, None
+        cards = future.result()
+        self.exhausted = len(cards) < self.future_limit
+        queued = {flashcard[0] for flashcard, _ in self.cards}
+        for flashcard, card_html in cards:
+            if flashcard[0] not in self.graded and flashcard[0] not in queued:
+                self.cards.append((flashcard, card_html))
+                queued.add(flashcard[0])
+
+    def current(self):
+        """
+        Returns (search, flashcard, html) of the card to show, or None when no card is due.
+        Only waits for the background load when the queue is empty.
+        """
+        with self.lock:
+            self._merge()
+            # Loads can come back with only graded cards: keep loading until a card or the end is found
+            while not self.cards and (self.future is not None or not self.exhausted):
+                self.prefetch()
+                self.future.result()
+                self._merge()
+            return (self.search, *self.cards[0]) if self.cards else None
+
+    def grade(self, grade):
+        """
+        Removes the current card, saves its grade in the background and refills the queue when it runs low.
+        Returns the search of the graded card.
+        """
+        with self.lock:
+            if not self.cards:
+                return None
+            flashcard, _ = self.cards.popleft()
+            self.graded.add(flashcard[0])
+            self.writer.submit(self.username, self.search, flashcard, grade)
+            if len(self.cards) <= self.size // 2:
+                self.prefetch()
+            return self.search
+
+    def requeue(self, search, flashcard):
+        """
+        Puts back first a card graded from this queue whose grade could not be saved.
+        """
+        with self.lock:
+            if search != self.search or flashcard[0] not in self.graded:
+                return
+            self.graded.discard(flashcard[0])
+            self.cards.appendleft((flashcard, render_card_html(flashcard[0], flashcard[1])))
+
@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from db_services import get_due_cards_all
+from study_prefetch import GradeWriter, render_card_html
+import tracing
+
+# Weights of the urgency of a card (see card_priority)
+OVERDUE_WEIGHT = float(os.getenv("FLASHCARD_QUEUE_OVERDUE_WEIGHT", "0.5"))
+EASE_WEIGHT = float(os.getenv("FLASHCARD_QUEUE_EASE_WEIGHT", "0.3"))
+# Days of overdue-ness after which a card is not considered more urgent
+MAX_OVERDUE_DAYS = 30
+DEFAULT_EASE = 2.5
+# Recall probability when a card is reviewed exactly on its due date
+TARGET_RETENTION = 0.9
+DAY = 86400
+
+_REMOVED = object()
+
+
+def card_priority(last_studied_epoch, interval, ease, due_epoch, now):
+    """
+    Returns the urgency of a card, higher first:
+
+    - retention risk: 1 - R, with the recall probability R = TARGET_RETENTION ** (elapsed / interval)
+      decaying with the days elapsed since the last review (new cards have no risk yet);
+    - overdue-ness: days past the due date, relative to MAX_OVERDUE_DAYS;
+    - ease: cards with a low ease factor are the hard ones, reviewed earlier.
+    """
+    interval = max(interval or 1, 1)
+    ease = ease or DEFAULT_EASE
+    if last_studied_epoch is None:
+        risk = 0.0
+    else:
+        elapsed = max(now - last_studied_epoch, 0) / DAY
+        risk = 1 - TARGET_RETENTION ** (elapsed / interval)
+    overdue = min(max(now - due_epoch, 0) / DAY, MAX_OVERDUE_DAYS) / MAX_OVERDUE_DAYS
+    return risk + OVERDUE_WEIGHT * overdue + EASE_WEIGHT * (DEFAULT_EASE - ease)
+
+
+class GlobalStudyQueue:
+    """
+    Due cards of all the searches of a user in a binary heap ordered by card_priority.
+
+    The queue is loaded with one query (get_due_cards_all); afterwards push, remove and
+    grade are O(log n) heap operations. Cards are keyed by (search, flashcard name), and
+    replaced or removed entries are only marked, then skipped when they reach the top
+    (the lazy deletion of the heapq documentation). An entry keeps the HTML of its card
+    once rendered, so the reruns showing the same card do not render it again.
+
+    It has the interface of study_prefetch.StudyQueue: current(), grade() and requeue().
+    """
+
+    def __init__(self, username, cards=None, now=None, writer=None):
+        self.username = username
+        self.writer = writer or GradeWriter()
+        self.heap = []
+        self.entries = {}
+        # Cards graded from this queue, put back by requeue when their grade could not be saved
+        self.graded = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        if cards is None:
+            with tracing.span('study_queue_load') as load_span:
+                cards = get_due_cards_all(username)
+                load_span.set(cards=len(cards))
+        now = now or time.time()
+        for card in cards:
+            entry = self._entry(card, now)
+            self.entries[entry[2]] = entry
+            self.heap.append(entry)
+        # Building the heap at once is O(n), n pushes would be O(n log n)
+        heapq.heapify(self.heap)
+
+    def _entry(self, card, now):
+        # [priority, insertion order, key, card (or _REMOVED), HTML (rendered by current)]
+        search, name, text, last_studied, interval, ease, reps, due_epoch, last_studied_epoch = card
+        return [-card_priority(last_studied_epoch, interval, ease, due_epoch, now), next(self.counter), (search, name), card, None]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, card, now=None):
+        """
+        Adds a get_due_cards_all tuple, replacing the queued entry of the same card.
+        """
+        entry = self._entry(card, now or time.time())
+        with self.lock:
+            self._remove(entry[2])
+            self.entries[entry[2]] = entry
+            heapq.heappush(self.heap, entry)
+
+    def remove(self, search, name):
+        with self.lock:
+            self._remove((search, name))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[3] = _REMOVED
+
+    def _top(self):
+        while self.heap and self.heap[0][3] is _REMOVED:
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else None
+
+    def peek(self):
+        """
+        Returns the most urgent card (a get_due_cards_all tuple), or None.
+        """
+        with self.lock:
+            entry = self._top()
+            return entry[3] if entry else None
+
+    def pop(self):
+        """
+        Removes and returns the most urgent card, or None.
+        """
+        with self.lock:
+            entry = self._top()
+            if entry is None:
+                return None
+            heapq.heappop(self.heap)
+            del self.entries[entry[2]]
+            return entry[3]
+
+    def current(self):
+        """
+        Returns (search, flashcard, html) of the most urgent card, flashcard being a
+        get_flashcards_study tuple, or None when no card is due.
+        """
+        with self.lock:
+            entry = self._top()
+            if entry is None:
+                return None
+            search, name, text, last_studied, interval, ease, reps, _, _ = entry[3]
+            if entry[4] is None:
+                entry[4] = render_card_html(name, text)
+            return search, (name, text, last_studied, interval, ease, reps), entry[4]
+
+    def grade(self, grade):
+        """
+        Removes the most urgent card and saves its grade in the background. A graded card is due
+        again tomorrow at the earliest, so it does not go back in today's queue.
+        Returns the search of the graded card.
+        """
+        card = self.pop()
+        if card is None:
+            return None
+        search, name, text, last_studied, interval, ease, reps, _, _ = card
+        with self.lock:
+            self.graded[(search, name)] = card
+        self.writer.submit(self.username, search, (name, text, last_studied, interval, ease, reps), grade)
+        return search
+
+    def requeue(self, search, flashcard):
+        """
+        Puts back a card graded from this queue whose grade could not be saved.
+        """
+        with self.lock:
+            card = self.graded.pop((search, flashcard[0]), None)
+        if card is not None:
+            self.push(card)
@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_backend
+import db_services
+import query_cache
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Points db_services to an empty database in a temporary directory.
+    """
+    monkeypatch.setattr(db_services, "DB_PATH", str(tmp_path / "test.db"))
+    db_services.create_tables()
+    query_cache.invalidate_user()
+    yield db_services.DB_PATH
+    db_backend.close_pools()
+    query_cache.invalidate_user()
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+import api_server
+import db_backend
+import db_services
+from fake_llm import FakeChatModel
+
+
+@pytest.fixture
+def user(database):
+    db_services.add_userdata("user_0", "password")
+    now = datetime.now()
+    db_services.bulk_insert_study_log("user_0", [[
+        (f"search_{i % 2}", f"card_{i}", "text", str(now - timedelta(days=1)), str(now - timedelta(minutes=1)),
+         1, 2.5, 1, int(now.timestamp()) - 60)
+        for i in range(10)
+    ]])
+    return "user_0"
+
+
+def run_with_clients(test, replicas=1):
+    """
+    Runs the coroutine test(*clients) against fresh application instances sharing the database.
+    """
+    async def main():
+        clients = [TestClient(TestServer(api_server.create_app(model=FakeChatModel(), workers=2)))
+                   for _ in range(replicas)]
+        for client in clients:
+            await client.start_server()
+        try:
+            return await test(*clients)
+        finally:
+            for client in clients:
+                await client.close()
+
+    return asyncio.run(main())
+
+
+async def login(client, username="user_0"):
+    response = await client.post("/api/login", json={"username": username, "password": "password"})
+    assert response.status == 200
+    return {"Authorization": f"Bearer {(await response.json())['token']}"}
+
+
+async def wait_for_job(client, job_id, headers):
+    for _ in range(200):
+        response = await client.get(f"/api/jobs/{job_id}", headers=headers)
+        job = await response.json()
+        if response.status != 200 or job["status"] in ("done", "failed"):
+            return response.status, job
+        await asyncio.sleep(0.05)
+    return response.status, job
+
+
+def test_token_and_job_shared_between_replicas(user):
+    async def test(a, b):
+        headers = await login(a)
+        assert (await b.get("/api/stats", headers=headers)).status == 200
+        forged = {"Authorization": headers["Authorization"][:-2] + "xx"}
+        assert (await b.get("/api/stats", headers=forged)).status == 401
+        response = await a.post("/api/jobs", headers=headers, json={"search": "replicas", "text": "Spaced repetition. " * 50})
+        job_id = (await response.json())["job_id"]
+        status, job = await wait_for_job(b, job_id, headers)
+        assert (status, job["status"]) == (200, "done")
+
+    run_with_clients(test, replicas=2)
+
+
+def test_token_survives_restart_and_orphaned_job_is_taken_over(user):
+    headers = run_with_clients(login)
+    # A job queued by a replica that stopped before running it: no heartbeat for JOB_ORPHAN_AFTER
+    db_services.add_api_job("orphan", user, "replicas", "Interval scheduling. " * 50)
+    conn = db_services.create_connection()
+    conn.execute("UPDATE apiJobs SET heartbeat = 0 WHERE jobId = ?", ("orphan",))
+    conn.commit()
+    conn.close()
+
+    async def test(restarted):
+        assert (await restarted.get("/api/cards/due?search=search_0&limit=5", headers=headers)).status == 200
+        status, job = await wait_for_job(restarted, "orphan", headers)
+        assert (status, job["status"]) == (200, "done")
+
+    run_with_clients(test)
+
+
+@pytest.mark.parametrize("grade", [True, 5.0, "3", 0, 6, None])
+def test_invalid_grades_are_rejected(user, grade):
+    async def test(client):
+        headers = await login(client)
+        response = await client.post("/api/cards/grade", headers=headers,
+                                     json={"search": "search_0", "name": "card_0", "grade": grade})
+        assert response.status == 400
+
+    run_with_clients(test)
+
+
+@pytest.mark.parametrize("limit", ["-5", "0", str(api_server.MAX_DUE_CARDS + 1), "ten"])
+def test_limit_out_of_range_is_rejected(user, limit):
+    async def test(client):
+        headers = await login(client)
+        response = await client.get(f"/api/cards/due?search=search_0&limit={limit}", headers=headers)
+        assert response.status == 400
+
+    run_with_clients(test)
+
+
+def test_limit_caps_the_due_cards(user):
+    async def test(client):
+        headers = await login(client)
+        for search in ("search_0", ""):
+            response = await client.get(f"/api/cards/due?search={search}&limit=2", headers=headers)
+            assert response.status == 200
+            assert len((await response.json())["cards"]) == 2
+
+    run_with_clients(test)
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/login", {"username": 5, "password": "password"}),
+    ("/api/login", {"username": "user_0", "password": ["password"]}),
+    ("/api/cards/grade", {"search": ["search_0"], "name": "card_0", "grade": 3}),
+    ("/api/cards/grade", {"search": "search_0", "name": {"card": 0}, "grade": 3}),
+    ("/api/jobs", {"search": "replicas", "text": 3}),
+])
+def test_non_string_fields_are_rejected(user, path, body):
+    async def test(client):
+        headers = await login(client)
+        response = await client.post(path, headers=headers, json=body)
+        assert response.status == 400
+
+    run_with_clients(test)
+
+
+def test_pool_size_is_not_changed_for_other_threads(database, monkeypatch):
+    monkeypatch.setattr(db_backend, "POOL_SIZE", 0)
+    api_server.create_app(model=FakeChatModel(), workers=2)
+    assert db_backend.POOL_SIZE == 0
+    conn = db_services.create_connection()
+    assert conn.pool is None
+    conn.close()
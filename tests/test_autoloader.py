@@ -0,0 +1,22 @@
+import tracemalloc
+import AutoLoader
+from AutoLoader import AutoLoaderDocument
+from benchmark import synthetic_pdf
+
+
+def test_pdf_stream_memory_is_bounded(tmp_path, monkeypatch):
+    # A 1 MB budget reads the PDF (about 30 pages of 70 KB) by windows of a few pages
+    monkeypatch.setattr(AutoLoader, "EXTRACT_MEMORY_MB", 1)
+    path = tmp_path / "synthetic.pdf"
+    pages = synthetic_pdf(path, 2, seed=0, image_kb=64)
+    with open(path, "rb") as document:
+        loader = AutoLoaderDocument(document=document)
+        tracemalloc.start()
+        try:
+            pieces = sum(1 for _ in loader.iter_text())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert pieces == pages
+    # A single reader would keep every page of the file (about 2 MB of objects)
+    assert peak < AutoLoader.EXTRACT_MEMORY_MB * 1024 * 1024
@@ -0,0 +1,19 @@
+from card_import import strip_html
+from study_prefetch import render_card_html
+
+PAYLOAD = '<img src=x onerror="alert(document.cookie)">'
+
+
+def test_fields_are_escaped():
+    card_html = render_card_html(PAYLOAD, f"<script>alert(1)</script> & {PAYLOAD}")
+    assert "<img" not in card_html
+    assert "<script>" not in card_html
+    assert "&lt;img src=x onerror=&quot;alert(document.cookie)&quot;&gt;" in card_html
+    assert "&amp; " in card_html
+
+
+def test_escaped_markup_of_imported_decks_stays_text():
+    # An Anki field showing markup as text: unescaped by strip_html, escaped again when rendered
+    name = strip_html("<b>XSS</b> &lt;img src=x onerror=alert(1)&gt;")
+    assert name == "XSS <img src=x onerror=alert(1)>"
+    assert "<img" not in render_card_html(name, "text")
@@ -0,0 +1,31 @@
+import multiprocessing
+import db_backend
+import db_services
+from benchmark import _contention_worker
+
+PROCESSES = 4
+SECONDS = 1.5
+
+
+def test_replicas_sharing_the_database_are_never_locked_out(database, monkeypatch):
+    # The settings of db_backend.connect: WAL and a busy timeout
+    monkeypatch.setattr(db_backend, "JOURNAL_MODE", "WAL")
+    monkeypatch.setattr(db_backend, "BUSY_TIMEOUT_MS", 5000)
+    for i in range(200):
+        db_services.add_flashcard_study("benchmark", "shared", f"card_{i}", "text")
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=_contention_worker, args=(database, "WAL", 5000, SECONDS, 0.3, i, results))
+        for i in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert all(ops > 0 for ops, _, _ in outcomes)
+    locked_errors = sum(errors for _, errors, _ in outcomes)
+    assert locked_errors == 0
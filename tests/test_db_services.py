@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+import db_services
+
+
+def test_due_counts_leave_stale_flashcards_out(database):
+    now = datetime.now()
+    db_services.bulk_insert_study_log("user", [[
+        (f"search_{i % 3}", f"card_{i}", "text", str(now - timedelta(days=1)), str(now - timedelta(minutes=1)),
+         1, 2.5, 1, int(now.timestamp()) - 60)
+        for i in range(30)
+    ]])
+    assert db_services.get_due_counts("user") == {"search_0": 10, "search_1": 10, "search_2": 10}
+
+    # Every due card of a search stale, and one of another
+    db_services.set_stale_flashcards("user", "search_0", [f"card_{i}" for i in range(0, 30, 3)], [])
+    db_services.set_stale_flashcards("user", "search_1", ["card_1"], [])
+    assert db_services.get_due_counts("user") == {"search_1": 9, "search_2": 10}
+
+
+def test_legacy_hash_is_replaced_at_login(database):
+    conn = db_services.create_connection()
+    conn.execute('INSERT INTO users(userName, userPassword) VALUES (?, ?)', ("legacy", db_services.legacy_hash("password")))
+    conn.commit()
+    conn.close()
+    assert db_services.login_user("legacy", "password")
+    conn = db_services.create_connection()
+    (stored,), = conn.execute('SELECT userPassword FROM users WHERE userName = ?', ("legacy",)).fetchall()
+    conn.close()
+    assert stored.startswith("scrypt$")
+    db_services.invalidate_login_cache("legacy")
+    assert db_services.login_user("legacy", "password")
+    assert not db_services.login_user("legacy", "wrong")
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+import db_services
+import forecast
+from benchmark import seed_review_history
+
+CARDS = 500
+
+
+@pytest.fixture
+def history(database):
+    for cache in (forecast._cache, forecast._grade_cache, forecast._states_cache):
+        cache.clear()
+    seed_review_history("user", CARDS, seed=0)
+    yield "user"
+    for cache in (forecast._cache, forecast._grade_cache, forecast._states_cache):
+        cache.clear()
+
+
+def test_updated_card_states_match_the_study_log(history):
+    forecast.forecast_reviews(history, horizon=30)
+    db_services.update_flashcard_study(history, "search_0", "card_0", "text", 1, 2, 2.8, 3)
+    db_services.update_flashcard_study(history, "search_1", "card_1", "text", 5, 30, 2.0, 2)
+    db_services.add_flashcard_study(history, "search_new", "card_new", "text")
+    forecast.forecast_reviews(history, horizon=30)
+
+    version = tuple(db_services.get_user_log_version(history))
+    updated = forecast._states_cache[history]
+    loaded = forecast._load_card_states(history, version)
+    assert updated["version"] == version
+    assert set(updated["index"]) == set(loaded["index"])
+    order = [updated["index"][key] for key in loaded["index"]]
+    for name in ("rows", "interval", "ease", "due_dates"):
+        assert np.array_equal(updated[name][order], loaded[name], equal_nan=name in ("interval", "ease")), name
+
+
+def test_forecast_is_recomputed_after_a_review(history):
+    first = forecast.forecast_reviews(history, horizon=30)
+    assert len(first) == 30
+    assert first["reviews"].sum() > 0
+    cached = forecast._cache[history]
+    assert forecast.forecast_reviews(history, horizon=30).equals(first)
+    assert forecast._cache[history] is cached
+
+    db_services.update_flashcard_study(history, "search_0", "card_0", "text", 4, 1, 2.5, 1)
+    forecast.forecast_reviews(history, horizon=30)
+    assert forecast._cache[history][0] != cached[0]
+
+
+def test_simulation_reviews_the_due_cards():
+    reviews = forecast.simulate_reviews(
+        np.ones(100), np.ones(100), np.full(100, 2.5), np.r_[np.zeros(40), np.full(60, 5)],
+        forecast.DEFAULT_GRADE_PROBABILITIES, horizon=10, runs=2
+    )
+    assert reviews[0] == 40
+    assert reviews[5] >= 60
+    assert not forecast.simulate_reviews([], [], [], [], forecast.DEFAULT_GRADE_PROBABILITIES, horizon=10).any()
+
+
+def test_warm_up_caches_the_first_forecast(history):
+    forecast.warm_forecast(history).result()
+    cached = forecast._cache[history]
+    assert forecast.forecast_reviews(history).equals(cached[1])
+    assert forecast._cache[history] is cached
+    assert history not in forecast._warming
@@ -0,0 +1,69 @@
+import random
+import httpx
+import openai
+import pytest
+import db_services
+import incremental
+from benchmark import WORDS, revise_document
+from fake_llm import FakeChatModel
+from generation import save_flashcards
+from rate_limiter import configure_rate_limiter
+
+PARAGRAPHS = [
+    " ".join(f"{topic}{i} spaced repetition interval scheduling" for i in range(60)) + "."
+    for topic in ("alpha", "beta", "gamma", "delta")
+]
+
+
+@pytest.fixture(autouse=True)
+def limiter():
+    configure_rate_limiter(requests_per_minute=100000, tokens_per_minute=100000000, base_delay=0.0, max_retries=0)
+
+
+def document(*paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def test_removed_chunks_are_kept_until_their_replacement_succeeds(database, monkeypatch):
+    model = FakeChatModel(cards_per_chunk=3, seed=0)
+    flashcards, report = incremental.generate_incremental("user", "document", document(*PARAGRAPHS), model)
+    assert report["failed"] == 0
+    known = db_services.get_document_chunks("user", "document")
+
+    # gamma is rewritten as epsilon, whose extraction fails
+    revised = document(PARAGRAPHS[0], PARAGRAPHS[1], PARAGRAPHS[2].replace("gamma", "epsilon"), PARAGRAPHS[3])
+    extract_flashcards = incremental.extract_flashcards
+
+    def failing(text, model, priority):
+        if "epsilon" in text:
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+        return extract_flashcards(text, model, priority)
+
+    monkeypatch.setattr(incremental, "extract_flashcards", failing)
+    flashcards, report = incremental.generate_incremental("user", "document", revised, model)
+    assert report["failed"] > 0
+    assert (report["removed"], report["stale_flashcards"]) == (0, [])
+    assert set(known) <= set(db_services.get_document_chunks("user", "document"))
+    assert db_services.get_stale_flashcards("user", "document") == []
+
+    # The next upload retries the failed chunk and only then removes the old one
+    monkeypatch.setattr(incremental, "extract_flashcards", extract_flashcards)
+    flashcards, report = incremental.generate_incremental("user", "document", revised, model)
+    assert report["failed"] == 0 and report["removed"] > 0
+    assert len(db_services.get_document_chunks("user", "document")) == report["chunks"]
+    assert db_services.get_stale_flashcards("user", "document") == report["stale_flashcards"]
+
+
+def test_stale_flashcards_are_not_scheduled_after_a_revision(database):
+    rng = random.Random(0)
+    text = "\n".join(" ".join(rng.choice(WORDS) for _ in range(70)).capitalize() + "." for _ in range(120))
+    for version in (text, revise_document(text, edits=3, seed=0)):
+        flashcards, report = incremental.generate_incremental("user", "document", version, FakeChatModel(seed=0))
+        save_flashcards("user", "document", flashcards)
+    assert report["reused"] > 0 and report["tokens_saved"] > 0
+    assert report["stale_flashcards"]
+
+    scheduled = {card[0] for card in db_services.get_flashcards_study("user", "document")}
+    scheduled.update(card[1] for card in db_services.get_due_cards_all("user"))
+    assert not scheduled & set(report["stale_flashcards"])
+    assert db_services.get_due_counts("user").get("document", 0) == len(scheduled)
@@ -0,0 +1,131 @@
+import os
+import time
+from collections import Counter
+import pytest
+from AutoLoader import YouTubeTranscriptApi
+from benchmark import StubWebServer, load_transcript, stub_pages
+from ingestion import ingest_urls, iter_segment_chunks
+from url_cache import UrlCache
+
+ARTICLES = 6
+VIDEO_IDS = [f"video{i:06d}" for i in range(3)]
+TRANSCRIPT = load_transcript()
+
+
+@pytest.fixture
+def stub():
+    stub = StubWebServer(stub_pages(ARTICLES, VIDEO_IDS, TRANSCRIPT), latency=0.02)
+    yield stub
+    stub.shutdown()
+
+
+@pytest.fixture
+def replayed(monkeypatch):
+    """
+    Counts the transcripts fetched per video, replaying TRANSCRIPT instead of downloading them.
+    """
+    replayed = Counter()
+
+    def replay_transcript(video_id, languages=("en",), **kwargs):
+        replayed[video_id] += 1
+        return [dict(segment) for segment in TRANSCRIPT]
+
+    monkeypatch.setattr(YouTubeTranscriptApi, "get_transcript", staticmethod(replay_transcript))
+    return replayed
+
+
+def urls(stub):
+    return [f"{stub.base}/article/{i}" for i in range(ARTICLES)]
+
+
+def ingest(stub, cache, urls, workers=4):
+    """
+    Returns the sources of urls and the number of requests they took.
+    """
+    requests_before = stub.requests()
+    sources = list(ingest_urls(urls, cache=cache, max_workers=workers))
+    return sources, stub.requests() - requests_before
+
+
+def test_concurrency_is_bounded(stub, tmp_path):
+    sources, sent = ingest(stub, UrlCache(str(tmp_path), session=stub.session()), urls(stub), workers=3)
+    assert sorted(source.url for source in sources) == sorted(urls(stub))
+    assert all(source.text and source.error is None for source in sources)
+    assert sent == ARTICLES
+    assert 1 < stub.in_flight["peak"] <= 3
+
+
+def test_fresh_entries_are_served_without_a_request(stub, tmp_path):
+    cache = UrlCache(str(tmp_path), ttl=3600, session=stub.session())
+    ingest(stub, cache, urls(stub))
+    sources, sent = ingest(stub, cache, urls(stub))
+    assert sent == 0
+    assert cache.stats["hits"] == ARTICLES
+
+
+def test_stale_entries_are_revalidated(stub, tmp_path):
+    cache = UrlCache(str(tmp_path), ttl=0, session=stub.session())
+    texts = {source.url: source.text for source in ingest(stub, cache, urls(stub))[0]}
+    sources, sent = ingest(stub, cache, urls(stub))
+    # Even pages are validated by ETag, odd ones by Last-Modified
+    assert stub.served[304] == ARTICLES
+    assert cache.stats["revalidated"] == ARTICLES
+    assert all(texts[source.url] == source.text for source in sources)
+
+
+def test_changed_pages_are_refetched(stub, tmp_path):
+    cache = UrlCache(str(tmp_path), ttl=0, session=stub.session())
+    ingest(stub, cache, urls(stub))
+    revised = b"<html><body><p>" + b"Revised article about interleaving. " * 40 + b"</p></body></html>"
+    stub.pages["/article/0"][:2] = [revised, '"v2-0"']
+    stub.pages["/article/1"][0], stub.pages["/article/1"][2] = revised, "Tue, 20 Oct 2026 08:00:00 GMT"
+    sources, sent = ingest(stub, cache, urls(stub)[:2])
+    assert all("Revised article" in source.text for source in sources)
+    assert cache.stats["misses"] == ARTICLES + 2
+
+
+def test_pages_and_transcripts_expire_after_the_ttl(stub, replayed, tmp_path):
+    ttl = 0.3
+    cache = UrlCache(str(tmp_path), ttl=ttl, session=stub.session())
+    targets = [urls(stub)[2], f"https://www.youtube.com/watch?v={VIDEO_IDS[0]}"]
+    ingest(stub, cache, targets)
+    assert ingest(stub, cache, targets)[1] == 0
+    time.sleep(ttl * 1.5)
+    assert ingest(stub, cache, targets)[1] == 1
+    assert replayed[VIDEO_IDS[0]] == 2
+
+
+def test_playlist_is_expanded_into_its_videos(stub, replayed, tmp_path):
+    cache = UrlCache(str(tmp_path), session=stub.session())
+    sources, sent = ingest(stub, cache, ["https://www.youtube.com/playlist?list=PLstub", urls(stub)[0]])
+    videos = [source for source in sources if source.kind == "youtube"]
+    # The playlist lists the first video twice
+    assert sorted(source.url.rsplit("=", 1)[1] for source in videos) == VIDEO_IDS
+    assert all(source.segments == TRANSCRIPT for source in videos)
+    assert sum(replayed.values()) == len(VIDEO_IDS)
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(4000, 400), (600, 60), (300, 0)])
+def test_segment_chunks_hold_the_whole_transcript(chunk_size, chunk_overlap):
+    chunks = list(iter_segment_chunks(TRANSCRIPT, chunk_size, chunk_overlap))
+    # Once the overlaps are removed, the chunks give back the transcript
+    rebuilt = chunks[0]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        tail = previous[-chunk_overlap:] if chunk_overlap else ""
+        rebuilt += " " + (chunk[len(tail) + 1:] if tail else chunk)
+    assert rebuilt == " ".join(segment["text"].strip() for segment in TRANSCRIPT if segment["text"].strip())
+    longest = max(len(segment["text"]) for segment in TRANSCRIPT)
+    assert all(len(chunk) <= chunk_size + chunk_overlap + longest for chunk in chunks)
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = UrlCache(str(tmp_path), ttl=3600, max_entries=3)
+    for i in range(3):
+        cache.memoize(f"key_{i}", lambda: i)
+        # Stored a minute apart, key_0 first
+        os.utime(cache._path(f"key_{i}"), (time.time() - 60 * (3 - i),) * 2)
+    cache.memoize("key_3", lambda: 3)
+    assert cache.stats["evictions"] == 1
+    assert len(os.listdir(tmp_path)) == 3
+    assert cache.memoize("key_1", lambda: "recomputed") == 1
+    assert cache.memoize("key_0", lambda: "recomputed") == "recomputed"
@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+import pandas as pd
+import db_services
+from query_cache import QueryCache
+
+USERS = [f"user_{i}" for i in range(4)]
+
+
+def test_invalidation_is_per_user():
+    cache = QueryCache(max_entries=10, ttl=60)
+    loads = []
+
+    def read(username):
+        return cache.get_or_load("read", username, (), lambda: loads.append(username) or len(loads))
+
+    assert (read("a"), read("b"), read("a")) == (1, 2, 1)
+    cache.invalidate("a")
+    assert (read("a"), read("b")) == (3, 2)
+    cache.invalidate()
+    assert read("b") == 4
+
+
+def test_least_recently_used_entries_are_evicted_and_expire():
+    cache = QueryCache(max_entries=2, ttl=0.2)
+    for key in ("a", "b", "a", "c"):
+        cache.get_or_load("read", key, (), lambda: key)
+    assert cache.metrics()["evictions"] == 1
+    assert cache.get_or_load("read", "b", (), lambda: "reloaded") == "reloaded"
+    time.sleep(0.3)
+    assert cache.get_or_load("read", "c", (), lambda: "expired") == "expired"
+
+
+def test_cached_values_are_copies():
+    cache = QueryCache()
+    frame = cache.get_or_load("read", "a", (), lambda: pd.DataFrame({"reviews": [1, 2]}))
+    frame["reviews"] = 0
+    assert list(cache.get_or_load("read", "a", (), lambda: None)["reviews"]) == [1, 2]
+
+
+def test_writes_are_read_back_at_once(database):
+    # Writer threads add cards and read them back while reader threads keep the other users' entries warm
+    stale = []
+    stop = threading.Event()
+
+    def writer(user):
+        for i in range(50):
+            name = f"new_{i}"
+            db_services.add_flashcard_study(user, "checked", name, "text")
+            if name not in {card for card, _ in db_services.query_flashcards(user, "checked")}:
+                stale.append((user, "query_flashcards", name))
+            if ("checked",) not in db_services.query_searches_flashcards(user):
+                stale.append((user, "query_searches_flashcards", name))
+            if db_services.get_user_stats(user) != db_services.get_user_stats.uncached(user):
+                stale.append((user, "get_user_stats", name))
+
+    def reader(rng):
+        while not stop.is_set():
+            user = rng.choice(USERS)
+            db_services.query_flashcards(user, "checked")
+            db_services.query_searches_flashcards(user)
+            db_services.get_user_stats(user)
+
+    readers = [threading.Thread(target=reader, args=(random.Random(i),)) for i in range(2)]
+    writers = [threading.Thread(target=writer, args=(user,)) for user in USERS]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert stale == []
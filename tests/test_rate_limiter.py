@@ -0,0 +1,46 @@
+import httpx
+import openai
+import pytest
+from pydantic import BaseModel
+from generation import parallel_map
+from rate_limiter import RateLimiter
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def failing(times, error):
+    calls = []
+
+    def func():
+        calls.append(len(calls))
+        if len(calls) <= times:
+            raise error
+        return "result"
+    return func, calls
+
+
+def test_failed_attempts_give_their_tokens_back():
+    limiter = RateLimiter(tokens_per_minute=10000, max_retries=3, base_delay=0.0)
+    func, calls = failing(2, openai.APIConnectionError(request=REQUEST))
+    assert limiter.call(func, 3000, usage=lambda result: 1000) == "result"
+    assert len(calls) == 3
+    # Only the successful attempt is charged, with its real usage
+    assert 8990 <= limiter.metrics()["tokens_available"] <= 9010
+
+
+@pytest.mark.parametrize("error", [openai.APIConnectionError(request=REQUEST), ValueError("not retried")])
+def test_tokens_are_given_back_when_the_call_fails(error):
+    limiter = RateLimiter(tokens_per_minute=10000, max_retries=2, base_delay=0.0)
+    func, calls = failing(10, error)
+    with pytest.raises(type(error)):
+        limiter.call(func, 3000)
+    assert limiter.metrics()["tokens_available"] >= 9990
+
+
+def test_validation_errors_fail_only_their_item():
+    class Card(BaseModel):
+        name: str
+
+    results = parallel_map(lambda item: Card(name=item), ["card", 5])
+    assert results[0] == (Card(name="card"), None)
+    assert results[1][0] is None and type(results[1][1]).__name__ == "ValidationError"
@@ -0,0 +1,28 @@
+import threading
+import time
+import study_prefetch
+from study_prefetch import GradeWriter
+
+FLASHCARD = ("card", "text", None, 1, 2.5, 1)
+
+
+def test_writes_are_waited_for_per_session(monkeypatch):
+    release = threading.Event()
+
+    def write_grade(username, search, flashcard, grade):
+        if username == "other":
+            release.wait(5)
+
+    monkeypatch.setattr(study_prefetch, "_write_grade", write_grade)
+    mine, other = GradeWriter(), GradeWriter()
+    mine.submit("me", "search", FLASHCARD, 4).result()
+    # The write of another session, still running, is not waited for
+    other.submit("other", "search", FLASHCARD, 4)
+    try:
+        start = time.perf_counter()
+        mine.wait()
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+    other.wait()
+    assert not other.failures()
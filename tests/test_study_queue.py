@@ -0,0 +1,28 @@
+import study_queue
+from study_queue import GlobalStudyQueue
+
+NOW = 1_800_000_000
+
+
+def due_card(search, name, due_epoch=NOW - 60):
+    return (search, name, "text", None, 1, 2.5, 1, due_epoch, None)
+
+
+def test_rendered_html_is_kept_with_the_entry(monkeypatch):
+    rendered = []
+
+    def render_card_html(name, text):
+        rendered.append(name)
+        return f"<div>{name}</div>"
+
+    monkeypatch.setattr(study_queue, "render_card_html", render_card_html)
+    queue = GlobalStudyQueue("user", cards=[due_card("a", "first", NOW - 86400), due_card("b", "second")], now=NOW)
+    first = queue.current()
+    assert first[2] is queue.current()[2]
+    assert rendered == ["first"]
+
+    queue.remove("a", "first")
+    assert queue.current()[1][0] == "second"
+    queue.push(due_card("a", "first", NOW - 86400), now=NOW)
+    assert queue.current()[1][0] == "first"
+    assert rendered == ["first", "second", "first"]
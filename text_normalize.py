@@ -0,0 +1,156 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain, islice
+
+# Non blank lines at the top and at the bottom of a page checked for running headers / footers
+EDGE_LINES = 2
+# Pages read before the repeated header / footer lines are known (the streaming window)
+HEADER_SAMPLE_PAGES = 12
+# Share of the sampled pages a line has to start or end to be a header / footer
+HEADER_MIN_RATIO = 0.6
+# Below this number of pages nothing is considered repeated
+HEADER_MIN_PAGES = 3
+
+DIGITS = re.compile(r"\d+")
+
+# "exam-\nple": a word hyphenated at the end of a line. Starting with the literal "-\n"
+# lets the regex engine jump between candidates instead of trying every position.
+HYPHEN_BREAK = re.compile(r"-\n(?=[^\W\d_])")
+WORD_AFTER = re.compile(r"\w+")
+# Words that start compounds rather than syllables: "self-\ncontained" keeps its hyphen
+COMPOUND_PREFIXES = {"self", "non", "well", "half", "ill", "quasi", "semi", "pseudo"}
+# Soft hyphens, zero width spaces and byte order marks left by the extractors
+DROP = ("\u00ad", "\u200b", "\ufeff")
+
+
+def _join_hyphenated(text):
+    """
+    Removes the line breaks after words hyphenated at the end of a line. The hyphen is
+    dropped ("exam-\nple" -> "example") unless the line goes on with a capital ("Jean-Paul"),
+    the word before is a compound prefix ("self-contained"), or the text spells the word
+    with a hyphen elsewhere and never without one ("time-consuming").
+    """
+    # Without hyphens inside the lines, no compound is spelled with a hyphen elsewhere
+    inline_hyphens = text.count("-") > text.count("-\n")
+    lowered = text.lower() if inline_hyphens else ""
+
+    def replace(match):
+        end = match.start()
+        start = end
+        while start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+            start -= 1
+        if start == end:
+            return match.group()
+        after = WORD_AFTER.match(text, match.end()).group()
+        if not after[0].islower():
+            return "-"
+        word = text[start:end].lower()
+        if word in COMPOUND_PREFIXES:
+            return "-"
+        after = after.lower()
+        if inline_hyphens and f"{word}-{after}" in lowered and word + after not in lowered:
+            return "-"
+        return ""
+
+    return HYPHEN_BREAK.sub(replace, text)
+
+
+def normalize_text(text):
+    """
+    Normalizes extracted text for the model: Unicode NFKC (ligatures, full width and
+    compatibility characters), words hyphenated at a line break joined back, runs of
+    spaces and blank lines collapsed, soft hyphens and zero width characters removed.
+
+    The cleanups are str.replace passes and ASCII lines skip NFKC, so mostly English
+    text is normalized at several times the speed of a regex over every character.
+    """
+    # Every pass is guarded by a search, which is several times cheaper than a copy
+    if "\r" in text:
+        text = text.replace("\r\n", "\n")
+    if not text.isascii():
+        # NFKC never composes across a line break, so only the non ASCII lines need it
+        if not unicodedata.is_normalized("NFKC", text):
+            text = "\n".join([
+                line if line.isascii() else unicodedata.normalize("NFKC", line) for line in text.split("\n")
+            ])
+        for char in DROP:
+            if char in text:
+                text = text.replace(char, "")
+    for char in "\t\f\v":
+        if char in text:
+            text = text.replace(char, " ")
+    while "  " in text:
+        text = text.replace("  ", " ")
+    # Single spaces are left around the line breaks once the runs are collapsed
+    for spaced in (" \n", "\n "):
+        if spaced in text:
+            text = text.replace(spaced, "\n")
+    # Two or more blank lines: one paragraph break
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
+    if "-\n" in text:
+        text = _join_hyphenated(text)
+    return text.strip()
+
+
+def _line_key(line):
+    # Page numbers change from page to page: "Page 3 of 40" and "Page 4 of 40" are the same footer
+    return DIGITS.sub("#", line.strip()).casefold()
+
+
+def _edge_lines(lines, edge_lines):
+    """
+    Returns the indexes of the first and last edge_lines non blank lines.
+    """
+    non_blank = [i for i, line in enumerate(lines) if line.strip()]
+    return set(non_blank[:edge_lines] + non_blank[-edge_lines:])
+
+
+def repeated_edge_lines(pages, edge_lines=EDGE_LINES, min_ratio=HEADER_MIN_RATIO):
+    """
+    Returns the keys of the lines found at the top or the bottom of at least min_ratio of
+    the pages: running headers, footers and page numbers.
+    """
+    if len(pages) < HEADER_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for page in pages:
+        lines = page.splitlines()
+        counts.update({_line_key(lines[i]) for i in _edge_lines(lines, edge_lines)})
+    needed = max(2, math.ceil(min_ratio * len(pages)))
+    return {key for key, count in counts.items() if count >= needed and key}
+
+
+def strip_edge_lines(page, keys, edge_lines=EDGE_LINES):
+    """
+    Removes the header / footer lines (see repeated_edge_lines) from the edges of a page.
+    """
+    if not keys:
+        return page
+    lines = page.splitlines()
+    dropped = {i for i in _edge_lines(lines, edge_lines) if _line_key(lines[i]) in keys}
+    if not dropped:
+        return page
+    return "\n".join(line for i, line in enumerate(lines) if i not in dropped)
+
+
+def normalize_pages(pages, remove_headers=True, sample_pages=HEADER_SAMPLE_PAGES):
+    """
+    Yields the normalized text (normalize_text) of every page, in order.
+
+    When remove_headers is set, the running headers and footers are learned from the first
+    sample_pages pages and removed from all of them. Only those pages are held in memory,
+    so pages can be streamed (AutoLoaderDocument.iter_text).
+    """
+    pages = iter(pages)
+    keys = set()
+    if remove_headers:
+        sample = list(islice(pages, sample_pages))
+        keys = repeated_edge_lines(sample)
+        pages = chain(sample, pages)
+    for page in pages:
+        text = normalize_text(strip_edge_lines(page, keys))
+        if text:
+            yield text
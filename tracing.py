@@ -0,0 +1,235 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Finished traces are appended to this JSONL file when the variable is set
+TRACE_FILE = os.getenv("FLASHCARD_TRACE_FILE")
+# Number of finished traces kept in memory for the admin panel
+MAX_RECENT_TRACES = int(os.getenv("FLASHCARD_TRACE_HISTORY", "200"))
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent_traces = deque(maxlen=MAX_RECENT_TRACES)
+_counters = defaultdict(float)
+_histograms = defaultdict(lambda: [0, 0.0])
+
+
+class Span:
+    """
+    A timed stage of the application. Spans opened inside another span become its children.
+    """
+    def __init__(self, name, trace_id, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start_time = time.time()
+        self.duration = None
+
+    def set(self, **attributes):
+        """
+        Adds attributes (tokens, bytes, counts...) to the span.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def current_span():
+    """
+    Returns the innermost open span of the current thread, or None.
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def attach(parent):
+    """
+    Makes parent the current span of this thread, so spans opened by worker threads
+    are recorded inside the trace that submitted the work.
+    """
+    stack = _stack()
+    stack.append(parent)
+    try:
+        yield parent
+    finally:
+        stack.pop()
+
+
+def _label_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """
+    Increments a counter, e.g. increment("llm_tokens_in_total", 1200).
+    """
+    with _lock:
+        _counters[_label_key(name, labels)] += value
+
+
+def observe(name, value, **labels):
+    """
+    Records a measurement (usually a duration in seconds) in a count/sum summary.
+    """
+    with _lock:
+        summary = _histograms[_label_key(name, labels)]
+        summary[0] += 1
+        summary[1] += value
+
+
+@contextmanager
+def span(name, root=True, **attributes):
+    """
+    Context manager timing a stage of the application.
+
+    The duration is always recorded in the "<name>_seconds" summary. When the span has
+    no parent it starts a new trace, which is kept for the admin panel and appended to
+    TRACE_FILE. Spans created with root=False are only attached to an already open trace.
+    """
+    parent = current_span()
+    if parent is None and not root:
+        start = time.perf_counter()
+        try:
+            yield Span(name, trace_id=None, attributes=attributes)
+        finally:
+            observe(f"{name}_seconds", time.perf_counter() - start, **_metric_labels(attributes))
+        return
+
+    trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    current = Span(name, trace_id, parent=parent, attributes=attributes)
+    stack = _stack()
+    stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        stack.pop()
+        observe(f"{name}_seconds", current.duration, **_metric_labels(attributes))
+        if parent is not None:
+            parent.children.append(current)
+        else:
+            _finish_trace(current)
+
+
+def _metric_labels(attributes):
+    """
+    Only low cardinality attributes are used as metric labels.
+    """
+    return {key: value for key, value in attributes.items() if key in ("statement", "loader", "stage")}
+
+
+def _finish_trace(root_span):
+    trace = root_span.to_dict()
+    with _lock:
+        _recent_traces.append(trace)
+    if TRACE_FILE:
+        with _lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace, default=str) + "\n")
+
+
+def traced(name):
+    """
+    Decorator wrapping a function in a span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_traces(limit=50):
+    """
+    Returns the most recent finished traces, newest first.
+    """
+    with _lock:
+        traces = list(_recent_traces)
+    return traces[::-1][:limit]
+
+
+def _escape_label_value(value):
+    # The text format escapes backslashes, double quotes and line feeds in label values
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{key}="{_escape_label_value(value)}"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def prometheus_text():
+    """
+    Returns all counters and summaries in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+    for (name, labels), value in counters:
+        lines.append(f"flashcard_{name}{_format_labels(labels)} {value}")
+    for (name, labels), (count, total) in histograms:
+        lines.append(f"flashcard_{name}_count{_format_labels(labels)} {count}")
+        lines.append(f"flashcard_{name}_sum{_format_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path):
+    """
+    Writes the current metrics to a Prometheus text file (e.g. for the node exporter textfile collector).
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def export_jsonl(path, limit=None):
+    """
+    Writes the recent traces (oldest first) to a JSONL file.
+    """
+    traces = recent_traces(limit or MAX_RECENT_TRACES)[::-1]
+    with open(path, "w", encoding="utf-8") as f:
+        for trace in traces:
+            f.write(json.dumps(trace, default=str) + "\n")
+
+
+def reset():
+    """
+    Clears every metric and trace (used by the benchmarks).
+    """
+    with _lock:
+        _recent_traces.clear()
+        _counters.clear()
+        _histograms.clear()
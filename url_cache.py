@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+
+CACHE_DIR = os.getenv("FLASHCARD_URL_CACHE_DIR", ".url_cache")
+# Seconds a cached page is used without asking the server again
+CACHE_TTL = float(os.getenv("FLASHCARD_URL_CACHE_TTL", "3600"))
+# Entries kept in the cache directory, the least recently fetched evicted first
+CACHE_MAX_ENTRIES = int(os.getenv("FLASHCARD_URL_CACHE_MAX_ENTRIES", "2000"))
+REQUEST_TIMEOUT = float(os.getenv("FLASHCARD_URL_TIMEOUT", "30"))
+USER_AGENT = "Mozilla/5.0 (compatible; FlashcardAnything/1.0)"
+
+
+class UrlCache:
+    """
+    Per URL cache of fetched content, stored as one JSON file per key in a directory.
+
+    Entries younger than ttl seconds are returned directly. Older entries are revalidated
+    with If-None-Match / If-Modified-Since, so an unchanged page costs a 304 and no body.
+    Beyond max_entries files, the entries stored (fetched or revalidated) the longest ago are deleted.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the cache files.
+    ttl : float
+        Seconds an entry is considered fresh.
+    session : requests.Session
+        Session used for the requests (connection pooling). A new one is created if None.
+    max_entries : int
+        Number of entries kept in the directory.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, session=None, max_entries=CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.session = session or requests.Session()
+        self.session.headers.setdefault("User-Agent", USER_AGENT)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self.entries = sum(1 for name in os.listdir(directory) if name.endswith(".json"))
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        new = not os.path.exists(path)
+        os.replace(tmp_path, path)
+        if new:
+            with self.lock:
+                self.entries += 1
+                evict = self.entries > self.max_entries
+            if evict:
+                self._evict()
+
+    def _evict(self):
+        """
+        Deletes the oldest entries (by mtime, the time they were stored) beyond max_entries.
+        The directory is scanned, so entries written by other processes are counted too.
+        """
+        files = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(".json"):
+                    try:
+                        files.append((item.stat().st_mtime, item.path))
+                    except OSError:
+                        pass
+        files.sort()
+        evicted = 0
+        for _, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+                evicted += 1
+            except OSError:
+                pass
+        with self.lock:
+            self.entries = len(files) - evicted
+            self.stats["evictions"] += evicted
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def fetch(self, url):
+        """
+        Returns the body of url as text, from the cache when possible.
+        """
+        entry = self._load(url)
+        if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+            self._count("hits")
+            return entry["body"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            entry["fetched_at"] = time.time()
+            self._store(url, entry)
+            return entry["body"]
+
+        response.raise_for_status()
+        self._count("misses")
+        self._store(url, {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": response.text
+        })
+        return response.text
+
+    def memoize(self, key, producer):
+        """
+        Returns the cached value of key, calling producer() to compute it when missing or expired.
+        The value must be JSON serializable (used for YouTube transcripts).
+        """
+        entry = self._load(key)
+        if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+            self._count("hits")
+            return entry["body"]
+        self._count("misses")
+        value = producer()
+        self._store(key, {"url": key, "fetched_at": time.time(), "body": value})
+        return value